@@ -1,213 +1,303 @@
 # Блок 1: Імпорт бібліотек
 import streamlit as st
 import pandas as pd
-import googlemaps
-from ortools.constraint_solver import routing_enums_pb2
-from ortools.constraint_solver import pywrapcp
-import folium
-from streamlit_folium import st_folium
 import time
-import polyline
+import os
+import json
 import database as db
+import decomposition
+import engine
+import exports
+import instrumentation
+import location_matrix
+import planner
+import request_store
+import route_maps
+import routing
+import streamlit.components.v1 as components
 from datetime import time as dt_time, datetime, timedelta
-from io import BytesIO
+# googlemaps, folium, polyline та OR-Tools (через jobs) імпортуються лише там, де потрібні:
+# перезапуск скрипта для вкладок історії чи автопарку їх не завантажує
 
 
-# Блок 2: Функції для розрахунків та роботи з API (зміни тільки в get_solution_routes)
-def get_api_data(api_key, locations_df, use_traffic):
-    """Отримує дані з Google Maps API, враховуючи опцію трафіку."""
+# Блок 2: Рушії відстаней, підготовка плану, експорт і карти рейсів
+@st.cache_resource
+def get_location_matrix():
+    return location_matrix.LocationMatrix()
+
+
+@st.cache_resource(show_spinner="Завантаження дорожнього графа...")
+def load_road_graph(path):
+    return routing.RoadGraph.load(path)
+
+
+def make_provider(engine_name, api_key, detour_factor, speed_kmh):
+    """Постачальник маршрутизації за вибором у бічній панелі; None (з повідомленням), якщо створити не вдалося.
+
+    Локальні рушії геокодують нові адреси через Google, якщо ключ налаштовано.
+    """
     try:
-        gmaps = googlemaps.Client(key=api_key)
+        road_graph = load_road_graph(road_graph_path) if engine_name == 'road_graph' else None
+        return routing.make_provider(engine_name, api_key, detour_factor, speed_kmh, road_graph=road_graph,
+                                     location_matrix=get_location_matrix())
     except Exception as e:
-        st.error(f"Помилка ініціалізації клієнта Google Maps: {e}"); return None, None, None, None
-
-    with st.spinner("Отримання координат..."):
-        coords, addresses = [], locations_df['address'].tolist()
-        for address in addresses:
-            try:
-                geocode_result = gmaps.geocode(address)
-                if not geocode_result: st.error(
-                    f"Не вдалося знайти координати: {address}"); return None, None, None, None
-                location = geocode_result[0]['geometry']['location']
-                coords.append((location['lat'], location['lng']));
-                time.sleep(0.05)
-            except Exception as e:
-                st.error(f"Помилка геокодування '{address}': {e}"); return None, None, None, None
-    locations_df['lat'], locations_df['lon'] = [c[0] for c in coords], [c[1] for c in coords]
-
-    with st.spinner("Розрахунок матриць відстаней та часу..."):
+        st.error(f"Не вдалося підготувати рушій відстаней: {e}"); return None
+
+
+def prepare_plan(provider, requests, vehicles_for_run, settings, trace):
+    """План рейсу з рушія (None з повідомленням про помилку) та підпис про джерело матриці."""
+    with st.spinner("Геокодування та розрахунок матриць відстаней і часу..."):
         try:
-            departure_time = 'now' if use_traffic else None
-            matrix_result = gmaps.distance_matrix(origins=coords, destinations=coords, mode="driving",
-                                                  departure_time=departure_time)
-        except Exception as e:
-            st.error(f"Помилка отримання матриці: {e}"); return None, None, None, None
-
-    distance_matrix, duration_matrix = [], []
-    for row in matrix_result['rows']:
-        dist_row, dur_row = [], []
-        for element in row['elements']:
-            dist_row.append(element['distance']['value'] if element['status'] == 'OK' else 9999999)
-            duration_key = 'duration_in_traffic' if 'duration_in_traffic' in element else 'duration'
-            dur_row.append(element[duration_key]['value'] if element['status'] == 'OK' else 9999999)
-        distance_matrix.append(dist_row);
-        duration_matrix.append(dur_row)
-
-    return gmaps, locations_df, distance_matrix, duration_matrix
-
-
-def create_data_model(locations_df, vehicles_df, distance_matrix, duration_matrix, service_time_seconds,
-                      depot_working_hours):
-    """Створює словник з даними для розв'язувача OR-Tools."""
-    demands = [row['weight'] for _, row in locations_df.iterrows()]
-    demands[0] = 0
-
-    data = {
-        'distance_matrix': distance_matrix, 'duration_matrix': duration_matrix,
-        'demands': demands, 'vehicle_capacities': vehicles_df['capacity'].tolist(),
-        'num_vehicles': len(vehicles_df), 'depot': 0,
-        'location_names': locations_df['name'].tolist(),
-        'vehicle_names': vehicles_df['name'].tolist(),
-        'vehicle_fuel_consumptions': vehicles_df['fuel_consumption'].tolist(),
-        'service_time': service_time_seconds
-    }
-    time_windows = []
-    for _, row in locations_df.iterrows():
-        start, end = (t.hour * 3600 + t.minute * 60 for t in (row['time_from'], row['time_to']))
-        time_windows.append((start, end))
-    depot_start, depot_end = (t.hour * 3600 + t.minute * 60 for t in depot_working_hours)
-    time_windows[0] = (depot_start, depot_end)
-    data['time_windows'] = time_windows
-    return data
-
-
-def to_excel(df):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Report')
-    processed_data = output.getvalue()
-    return processed_data
-
-
-# ==== ОНОВЛЕНА ФУНКЦІЯ ДЛЯ ПРАВИЛЬНОГО ПІДРАХУНКУ ВІДСТАНІ ====
-def get_solution_routes(data, manager, routing, solution, time_dimension):
-    routes_output, routes_data = "", []
-    total_dist_actual, active_vehicles = 0, 0
-
-    for vehicle_id in range(data['num_vehicles']):
-        index = routing.Start(vehicle_id)
-        if routing.IsEnd(solution.Value(routing.NextVar(index))): continue
-
-        active_vehicles += 1
-        route_distance, route_load, route_nodes_info = 0, 0, []
-
-        while not routing.IsEnd(index):
-            node_idx, prev_idx = manager.IndexToNode(index), index
-            route_load += data['demands'][node_idx]
-            arrival_seconds = solution.Min(time_dimension.CumulVar(index))
-            arrival_time = str(timedelta(seconds=int(arrival_seconds)))
-            route_nodes_info.append(f"{data['location_names'][node_idx]} (приб. о {arrival_time})")
-            index = solution.Value(routing.NextVar(index))
-            # Підсумовуємо реальну відстань з матриці, а не "вартість" з оптимізатора
-            route_distance += data['distance_matrix'][manager.IndexToNode(prev_idx)][manager.IndexToNode(index)]
-
-        # Додаємо останній сегмент до депо
-        last_node_idx = manager.IndexToNode(routing.Start(vehicle_id))
-        index_end = solution.Value(routing.NextVar(routing.Start(vehicle_id)))
-        while not routing.IsEnd(index_end):
-            prev_idx = index_end
-            index_end = solution.Value(routing.NextVar(index_end))
-        route_distance += data['distance_matrix'][manager.IndexToNode(prev_idx)][last_node_idx]
-
-        total_dist_actual += route_distance
-        arrival_seconds = solution.Min(time_dimension.CumulVar(index))
-        arrival_time = str(timedelta(seconds=int(arrival_seconds)))
-        route_nodes_info.append(f"{data['location_names'][0]} (пов. о {arrival_time})")
-
-        distance_km = route_distance / 1000.0
-        fuel_spent = (distance_km / 100.0) * data['vehicle_fuel_consumptions'][vehicle_id]
-
-        route_text = ' -> '.join(route_nodes_info)
-        routes_output += f"🚐 **{data['vehicle_names'][vehicle_id]}** ({data['vehicle_capacities'][vehicle_id]}кг):\n"
-        routes_output += f"   - Маршрут: **{route_text}**\n"
-        routes_output += f"   - Відстань: **{distance_km:.2f} км**\n"
-        routes_output += f"   - Завантаження: **{route_load} кг**\n"
-        routes_output += f"   - Паливо: **{fuel_spent:.2f} л**\n\n"
-
-        routes_data.append({'vehicle_name': data['vehicle_names'][vehicle_id],
-                            'vehicle_capacity': data['vehicle_capacities'][vehicle_id], 'route_text': route_text,
-                            'distance_km': distance_km, 'load': route_load, 'fuel_spent': fuel_spent})
-
-    final_report = f"🎯 **Задіяно автомобілів: {active_vehicles}**\n"
-    final_report += f"🛣️ **Загальний пробіг: {total_dist_actual / 1000:.2f} км**\n\n" + routes_output
-
-    return final_report, routes_data, total_dist_actual / 1000
-
-
-def create_solution_map(gmaps_client, locations_df, data, manager, routing, solution):
-    depot_coords = (locations_df.iloc[0]['lat'], locations_df.iloc[0]['lon'])
-    route_map = folium.Map(location=depot_coords, zoom_start=12, tiles="cartodbpositron")
-
-    marker_group = folium.FeatureGroup(name="Всі точки").add_to(route_map)
-    for _, location in locations_df.iterrows():
-        is_depot = location['id'] == 0
-        marker_color = 'red' if is_depot else ('green' if location['type'] == 'Доставка' else 'orange')
-        marker_icon = 'home' if is_depot else ('arrow-down' if location['type'] == 'Доставка' else 'arrow-up')
-
-        folium.Marker(
-            location=(location['lat'], location['lon']),
-            popup=f"<b>{location['name']}</b><br>Вага: {location['weight']}кг<br>Тип: {location['type']}",
-            tooltip=location['name'],
-            icon=folium.Icon(color=marker_color, icon=marker_icon, prefix='fa')
-        ).add_to(marker_group)
-
-    colors = ['blue', 'purple', 'darkred', 'cadetblue', 'darkgreen', 'pink']
-
-    for vehicle_id in range(data['num_vehicles']):
-        index = routing.Start(vehicle_id)
-        if routing.IsEnd(solution.Value(routing.NextVar(index))): continue
-
-        vehicle_name = data["vehicle_names"][vehicle_id]
-        vehicle_layer = folium.FeatureGroup(name=f"Маршрут: {vehicle_name}", show=True).add_to(route_map)
-
-        waypoints = [locations_df.iloc[manager.IndexToNode(routing.Start(vehicle_id))]['address']]
-        while not routing.IsEnd(index):
-            index = solution.Value(routing.NextVar(index))
-            waypoints.append(locations_df.iloc[manager.IndexToNode(index)]['address'])
-
-        if len(waypoints) > 1:
-            try:
-                directions_result = gmaps_client.directions(origin=waypoints[0], destination=waypoints[-1],
-                                                            waypoints=waypoints[1:-1], mode="driving")
-                points = polyline.decode(directions_result[0]['overview_polyline']['points'])
-                folium.PolyLine(locations=points, color=colors[vehicle_id % len(colors)], weight=5, opacity=0.8,
-                                popup=f'Маршрут {vehicle_name}').add_to(vehicle_layer)
-            except Exception as e:
-                st.warning(f"Не вдалося побудувати детальний маршрут для авто {vehicle_name}: {e}")
-
-    folium.LayerControl().add_to(route_map)
-
-    return route_map
+            plan = engine.prepare_plan(provider, depot_address, requests, vehicles_for_run, settings, trace)
+        except engine.PlanningError as e:
+            st.error(str(e)); return None
+    matrix_stats = plan['matrix_stats']
+    if provider.name == 'google':
+        st.caption(f"Матриця: {matrix_stats['cached_elements']} пар з кешу, {matrix_stats['fetched_elements']} пар "
+                   f"отримано за {matrix_stats['requests']} запит(ів) до API.")
+    else:
+        st.caption(f"Матриця розрахована локально ({ROUTING_ENGINES[provider.name]}).")
+    if 'clusters' in plan:
+        st.caption(f"Рейс розбито на {len(plan['clusters'])} кластер(ів): "
+                   f"{', '.join(str(len(c['nodes'])) for c in plan['clusters'])} заявок.")
+    return plan
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def history_export(history_version, fmt, start_date, end_date, statuses):
+    """Файл історії за фільтром; `history_version` з db скидає кеш після змін рейсів."""
+    return exports.write_export(fmt, db.RUN_EXPORT_COLUMNS,
+                                db.iter_runs(start_date, end_date, statuses, exports.EXPORT_CHUNK_ROWS), 'Runs')
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def fuel_report_export(history_version, fmt, start_date, end_date):
+    columns = ('vehicle_name', 'total_fuel', 'total_distance')
+    return exports.write_export(fmt, columns, [[tuple(r) for r in db.get_fuel_report(start_date, end_date)]], 'Fuel')
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def diagnostics_export(history_version, fmt, latest):
+    """Файл діагностики останніх рейсів; `latest` (run_id, recorded_at) скидає кеш після нового запису."""
+    rows = [{'run_id': d['run_id'], 'run_date': d['run_date'], **instrumentation.flatten(d)}
+            for d in db.get_run_diagnostics()]
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    return exports.write_export(fmt, columns, [[tuple(row.get(column) for column in columns) for row in rows]],
+                                'Diagnostics')
+
+
+def render_export(key, file_stem, build, *params):
+    """Формат і кнопка "Підготувати": файл будується (або береться з кешу) лише після запиту користувача."""
+    formats = exports.available_formats()
+    c1, c2, c3 = st.columns([1, 1, 2])
+    fmt = c1.selectbox("Формат", formats, key=f"{key}_format", label_visibility="collapsed",
+                       format_func=lambda f: exports.EXPORT_FORMATS[f][0])
+    request = (fmt, *params)
+    if c2.button("📦 Підготувати експорт", key=f"{key}_prepare"): st.session_state[key] = request
+    if st.session_state.get(key) == request:
+        with st.spinner("Формування файлу..."):
+            data = build(db.get_history_version(), fmt, *params)
+        c3.download_button(f"📥 Завантажити {exports.EXPORT_FORMATS[fmt][0]}", data, file_name=f"{file_stem}.{fmt}",
+                           mime=exports.EXPORT_FORMATS[fmt][1], key=f"{key}_download")
+
+
+def save_solution_geometry(provider, locations_df, routes_data, run_id, trace=instrumentation.NULL_TRACE):
+    """Отримує дорожню геометрію маршрутів від постачальника та зберігає її з координатами зупинок рейсу."""
+    coords = list(zip(locations_df['lat'].tolist(), locations_df['lon'].tolist()))
+    routes_coords = [[coords[node] for node in route['nodes']] for route in routes_data]
+    with st.spinner("Побудова маршрутів на карті..."):
+        paths, errors, directions_stats = provider.directions(routes_coords)
+    trace.count('directions_api_calls', directions_stats['requests'])
+    for r, error in errors.items():
+        st.warning(f"Не вдалося побудувати детальний маршрут для авто {routes_data[r]['vehicle_name']}: {error}")
+    # Без дорожньої геометрії маршрут малюється прямими між зупинками
+    db.save_route_geometries(run_id, {route['vehicle_name']: (route_maps.encode(path or stops), route_maps.encode(stops))
+                                      for route, path, stops in zip(routes_data, paths, routes_coords)})
+    run_map_html.clear()
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def run_map_html(run_id):
+    """HTML карти збереженого рейсу лише з даних бази (без запитів до API); None, якщо геометрії немає."""
+    geometries = db.get_route_geometries(run_id)
+    if not geometries: return None
+    requests, routes = db.get_run_details(run_id)
+    route_stops = db.get_route_stops(run_id)
+    layers, markers, seen = [], [], set()
+    for color_index, route in enumerate(routes):
+        if route['id'] not in geometries: continue
+        geometry = geometries[route['id']]
+        layers.append({'vehicle_name': route['vehicle_name'], 'color_index': color_index,
+                       'path': route_maps.decode(geometry['path'])})
+        # Вузол 0 — депо, вузол k — k-та заявка рейсу
+        for stop, (lat, lon) in zip(route_stops.get(route['id'], []), route_maps.decode(geometry['stops'])):
+            if stop['node'] in seen or stop['node'] > len(requests): continue
+            seen.add(stop['node'])
+            if stop['node'] == 0:
+                markers.append({'lat': lat, 'lon': lon, 'name': stop['name'], 'popup': f"<b>{stop['name']}</b>",
+                                'kind': 'depot'})
+            else:
+                req = requests[stop['node'] - 1]
+                markers.append({'lat': lat, 'lon': lon, 'name': req['name'], 'kind': req['request_type'],
+                                'popup': f"<b>{req['name']}</b><br>Вага: {req['weight']}кг<br>Тип: {req['request_type']}"})
+    return route_maps.render_map_html(layers, markers)
+
+
+def render_run_map(run_id):
+    html = run_map_html(run_id)
+    if html is None: st.caption("Для цього рейсу карта не збережена.")
+    else: components.html(html, height=500)
+
+
+def calibrate_offline_engine():
+    """Підставляє у поля бічної панелі коефіцієнти, відкалібровані за кешем матриці Google."""
+    calibration = routing.calibrate(db.get_cached_distance_samples(routing.CALIBRATION_SAMPLE_LIMIT))
+    if calibration is None:
+        st.session_state.calibration_note = "У кеші ще немає відстаней від Google для калібрування."; return
+    st.session_state.detour_factor = min(max(calibration['detour_factor'], 1.0), 3.0)
+    st.session_state.speed_kmh = min(max(calibration['speed_kmh'], 5.0), 120.0)
+    st.session_state.calibration_note = f"Відкалібровано за {calibration['pairs']} парами з кешу."
+
+
+def render_fleet_calendar(vehicles, days, occupancy, status_date, vehicle_filter=''):
+    """Календар зайнятості: одна таблиця авто×день замість рядка на кожне авто."""
+    if not vehicles:
+        st.info("Автопарк порожній."); return
+    busy_today = occupancy[:, days.index(status_date)] > 0
+    c1, c2 = st.columns(2)
+    c1.metric(f"Вільні на {status_date.strftime('%d.%m.%Y')}", int((~busy_today).sum()))
+    c2.metric("Зайняті", int(busy_today.sum()))
+    names = pd.Index([v['name'] for v in vehicles], name="Авто")
+    shown = names.str.contains(vehicle_filter, case=False, regex=False) if vehicle_filter else slice(None)
+    columns = [f"{CALENDAR_WEEKDAYS[day.weekday()]} {day.strftime('%d.%m')}" for day in days]
+    calendar = pd.DataFrame(occupancy[shown] > 0, index=names[shown], columns=columns).replace({True: "🔴", False: "🟢"})
+    calendar.loc["Вільних авто"] = (occupancy == 0).sum(axis=0).astype(str)
+    st.dataframe(calendar, use_container_width=True, height=min(38 + 35 * len(calendar), 600))
+
+
+def set_requests(store):
+    """Замінює сховище заявок сесії; нова версія скидає редактор, щоб його правки не лягли на інші дані."""
+    st.session_state.requests = store
+    st.session_state.requests_version = st.session_state.get('requests_version', 0) + 1
+
+
+def warm_start_routes(locations_df, vehicles_for_run):
+    """Маршрути рейсу, що редагується, у вузлах нової моделі (або None для розрахунку з нуля).
+
+    Заявки, яких більше немає, пропускаються; нові заявки розв'язувач вставить сам.
+    """
+    previous = st.session_state.get('warm_start_routes')
+    if not previous: return None
+    node_of = {req_id: node for node, req_id in enumerate(locations_df['id'].tolist()) if node > 0}
+    routes = [[node_of[req_id] for req_id in previous.get(v['name'], []) if req_id in node_of] for v in vehicles_for_run]
+    return routes if any(routes) else None
+
+
+ROUTING_ENGINES = {'google': "Google Maps", 'haversine': "Офлайн (гаверсинус)", 'road_graph': "Дорожній граф (OSM)"}
+CALENDAR_WEEKDAYS = ('Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Нд')
+CALENDAR_MAX_WEEKS = 26
+RERUN_BUDGET_MS = 100
+HISTORY_COLUMNS = {'run_date': "Дата", 'status': "Статус", 'total_distance': "Відстань, км",
+                   'total_fuel_spent': "Паливо, л"}
+FLEET_COLUMNS = {'name': "Назва/номер", 'capacity': "Вантажопідйомність, кг", 'fuel_consumption': "Витрата, л/100км"}
+PORTFOLIO_STOP_REASONS = {'time_limit': 'ліміт часу', 'agreement': 'стратегії зійшлися',
+                          'plateau': 'немає покращень', 'cancelled': 'скасовано'}
+
+
+@st.cache_resource
+def get_job_manager():
+    """Один пул розрахунків на процес, спільний для всіх сесій."""
+    import jobs
+    return jobs.JobManager()
+
+
+def render_plan_jobs():
+    """Показує прогрес фонових розрахунків цієї сесії; опитується кожну секунду, поки є активні."""
+    manager = get_job_manager()
+    for job_id in list(st.session_state.plan_jobs):
+        job = manager.snapshot(job_id)
+        if job is None:
+            st.session_state.plan_jobs.remove(job_id); continue
+        with st.container(border=True):
+            if job['state'] in ('queued', 'running'):
+                if job['state'] == 'queued':
+                    label = f"Розрахунок №{job_id}: очікує вільного процесу..."
+                else:
+                    best = f"{job['best_objective']:,}" if job['best_objective'] is not None else "—"
+                    label = (f"Розрахунок №{job_id}: {job['elapsed']:.0f} з {job['time_limit']} с, "
+                             f"знайдено рішень: {job['solutions']}, найкраща ціль: {best}")
+                st.progress(min(job['elapsed'] / job['time_limit'], 1.0), text=label)
+                if st.button("⏹️ Скасувати", key=f"cancel_job_{job_id}"): manager.cancel(job_id)
+                continue
+
+            if job_id not in st.session_state.finished_jobs:
+                # Перший показ завершеної задачі: оновлюємо весь додаток (історію, статус автопарку)
+                st.session_state.finished_jobs.add(job_id)
+                if job['state'] == 'done': set_requests(request_store.empty())
+                st.rerun(scope="app")
+            if job['state'] == 'done':
+                st.success(f"Рейс №{job['run_id']} успішно розраховано та збережено!")
+                if job['result'].get('warm_start'):
+                    st.caption(f"Перераховано від попереднього плану за {job['elapsed']:.1f} с.")
+                if 'decomposition' in job['result']:
+                    clusters = job['result']['decomposition']['clusters']
+                    st.caption(f"Розраховано {len(clusters)} кластерами паралельно за {job['elapsed']:.1f} с.")
+                if 'portfolio' in job['result']:
+                    report = job['result']['portfolio']
+                    st.caption(f"Переможець портфеля: **{report['winner']}** "
+                               f"(зупинка: {PORTFOLIO_STOP_REASONS[report['stop_reason']]}, {report['elapsed_seconds']:.1f} с)")
+                    st.dataframe(pd.DataFrame(report['members'])[['strategy', 'objective', 'solutions',
+                                                                  'first_solution_seconds', 'is_winner']],
+                                 use_container_width=True)
+                st.markdown(job['result']['solution_text'])
+                st.subheader("Карта маршрутів:")
+                # Геометрія запитується один раз на задачу; далі карта береться з кешу за id рейсу
+                if job_id not in st.session_state.job_maps:
+                    trace = job['context'].get('trace', instrumentation.NULL_TRACE)
+                    with trace.span('route_map'):
+                        save_solution_geometry(job['context']['provider'], job['context']['locations_df'],
+                                               job['result']['routes_data'], job['run_id'], trace)
+                    diagnostics = trace.to_dict()
+                    if diagnostics is not None: db.save_run_diagnostics(job['run_id'], diagnostics)
+                    st.session_state.job_maps[job_id] = job['run_id']
+                render_run_map(job['run_id'])
+            elif job['state'] == 'no_solution':
+                st.error(
+                    "Не вдалося знайти рішення. Спробуйте змінити економічні параметри, додати більше авто або збільшити часові вікна.")
+            elif job['state'] == 'cancelled':
+                st.info(f"Розрахунок №{job_id} скасовано.")
+            else:
+                st.error(f"Помилка розрахунку №{job_id}: {job['error']}")
+            if st.button("Закрити", key=f"close_job_{job_id}"):
+                manager.forget(job_id)
+                st.session_state.plan_jobs.remove(job_id)
+                st.session_state.job_maps.pop(job_id, None)
+                st.rerun(scope="app")
 
 
 # Блок 3: Код веб-додатку Streamlit
+rerun_started = time.perf_counter()
 st.set_page_config(page_title="TMS Pro", layout="wide", initial_sidebar_state="auto")
 st.title("Система Управління Транспортом (TMS Pro)")
 db.init_db()
 
-if 'requests' not in st.session_state: st.session_state.requests = []
+if 'requests' not in st.session_state: set_requests(request_store.empty())
+if 'requests_page' not in st.session_state: st.session_state.requests_page = 0
+if 'plan_jobs' not in st.session_state: st.session_state.plan_jobs = []
+if 'finished_jobs' not in st.session_state: st.session_state.finished_jobs = set()
+if 'job_maps' not in st.session_state: st.session_state.job_maps = {}
 if 'active_tab' not in st.session_state: st.session_state.active_tab = "🗓️ **Планування Рейсу**"
 if st.session_state.get('edit_run_id'):
     run_id_to_edit = st.session_state.edit_run_id
     requests, routes = db.get_run_details(run_id_to_edit)
-    st.session_state.requests = []
-    for i, req in enumerate(requests):
-        st.session_state.requests.append(
-            {"id": i + 1, "name": req['name'], "address": req['address'], "type": req['request_type'],
-             "weight": req['weight'], "time_from": dt_time.fromisoformat(
-                '0' + req['time_from'] if len(req['time_from']) < 5 else req['time_from']),
-             "time_to": dt_time.fromisoformat('0' + req['time_to'] if len(req['time_to']) < 5 else req['time_to'])})
+    set_requests(request_store.from_records(
+        {"name": req['name'], "address": req['address'], "type": req['request_type'], "weight": req['weight'],
+         "time_from": req['time_from'], "time_to": req['time_to']} for req in requests))
+    st.session_state.requests_page = 0
     st.session_state.vehicles_to_edit = [r['vehicle_name'] for r in routes]
+    # Номери вузлів у збережених маршрутах збігаються з id заявок, присвоєними вище (1, 2, ...)
+    st.session_state.warm_start_routes = {r['vehicle_name']: json.loads(r['route_nodes']) for r in routes
+                                          if r.get('route_nodes')}
     db.delete_run(run_id_to_edit)
     del st.session_state.edit_run_id
     st.session_state.active_tab = "🗓️ **Планування Рейсу**"
@@ -217,18 +307,43 @@ if st.session_state.get('edit_run_id'):
 st.sidebar.header("⚙️ Глобальні налаштування")
 # Отримуємо API ключ із секретів Streamlit
 api_key = st.secrets.get("GOOGLE_MAPS_API_KEY")
+road_graph_path = st.secrets.get("ROAD_GRAPH_PATH") or os.environ.get("ROAD_GRAPH_PATH")
 
 if not api_key:
-    st.sidebar.error("API ключ Google Maps не налаштовано в секретах!")
-    st.stop() # Зупиняємо виконання, якщо ключа немає
+    # Без ключа планування працює офлайн лише для адрес, які вже є в кеші геокодування
+    st.sidebar.warning("API ключ Google Maps не налаштовано в секретах: доступні лише локальні рушії відстаней.")
 else:
     # Правильний відступ для рядка нижче:
     st.sidebar.text_input("🔑 Google Maps API ключ", type="password", value="********", disabled=True, help="Ключ налаштовано в секретах Streamlit Cloud.")
+engine_options = [engine for engine in ROUTING_ENGINES if (engine != 'google' or api_key)
+                  and (engine != 'road_graph' or (road_graph_path and os.path.exists(road_graph_path)))]
+routing_engine = st.sidebar.selectbox("Рушій відстаней", engine_options, format_func=ROUTING_ENGINES.get,
+                                      help="Локальні рушії рахують матриці за мілісекунди без запитів до API — "
+                                           "для чорнових планів; Google Maps — для остаточного підтвердження.")
+detour_factor, speed_kmh = routing.DEFAULT_DETOUR_FACTOR, routing.DEFAULT_SPEED_KMH
+if routing_engine == 'haversine':
+    c1, c2 = st.sidebar.columns(2)
+    detour_factor = c1.number_input("Коеф. об'їзду", min_value=1.0, max_value=3.0, value=routing.DEFAULT_DETOUR_FACTOR,
+                                    step=0.05, key="detour_factor")
+    speed_kmh = c2.number_input("Швидкість (км/год)", min_value=5.0, max_value=120.0, value=routing.DEFAULT_SPEED_KMH,
+                                step=1.0, key="speed_kmh")
+    st.sidebar.button("🎯 Калібрувати за кешем Google", on_click=calibrate_offline_engine,
+                      help="Підбирає коефіцієнт об'їзду та швидкість за вже отриманими від Google відстанями.")
+    if 'calibration_note' in st.session_state: st.sidebar.caption(st.session_state.calibration_note)
 st.sidebar.markdown("---")
 st.sidebar.subheader("Параметри оптимізації")
 service_time_minutes = st.sidebar.number_input("Час на обслуговування (хв)", min_value=0, value=20)
 working_hours = st.sidebar.slider("Робочі години автопарку", value=(dt_time(8, 0), dt_time(18, 0)),
                                   step=timedelta(minutes=30))
+portfolio_size = st.sidebar.number_input("Паралельних стратегій (портфель)", min_value=1, max_value=os.cpu_count() or 1,
+                                         value=1, help="Понад 1 — модель розв'язується одночасно кількома стратегіями "
+                                                       "пошуку на різних ядрах, обирається найкращий результат.")
+use_decomposition = st.sidebar.toggle("Декомпозиція великих днів", value=True,
+                                      help=f"Від {decomposition.DECOMPOSITION_MIN_STOPS} заявок рейс розбивається на "
+                                           "географічні кластери, що розв'язуються паралельно.")
+instrument = st.sidebar.toggle("Діагностика розрахунку", value=True,
+                               help="Зберігає тривалість кожного етапу, кількість запитів до API та статистику "
+                                    "розв'язувача для вкладки діагностики.")
 st.sidebar.subheader("Економічні параметри")
 base_vehicle_cost = st.sidebar.number_input("Базова вартість залучення авто (в км)", min_value=0, value=20, step=5,
                                             help="Фіксований 'штраф' за використання будь-якого авто.")
@@ -236,8 +351,9 @@ capacity_cost_coefficient = st.sidebar.number_input("Коефіцієнт вар
                                                     value=2.0, step=0.1, format="%.1f",
                                                     help="Додатковий 'штраф' за кожні 1000 кг вантажопідйомності. Наприклад, 2.0 означає +2 км вартості за кожну тонну.")
 
-tab1, tab2, tab3, tab4 = st.tabs(
-    ["🗓️ **Планування Рейсу**", "📊 **Історія Рейсів**", "🚛 **Статус Автопарку**", "⛽ **Звіт по Паливу**"])
+tab1, tab2, tab3, tab4, tab5 = st.tabs(
+    ["🗓️ **Планування Рейсу**", "📊 **Історія Рейсів**", "🚛 **Статус Автопарку**", "⛽ **Звіт по Паливу**",
+     "🩺 **Діагностика**"])
 
 with tab1:
     st.header("Планування нового рейсу")
@@ -251,7 +367,7 @@ with tab1:
     with col1:
         st.subheader("Заявки на доставку та забір")
         if st.button("🧪 Заповнити тестовими даними"):
-            st.session_state.requests = [
+            set_requests(request_store.from_records([
                 {'id': 1, 'name': 'Епіцентр К', 'address': 'м. Київ, вул. Полярна, 20Д', 'type': 'Доставка',
                  'weight': 1200, 'time_from': dt_time(9, 0), 'time_to': dt_time(12, 0)},
                 {'id': 2, 'name': 'Склад \'Розетка\'', 'address': 'м. Київ, проспект Степана Бандери, 34В',
@@ -263,7 +379,9 @@ with tab1:
                 {'id': 5, 'name': 'Повернення (Arena City)', 'address': 'м. Київ, вул. Велика Васильківська, 1-3/2',
                  'type': 'Забір', 'weight': 300, 'time_from': dt_time(14, 0), 'time_to': dt_time(16, 0)},
                 {'id': 6, 'name': 'Нова Пошта №1', 'address': 'м. Київ, Столичне шосе, 103', 'type': 'Доставка',
-                 'weight': 700, 'time_from': dt_time(13, 0), 'time_to': dt_time(18, 0)}]
+                 'weight': 700, 'time_from': dt_time(13, 0), 'time_to': dt_time(18, 0)}]))
+            st.session_state.requests_page = 0
+            st.session_state.pop('warm_start_routes', None)
             st.rerun()
 
         with st.form("request_form", clear_on_submit=True):
@@ -274,27 +392,108 @@ with tab1:
             req_weight = c1f.number_input("Вага (кг)", min_value=1, step=1)
             req_time_window = c2f.slider("Часове вікно", value=(dt_time(9, 0), dt_time(17, 0)))
             if st.form_submit_button("➕ Додати заявку"):
-                new_id = max([req['id'] for req in st.session_state.requests] + [0]) + 1
-                st.session_state.requests.append(
-                    {"id": new_id, "name": req_name, "address": req_address, "type": req_type, "weight": req_weight,
-                     "time_from": req_time_window[0], "time_to": req_time_window[1]})
-                st.rerun()
-        if st.session_state.requests:
-            st.write("Поточний список заявок:");
-            st.session_state.requests = st.data_editor(pd.DataFrame(st.session_state.requests), num_rows="dynamic",
-                                                       use_container_width=True).to_dict('records')
+                new_request, errors = request_store.normalize(pd.DataFrame([
+                    {"name": req_name, "address": req_address, "type": req_type, "weight": req_weight,
+                     "time_from": req_time_window[0], "time_to": req_time_window[1]}]))
+                if errors:
+                    st.error(f"Заявку не додано: {errors[0][1]}.")
+                else:
+                    set_requests(request_store.append(st.session_state.requests, new_request))
+                    st.rerun()
+
+        with st.expander("📂 Імпорт заявок з файлу (CSV/XLSX)"):
+            uploaded = st.file_uploader("Файл заявок", type=['csv', 'xlsx'],
+                                        help="Колонки: назва, адреса, тип, вага, від, до (або name, address, type, "
+                                             "weight, time_from, time_to). Тип і час необов'язкові.")
+            if uploaded is not None and st.button("📥 Імпортувати заявки"):
+                with st.spinner("Імпорт заявок..."):
+                    import_status = st.empty()
+                    imported, errors = request_store.import_file(
+                        uploaded.getvalue(), uploaded.name,
+                        on_chunk=lambda rows: import_status.caption(f"Оброблено рядків: {rows}"))
+                    import_status.empty()
+                set_requests(request_store.append(st.session_state.requests, imported))
+                st.success(f"Імпортовано заявок: {len(imported)}.")
+                if errors:
+                    st.warning(f"Пропущено рядків з помилками: {len(errors)}.")
+                    st.dataframe(pd.DataFrame(errors[:request_store.MAX_REPORTED_ERRORS], columns=['Рядок', 'Помилка']),
+                                 hide_index=True, use_container_width=True)
+
+        with st.expander("📍 Постійні адреси"):
+            st.caption("Відстані між постійними адресами та депо розраховуються заздалегідь і не запитуються "
+                       "при плануванні (без урахування трафіку).")
+            with st.form("location_form", clear_on_submit=True):
+                c1f, c2f = st.columns(2)
+                loc_name, loc_address = c1f.text_input("Назва"), c2f.text_input("Адреса")
+                add_location = st.form_submit_button("➕ Додати постійну адресу")
+            if add_location and loc_address: db.add_location_to_db(loc_name or loc_address, loc_address)
+            saved_locations = db.get_saved_locations()
+            matrix_store = get_location_matrix()
+            st.write(f"Збережено адрес: {len(saved_locations)}, у матриці точок: {len(matrix_store)}.")
+            if (add_location or st.button("🔄 Оновити матрицю відстаней")) and saved_locations:
+                provider = make_provider('google', api_key, detour_factor, speed_kmh) if api_key else None
+                if provider is None:
+                    st.warning("Для розрахунку матриці потрібен API ключ Google Maps.")
+                else:
+                    with st.spinner("Оновлення матриці постійних адрес..."):
+                        try:
+                            refresh_stats = matrix_store.refresh(
+                                provider, [depot_address] + [row['address'] for row in saved_locations])
+                        except Exception as e:
+                            st.error(f"Не вдалося оновити матрицю: {e}")
+                        else:
+                            st.success(f"Нових точок: {refresh_stats['added']}, отримано пар: "
+                                       f"{refresh_stats['fetched_elements']} за {refresh_stats['requests']} запит(ів).")
+
+        if len(st.session_state.requests):
+            store = st.session_state.requests
+            pages = request_store.page_count(store)
+            page = st.session_state.requests_page = min(st.session_state.requests_page, pages - 1)
+            st.write(f"Поточний список заявок ({len(store)}):")
+            page_df = request_store.get_page(store, page)
+            # Редактор бачить лише поточну сторінку; ключ з версією сховища прив'язує його правки до цих даних
+            editor_key = f"requests_editor_{st.session_state.requests_version}_{page}"
+            edited = st.data_editor(page_df, key=editor_key, num_rows="dynamic", use_container_width=True,
+                                    hide_index=True,
+                                    column_config={
+                                        'id': st.column_config.NumberColumn(disabled=True),
+                                        'type': st.column_config.SelectboxColumn(options=request_store.REQUEST_TYPES),
+                                        'weight': st.column_config.NumberColumn(min_value=1, step=1),
+                                        'time_from': st.column_config.TextColumn(validate=r"^\d{1,2}[:.]\d{2}$"),
+                                        'time_to': st.column_config.TextColumn(validate=r"^\d{1,2}[:.]\d{2}$")})
+            # Сторінка зливається у сховище лише тоді, коли в редакторі є правки (без порівняння таблиць)
+            # і одразу перемальовує його з новою версією, щоб наступна правка лягла вже на злиті дані.
+            # Доданий рядок до заповнення лишається лише в стані редактора: злиття зі зміною версії
+            # стерло б його ще до введення першого значення
+            changes = st.session_state[editor_key]
+            unfinished = request_store.new_row_errors(edited) if changes.get('added_rows') else []
+            if any(changes.values()) and not unfinished:
+                merged, st.session_state.requests_editor_errors = request_store.replace_page(store, page, edited)
+                set_requests(merged); st.rerun()
+            if unfinished:
+                st.info("Заповніть нові рядки — правки сторінки збережуться разом із ними.")
+                for row, message in unfinished[:request_store.MAX_REPORTED_ERRORS]:
+                    st.caption(f"Рядок {row}: {message}.")
+            for row, message in st.session_state.pop('requests_editor_errors', [])[:request_store.MAX_REPORTED_ERRORS]:
+                st.warning(f"Рядок {row} сторінки не збережено: {message}.")
+            p1, p2, p3, p4 = st.columns([1, 2, 1, 2])
+            if page > 0 and p1.button("⬅️", key="requests_prev"):
+                st.session_state.requests_page -= 1; st.rerun()
+            p2.caption(f"Сторінка {page + 1} з {pages}")
+            if page < pages - 1 and p3.button("➡️", key="requests_next"):
+                st.session_state.requests_page += 1; st.rerun()
+            if p4.button("🗑️ Очистити заявки", key="requests_clear"):
+                set_requests(request_store.empty()); st.session_state.requests_page = 0
+                st.session_state.pop('warm_start_routes', None); st.rerun()
 
     with col2:
         st.subheader("Автомобілі на рейсі")
-        all_vehicles, assigned_vehicles = db.get_saved_vehicles(), db.get_assigned_vehicles_for_date(selected_date)
-        available_vehicles = [v for v in all_vehicles if v['name'] not in assigned_vehicles]
-        default_selection = []
-        if 'vehicles_to_edit' in st.session_state:
-            default_selection = [v['name'] for v in all_vehicles if v['name'] in st.session_state.vehicles_to_edit]
-            vehicles_in_edit_run = [v for v in all_vehicles if v['name'] in st.session_state.vehicles_to_edit]
-            available_vehicles.extend(vehicles_in_edit_run)
-            available_vehicles = [dict(t) for t in {tuple(d.items()) for d in available_vehicles}]
-            del st.session_state.vehicles_to_edit
+        # Обидва запити кешуються в database.py до зміни рейсів чи автопарку (лічильники data_versions у базі);
+        # зайнятість ще раз перевіряється в транзакції збереження рейсу
+        all_vehicles, busy_ids = db.get_saved_vehicles(), db.get_busy_vehicle_ids(selected_date)
+        # Авто рейсу, що редагується, лишаються доступними, хоч і зайняті ним самим
+        default_selection = st.session_state.pop('vehicles_to_edit', [])
+        available_vehicles = [v for v in all_vehicles if v['id'] not in busy_ids or v['name'] in default_selection]
         if not available_vehicles: st.warning(f"На {selected_date.strftime('%d.%m.%Y')} немає вільних авто.")
         vehicle_options = {f"{v['name']} ({v['capacity']}кг, {v['fuel_consumption']:.1f}л/100км)": v for v in
                            available_vehicles}
@@ -306,100 +505,83 @@ with tab1:
     st.markdown("---")
 
     if st.button("🚀 Розрахувати та зберегти рейс", type="primary", use_container_width=True):
-        if not api_key:
-            st.warning("Введіть API ключ в бічній панелі.")
-        elif not st.session_state.requests:
+        if not len(st.session_state.requests):
             st.warning("Додайте хоча б одну заявку.")
         elif not vehicles_for_run:
             st.warning("Виберіть хоча б один автомобіль.")
+        elif (provider := make_provider(routing_engine, api_key, detour_factor, speed_kmh)) is not None:
+            settings = engine.plan_settings(service_time_minutes=service_time_minutes, working_hours=working_hours,
+                                            use_traffic=use_traffic, base_vehicle_cost=base_vehicle_cost,
+                                            capacity_cost_coefficient=capacity_cost_coefficient,
+                                            decompose=use_decomposition)
+            trace = instrumentation.new_trace(instrument)
+            plan = prepare_plan(provider, st.session_state.requests, vehicles_for_run, settings, trace)
+            if plan is not None:
+                # Тепловий старт — лише для розрахунку без декомпозиції
+                initial_routes = None if 'models' in plan else warm_start_routes(plan['locations_df'], vehicles_for_run)
+                job_id = engine.submit_plan(get_job_manager(), plan, selected_date, st.session_state.requests, settings,
+                                            context={'provider': provider, 'locations_df': plan['locations_df'],
+                                                     'trace': trace},
+                                            portfolio_size=portfolio_size, initial_routes=initial_routes)
+                st.session_state.pop('warm_start_routes', None)
+                st.session_state.plan_jobs.append(job_id)
+                st.toast(f"Розрахунок №{job_id} поставлено в чергу.", icon="⏳")
+
+    if st.session_state.plan_jobs:
+        has_active = any((get_job_manager().snapshot(job_id) or {}).get('state') in ('queued', 'running')
+                         for job_id in st.session_state.plan_jobs)
+        st.fragment(run_every=1 if has_active else None)(render_plan_jobs)()
+
+    with st.expander("📊 Статистика стратегій портфеля"):
+        portfolio_stats = db.get_portfolio_win_stats()
+        if portfolio_stats:
+            st.dataframe(pd.DataFrame([dict(r) for r in portfolio_stats]), use_container_width=True)
         else:
-            depot_df = pd.DataFrame([{"id": 0, "name": "Депо", "address": depot_address, "type": "Депо", "weight": 0,
-                                      "time_from": working_hours[0], "time_to": working_hours[1]}])
-            locations_df = pd.concat([depot_df, pd.DataFrame(st.session_state.requests)], ignore_index=True)
-
-            gmaps, locs_upd, dist_matrix, dur_matrix = get_api_data(api_key, locations_df, use_traffic)
-            if locs_upd is not None:
-                with st.spinner('Пошук оптимальних маршрутів...'):
-                    vehicles_df = pd.DataFrame(vehicles_for_run)
-                    data = create_data_model(locs_upd, vehicles_df, dist_matrix, dur_matrix, service_time_minutes * 60,
-                                             working_hours)
-                    manager = pywrapcp.RoutingIndexManager(len(data['distance_matrix']), data['num_vehicles'],
-                                                           data['depot'])
-                    routing = pywrapcp.RoutingModel(manager)
-
-                    for i, vehicle in enumerate(vehicles_for_run):
-                        cost = int(
-                            (base_vehicle_cost + (vehicle['capacity'] / 1000.0) * capacity_cost_coefficient) * 1000)
-                        routing.SetFixedCostOfVehicle(cost, i)
-
-                    dist_cb = routing.RegisterTransitCallback(
-                        lambda f, t: data['distance_matrix'][manager.IndexToNode(f)][manager.IndexToNode(t)])
-                    routing.SetArcCostEvaluatorOfAllVehicles(dist_cb)
-
-
-                    def demand_callback(from_index):
-                        node = manager.IndexToNode(from_index)
-                        return abs(data['demands'][node])
-
-
-                    demand_cb_idx = routing.RegisterUnaryTransitCallback(demand_callback)
-                    routing.AddDimensionWithVehicleCapacity(demand_cb_idx, 0, data['vehicle_capacities'], True,
-                                                            'Capacity')
-
-                    time_cb = routing.RegisterTransitCallback(lambda f, t: int(
-                        data['duration_matrix'][manager.IndexToNode(f)][manager.IndexToNode(t)] + data['service_time']))
-                    routing.AddDimension(time_cb, 3600, 24 * 3600, False, "Time")
-                    time_dim = routing.GetDimensionOrDie("Time")
-                    for loc_idx, time_win in enumerate(data['time_windows']):
-                        if loc_idx != 0: time_dim.CumulVar(manager.NodeToIndex(loc_idx)).SetRange(int(time_win[0]),
-                                                                                                  int(time_win[1]))
-                    for i in range(data['num_vehicles']): time_dim.CumulVar(routing.Start(i)).SetRange(
-                        int(data['time_windows'][0][0]), int(data['time_windows'][0][1]))
-
-                    params = pywrapcp.DefaultRoutingSearchParameters()
-                    params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
-                    params.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
-                    params.time_limit.FromSeconds(20)
-                    solution = routing.SolveWithParameters(params)
-
-                if solution:
-                    st.success("Рейс успішно розраховано та збережено!")
-                    run_id = db.create_run(selected_date)
-                    db.save_requests_for_run(run_id, st.session_state.requests)
-                    solution_text, routes_data, total_dist = get_solution_routes(data, manager, routing, solution,
-                                                                                 time_dim)
-                    st.markdown(solution_text)
-                    st.subheader("Карта маршрутів:")
-                    st_folium(create_solution_map(gmaps, locs_upd, data, manager, routing, solution), width='100%',
-                              height=500, returned_objects=[])
-                    total_fuel = db.save_routes_for_run(run_id, routes_data)
-                    db.update_run_totals(run_id, total_dist, total_fuel)
-                    st.session_state.requests = []
-                    if st.button("Перейти до історії рейсів"): st.rerun()
-                else:
-                    st.error(
-                        "Не вдалося знайти рішення. Спробуйте змінити економічні параметри, додати більше авто або збільшити часові вікна.")
+            st.info("Ще немає рейсів, розрахованих у портфельному режимі.")
 
 # Вкладки "Історія", "Статус" та "Звіт по паливу"
 with tab2:
     st.header("Архів та статуси рейсів")
-    all_runs = db.get_all_runs()
-    if not all_runs:
-        st.info("Історія рейсів порожня.")
+    f1, f2, f3 = st.columns(3)
+    history_from = f1.date_input("Від", value=None, key="history_from")
+    history_to = f2.date_input("До", value=None, key="history_to")
+    history_statuses = tuple(f3.multiselect("Статус", db.RUN_STATUSES, key="history_statuses"))
+    history_filters = (history_from, history_to, history_statuses)
+    if st.session_state.get('history_filters') != history_filters:
+        # Курсори сторінок: None — перша сторінка, далі (run_date, id) останнього рейсу попередньої
+        st.session_state.history_filters, st.session_state.history_cursors = history_filters, [None]
+    runs_page, next_cursor = db.get_runs_page(*history_filters, after=st.session_state.history_cursors[-1])
+    if not runs_page:
+        st.info("Історія рейсів порожня." if not any(history_filters) else "За цими фільтрами рейсів не знайдено.")
     else:
-        df_runs = pd.DataFrame([dict(r) for r in all_runs])
-        st.download_button("📥 Експортувати в Excel", to_excel(df_runs), file_name="runs_history.xlsx")
-        for run in all_runs:
-            with st.expander(
-                    f"**Рейс №{run['id']}** від **{datetime.strptime(run['run_date'], '%Y-%m-%d').strftime('%d.%m.%Y')}** | Статус: **{run['status']}**"):
-                requests, routes = db.get_run_details(run['id'])
+        render_export("history_export", "runs_history", history_export, *history_filters)
+        # Одна таблиця на сторінку; заявки, маршрути та дії малюються лише для вибраного рейсу
+        history_table = st.dataframe(
+            pd.DataFrame(runs_page).set_index('id').rename(columns=HISTORY_COLUMNS), use_container_width=True,
+            on_select="rerun", selection_mode="single-row",
+            key=f"history_table_{hash((history_filters, st.session_state.history_cursors[-1]))}",
+            column_config={HISTORY_COLUMNS['total_distance']: st.column_config.NumberColumn(format="%.1f"),
+                           HISTORY_COLUMNS['total_fuel_spent']: st.column_config.NumberColumn(format="%.2f")})
+        selected_rows = [row for row in history_table.selection.rows if row < len(runs_page)]
+        if not selected_rows:
+            st.caption("Виберіть рейс у таблиці, щоб переглянути заявки, маршрути та дії.")
+        else:
+            run = runs_page[selected_rows[0]]
+            with st.container(border=True):
+                st.markdown(f"**Рейс №{run['id']}** від **{datetime.strptime(run['run_date'], '%Y-%m-%d').strftime('%d.%m.%Y')}** | Статус: **{run['status']}**")
+                details = db.get_runs_details((run['id'],))[run['id']]
+                requests, routes, route_stops = (details[k] for k in ('requests', 'routes', 'stops'))
                 st.subheader("Заявки:");
                 st.dataframe(
                     pd.DataFrame(requests, columns=['name', 'address', 'type', 'weight', 'time_from', 'time_to']),
                     use_container_width=True)
                 st.subheader("Маршрути:")
-                for route in routes: st.markdown(
-                    f"**{route['vehicle_name']}**: {route['route_text']} (Паливо: {route['fuel_spent']:.2f} л)")
+                # Рейси, збережені до появи таблиці зупинок, мають лише готовий текст маршруту
+                st.markdown("\n".join(
+                    f"- **{route['vehicle_name']}**: "
+                    f"{planner.render_route_text(route_stops[route['id']]) if route['id'] in route_stops else route['route_text']}"
+                    f" (Паливо: {route['fuel_spent']:.2f} л)" for route in routes))
+                if route_stops and st.toggle("🗺️ Карта рейсу", key=f"map_{run['id']}"): render_run_map(run['id'])
                 st.markdown("---")
                 if run['status'] == 'Заплановано':
                     c1, c2, c3 = st.columns(3)
@@ -415,16 +597,22 @@ with tab2:
                 elif run['status'] == 'В дорозі':
                     if st.button("✅ Завершити", key=f"end_{run['id']}", type="primary"): db.update_run_status(run['id'],
                                                                                                               "Завершено"); st.rerun()
+        p1, p2, p3 = st.columns([1, 2, 1])
+        if len(st.session_state.history_cursors) > 1 and p1.button("⬅️ Новіші", key="history_prev"):
+            st.session_state.history_cursors.pop(); st.rerun()
+        p2.caption(f"Сторінка {len(st.session_state.history_cursors)}")
+        if next_cursor is not None and p3.button("Старіші ➡️", key="history_next"):
+            st.session_state.history_cursors.append(next_cursor); st.rerun()
 
 with tab3:
     st.header("Огляд зайнятості автопарку")
-    status_date = st.date_input("Оберіть дату", datetime.now(), key="status_date")
-    all_vehicles, assigned_vehicles = db.get_saved_vehicles(), db.get_assigned_vehicles_for_date(status_date)
-    st.subheader(f"Статус на {status_date.strftime('%d.%m.%Y')}:")
-    for vehicle in all_vehicles:
-        status_text = "Зайнятий" if vehicle['name'] in assigned_vehicles else "Вільний"
-        status_icon = "🔴" if vehicle['name'] in assigned_vehicles else "🟢"
-        st.markdown(f"{status_icon} **{vehicle['name']}** - **{status_text}**")
+    c1, c2, c3 = st.columns([1, 1, 2])
+    status_date = c1.date_input("Тиждень з дати", datetime.now(), key="status_date")
+    calendar_weeks = c2.number_input("Тижнів", min_value=1, max_value=CALENDAR_MAX_WEEKS, value=1, key="status_weeks")
+    vehicle_filter = c3.text_input("Пошук авто", key="status_vehicle_filter")
+    week_start = status_date - timedelta(days=status_date.weekday())
+    all_vehicles, days, occupancy = db.get_fleet_occupancy(week_start, week_start + timedelta(weeks=calendar_weeks, days=-1))
+    render_fleet_calendar(all_vehicles, days, occupancy, status_date, vehicle_filter)
 
     with st.expander("⚙️ Керування загальним автопарком"):
         with st.form("vehicle_form_manage", clear_on_submit=True):
@@ -435,11 +623,19 @@ with tab3:
             if st.form_submit_button("➕ Додати до автопарку"):
                 if veh_name and veh_capacity > 0: db.add_vehicle_to_db(veh_name, veh_capacity, veh_fuel); st.rerun()
         st.subheader("Наявний автопарк")
-        for vehicle in all_vehicles:
+        if all_vehicles:
+            # Одна таблиця та один вибір для видалення замінюють рядок із кнопкою на кожне авто
+            st.dataframe(pd.DataFrame(all_vehicles).set_index('id').rename(columns=FLEET_COLUMNS), hide_index=True,
+                         use_container_width=True,
+                         column_config={FLEET_COLUMNS['fuel_consumption']: st.column_config.NumberColumn(format="%.1f")})
+            vehicle_by_id = {vehicle['id']: vehicle for vehicle in all_vehicles}
             c1, c2 = st.columns([4, 1])
-            c1.write(f"**{vehicle['name']}** ({vehicle['capacity']}кг, {vehicle['fuel_consumption']:.1f}л/100км)")
-            if c2.button("❌", key=f"del_main_{vehicle['id']}", help="Видалити"): db.delete_vehicle_from_db(
-                vehicle['id']); st.rerun()
+            vehicles_to_delete = c1.multiselect("Видалити авто", list(vehicle_by_id), label_visibility="collapsed",
+                                                format_func=lambda vehicle_id: vehicle_by_id[vehicle_id]['name'],
+                                                placeholder="Авто для видалення")
+            if c2.button("❌ Видалити", disabled=not vehicles_to_delete, key="fleet_delete"):
+                for vehicle_id in vehicles_to_delete: db.delete_vehicle_from_db(vehicle_id)
+                st.rerun()
 
 with tab4:
     st.header("Звіт по витратах палива")
@@ -454,8 +650,6 @@ with tab4:
             st.info("За обраний період немає даних по завершених рейсах.")
         else:
             report_df = pd.DataFrame(report_data, columns=['vehicle_name', 'total_fuel', 'total_distance'])
-            st.download_button("📥 Експортувати в Excel", to_excel(report_df),
-                               file_name=f"fuel_report_{start_date}_to_{end_date}.xlsx")
             c1, c2 = st.columns(2)
             c1.metric("Загальні витрати палива", f"{report_df['total_fuel'].sum():.2f} л")
             c2.metric("Загальна пройдена відстань", f"{report_df['total_distance'].sum():.2f} км")
@@ -466,4 +660,54 @@ with tab4:
 
             st.bar_chart(report_df.set_index('vehicle_name')[['total_fuel']])
 
+    render_export("fuel_export", f"fuel_report_{start_date}_to_{end_date}", fuel_report_export, start_date, end_date)
 
+    st.subheader("Динаміка витрат")
+    t1, t2 = st.columns([1, 2])
+    trend_period = t1.radio("Групування", ('day', 'week', 'month'), horizontal=True, key="fuel_trend_period",
+                            format_func={'day': "Дні", 'week': "Тижні", 'month': "Місяці"}.get)
+    trend_vehicles = t2.multiselect("Автомобілі", [v['name'] for v in db.get_saved_vehicles()], key="fuel_trend_vehicles")
+    trend = db.get_fuel_trend(start_date, end_date, trend_period, tuple(trend_vehicles))
+    if not trend:
+        st.info("За обраний період немає даних по завершених рейсах.")
+    else:
+        trend_df = pd.DataFrame(trend)
+        st.line_chart(trend_df.pivot(index='period', columns='vehicle_name', values='fuel').fillna(0))
+        totals = trend_df.groupby('vehicle_name')[['fuel', 'distance', 'routes']].sum()
+        totals['l_per_100km'] = (totals['fuel'] / totals['distance'].where(totals['distance'] > 0) * 100).round(2)
+        st.dataframe(totals, use_container_width=True)
+
+
+
+with tab5:
+    st.header("Діагностика розрахунків")
+    st.write("Тривалість етапів, запити до зовнішніх API та статистика розв'язувача для останніх рейсів.")
+    diagnostics = db.get_run_diagnostics()
+    if not diagnostics:
+        st.info("Ще немає рейсів, розрахованих з увімкненою діагностикою.")
+    else:
+        diag_df = pd.DataFrame([{'run_id': d['run_id'], 'run_date': d['run_date'], **instrumentation.flatten(d)}
+                                for d in diagnostics]).set_index('run_id')
+        st.dataframe(diag_df, use_container_width=True)
+        render_export("diagnostics_export", "run_diagnostics", diagnostics_export,
+                      (diagnostics[0]['run_id'], diagnostics[0]['recorded_at']))
+
+        by_run = {d['run_id']: d for d in diagnostics}
+        selected = by_run[st.selectbox("Рейс", list(by_run), key="diagnostics_run",
+                                       format_func=lambda r: f"Рейс №{r} ({by_run[r]['run_date']})")]
+        spans = pd.Series({phase: selected['spans'][phase] for phase in instrumentation.PHASES
+                           if phase in selected['spans']}, name='seconds')
+        c1, c2 = st.columns([2, 1])
+        c1.subheader("Етапи, с")
+        c1.bar_chart(spans)
+        c2.subheader("Лічильники")
+        c2.dataframe(pd.Series(selected['counters'], name='count'), use_container_width=True)
+        progress = selected['solver'].get('objective_progress')
+        if progress:
+            st.subheader("Прогрес цілі розв'язувача")
+            st.line_chart(pd.DataFrame(progress, columns=['seconds', 'objective']).set_index('seconds'))
+
+# Тривалість перезапуску скрипта (без часу браузера): кожна взаємодія має вкладатися в RERUN_BUDGET_MS
+st.session_state.last_rerun_ms = (time.perf_counter() - rerun_started) * 1000
+st.sidebar.caption(f"{'⏱️' if st.session_state.last_rerun_ms <= RERUN_BUDGET_MS else '🐢'} Перезапуск сторінки: "
+                   f"{st.session_state.last_rerun_ms:.0f} мс ({len(st.session_state.requests)} заявок)")
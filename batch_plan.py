@@ -0,0 +1,152 @@
+"""Пакетне планування рейсів без інтерфейсу: багато дат і депо з файлів, у пулі процесів.
+
+Завдання описуються маніфестом JSON:
+
+    {
+      "settings": {"time_limit_seconds": 30, "use_traffic": false},
+      "plans": [
+        {"date": "2025-10-20", "depot": "м. Київ, вул. Пирогівський шлях, 135",
+         "requests": "orders/2025-10-20.csv", "vehicles": ["AA1234BB", "AA5678BB"]},
+        {"date": "2025-10-21", "depot": "м. Київ, вул. Пирогівський шлях, 135", "requests": "orders/2025-10-21.xlsx"}
+      ]
+    }
+
+Шляхи до файлів заявок (CSV/XLSX, як для імпорту в додатку) — відносно маніфесту.
+Без "vehicles" рейс отримує вільні на дату авто автопарку; якщо таких планів на одну
+дату кілька, вільні авто розподіляються між ними порівну. Кожен план геокодується,
+отримує матрицю, розв'язується та зберігається через `database.py` в окремому процесі;
+наприкінці друкується зведення з пропускною здатністю (планів на хвилину).
+
+Запуск: python batch_plan.py plans.json --engine haversine --workers 4
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, time as dt_time
+from pathlib import Path
+
+import database as db
+import engine
+import request_store
+import routing
+from location_matrix import LocationMatrix
+
+
+def load_manifest(path):
+    """Маніфест із розібраними датами, годинами та абсолютними шляхами до файлів заявок."""
+    path = Path(path)
+    manifest = json.loads(path.read_text(encoding='utf-8'))
+    settings = dict(manifest.get('settings', {}))
+    if 'working_hours' in settings:
+        settings['working_hours'] = tuple(dt_time.fromisoformat(t) for t in settings['working_hours'])
+    plans = [{**plan, 'date': date.fromisoformat(plan['date']), 'requests': str(path.parent / plan['requests'])}
+             for plan in manifest['plans']]
+    return engine.plan_settings(**settings), plans
+
+
+def assign_vehicles(plans):
+    """Авто для кожного плану: явно задані за назвою, інакше порівну з вільних на дату.
+
+    ValueError, якщо явно задане авто відсутнє в автопарку, зайняте в базі на дату плану
+    або вказане в кількох планах на одну дату.
+    """
+    fleet = db.get_saved_vehicles()
+    by_name = {vehicle['name']: vehicle for vehicle in fleet}
+    busy_by_day = {day: db.get_busy_vehicle_ids(day) for day in {plan['date'] for plan in plans}}
+    claimed_by_day = {day: {} for day in busy_by_day}
+    assigned = [None] * len(plans)
+    for i, plan in enumerate(plans):
+        if plan.get('vehicles') is not None:
+            missing = [name for name in plan['vehicles'] if name not in by_name]
+            if missing: raise ValueError(f"План {i + 1}: немає авто в автопарку: {', '.join(missing)}")
+            busy = [name for name in plan['vehicles'] if by_name[name]['id'] in busy_by_day[plan['date']]]
+            if busy: raise ValueError(f"План {i + 1}: авто вже зайняті на {plan['date']}: {', '.join(busy)}")
+            claimed = claimed_by_day[plan['date']]
+            taken = [f"{name} (план {claimed[name] + 1})" for name in plan['vehicles'] if name in claimed]
+            if taken: raise ValueError(f"План {i + 1}: авто вже призначені іншому плану на {plan['date']}: {', '.join(taken)}")
+            claimed.update(dict.fromkeys(plan['vehicles'], i))
+            assigned[i] = [by_name[name] for name in plan['vehicles']]
+    for day, busy_ids in busy_by_day.items():
+        busy = busy_ids | {by_name[name]['id'] for name in claimed_by_day[day]}
+        free = sorted((v for v in fleet if v['id'] not in busy), key=lambda v: -v['capacity'])
+        pending = [i for i, plan in enumerate(plans) if plan['date'] == day and assigned[i] is None]
+        for k, i in enumerate(pending): assigned[i] = free[k::len(pending)]
+    return assigned
+
+
+def plan_one(db_path, provider_config, settings, plan, vehicles):
+    """Точка входу процесу-працівника: імпорт заявок, підготовка, розв'язування та збереження одного рейсу."""
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    db.DB_PATH = db_path
+    started = time.perf_counter()
+    summary = {'date': plan['date'].isoformat(), 'depot': plan['depot'], 'requests_file': plan['requests'],
+               'vehicles': len(vehicles), 'run_id': None}
+    try:
+        requests, errors = request_store.import_file(Path(plan['requests']).read_bytes(), plan['requests'])
+        summary.update(requests=len(requests), rejected_rows=len(errors))
+        location_matrix = LocationMatrix() if provider_config.get('api_key') else None
+        provider = routing.make_provider(**provider_config, location_matrix=location_matrix)
+        prepared = engine.prepare_plan(provider, plan['depot'], requests, vehicles, settings)
+        result = engine.solve_plan(prepared, settings['time_limit_seconds'])
+        if result is None:
+            summary['status'] = 'no_solution'
+        else:
+            summary['run_id'] = engine.save_plan(plan['date'], requests, result)
+            summary.update(status='done', total_distance_km=round(result['total_distance_km'], 2),
+                           routes=len(result['routes_data']))
+    except Exception as e:
+        # Помилка одного плану (файл, API, розв'язувач, база) не зупиняє решту пакета
+        summary.update(status='failed', error=f"{type(e).__name__}: {e}")
+    summary['seconds'] = round(time.perf_counter() - started, 2)
+    return summary
+
+
+def run_batch(manifest_path, provider_config, workers=None):
+    settings, plans = load_manifest(manifest_path)
+    db.init_db()
+    vehicles = assign_vehicles(plans)
+    started, results = time.perf_counter(), []
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, mp_context=context) as pool:
+        futures = {pool.submit(plan_one, db.DB_PATH, provider_config, settings, plan, plan_vehicles): plan
+                   for plan, plan_vehicles in zip(plans, vehicles)}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # Процес-працівник упав (BrokenProcessPool тощо) або результат не вдалося передати
+                plan = futures[future]
+                results.append({'date': plan['date'].isoformat(), 'depot': plan['depot'],
+                                'requests_file': plan['requests'], 'run_id': None, 'status': 'failed',
+                                'error': f"{type(e).__name__}: {e}"})
+            print(json.dumps(results[-1], ensure_ascii=False), file=sys.stderr)
+    elapsed = time.perf_counter() - started
+    done = sum(result['status'] == 'done' for result in results)
+    return {'plans': len(plans), 'done': done, 'failed': sum(result['status'] == 'failed' for result in results),
+            'no_solution': sum(result['status'] == 'no_solution' for result in results),
+            'seconds': round(elapsed, 2), 'plans_per_minute': round(len(results) / elapsed * 60, 2) if elapsed else None,
+            'results': sorted(results, key=lambda r: (r['date'], r['depot']))}
+
+
+if __name__ == '__main__':
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    parser = argparse.ArgumentParser(description="Пакетне планування рейсів з маніфесту JSON.")
+    parser.add_argument('manifest', help="файл маніфесту з планами")
+    parser.add_argument('--db', default=db.DB_PATH, help="файл бази даних")
+    parser.add_argument('--engine', default='google', choices=('google', 'haversine', 'road_graph'),
+                        help="рушій відстаней (ключ Google — у змінній GOOGLE_MAPS_API_KEY)")
+    parser.add_argument('--road-graph', help="файл дорожнього графа .npz для --engine road_graph")
+    parser.add_argument('--detour-factor', type=float, default=routing.DEFAULT_DETOUR_FACTOR)
+    parser.add_argument('--speed-kmh', type=float, default=routing.DEFAULT_SPEED_KMH)
+    parser.add_argument('--workers', type=int, default=None, help="процесів у пулі (за замовчуванням — ядер)")
+    args = parser.parse_args()
+    db.DB_PATH = args.db
+    config = {'engine': args.engine, 'api_key': os.environ.get('GOOGLE_MAPS_API_KEY'),
+              'detour_factor': args.detour_factor, 'speed_kmh': args.speed_kmh}
+    if args.road_graph: config['road_graph'] = routing.RoadGraph.load(args.road_graph)
+    print(json.dumps(run_batch(args.manifest, config, args.workers), ensure_ascii=False, indent=2))
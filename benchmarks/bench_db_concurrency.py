@@ -0,0 +1,174 @@
+"""Стрес-тест SQLite-шару: пропускна здатність читання, поки паралельно йдуть записи рейсів.
+
+"legacy" відтворює колишню схему роботи: одне з'єднання на всі потоки
+(check_same_thread=False), журнал відкату за замовчуванням і лише первинні
+ключі. "current" — database.py: з'єднання на потік, WAL, busy timeout,
+індекси та єдина черга запису. Обидва варіанти отримують однакову базу
+з попередньо заповненою історією та однакове навантаження.
+
+Запуск: python benchmarks/bench_db_concurrency.py --seconds 5 --readers 4 --writers 2
+"""
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta, time as dt_time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+logging.getLogger('streamlit').setLevel(logging.ERROR)
+
+import database as db  # noqa: E402
+
+STATUSES = ['Заплановано', 'В дорозі', 'Завершено']
+DAY0 = date(2025, 1, 1)
+
+
+def plan(i, stops=30, vehicles=3):
+    requests = [{'name': f"Клієнт {i}-{j}", 'address': f"вул. Тестова, {j}", 'weight': 100, 'type': 'Доставка',
+                 'time_from': dt_time(9, 0), 'time_to': dt_time(17, 0)} for j in range(stops)]
+    routes = [{'vehicle_name': f"Авто {v}", 'vehicle_capacity': 2000, 'route_text': 'Депо -> ... -> Депо',
+               'distance_km': 50.0, 'load': 1000, 'fuel_spent': 5.5, 'nodes': [0, *range(1, stops + 1), 0],
+               'stops': [{'sequence': k, 'node': k, 'name': f"Точка {k}", 'arrival_seconds': 32400 + k * 600,
+                          'departure_seconds': 33000 + k * 600, 'load_kg': k * 100, 'leg_distance_m': 1500}
+                         for k in range(stops // vehicles)]}
+              for v in range(vehicles)]
+    return DAY0 + timedelta(days=i % 365), requests, routes
+
+
+class Legacy:
+    """Колишня робота з базою: спільне з'єднання та по одному INSERT з commit на кожен крок."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        self.id_lock = threading.Lock()
+
+    def save(self, run_date, requests, routes):
+        conn = self.conn
+        # На спільному з'єднанні lastrowid іншого потоку може підмінити (або обнулити) наш id
+        with self.id_lock:
+            conn.execute('INSERT INTO runs (run_date) VALUES (?)', (run_date.isoformat(),))
+            run_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        conn.commit()
+        for req in requests:
+            conn.execute('INSERT INTO run_requests (run_id, name, address, weight, time_from, time_to, request_type) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (run_id, req['name'], req['address'], req['weight'], '09:00', '17:00', req['type']))
+        conn.commit()
+        for route in routes:
+            conn.execute('INSERT INTO vehicle_routes (run_id, vehicle_name, vehicle_capacity, route_text, distance, load, fuel_spent) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (run_id, route['vehicle_name'], route['vehicle_capacity'], route['route_text'], route['distance_km'], route['load'], route['fuel_spent']))
+        conn.commit()
+        conn.execute('UPDATE runs SET status = ? WHERE id = ?', (STATUSES[run_id % 3], run_id)); conn.commit()
+
+    def read(self, i):
+        conn, day = self.conn, (DAY0 + timedelta(days=i % 365)).isoformat()
+        run = conn.execute('SELECT id FROM runs ORDER BY id DESC LIMIT 1 OFFSET ?', (i % 200,)).fetchone()
+        conn.execute('SELECT * FROM run_requests WHERE run_id = ? ORDER BY id', (run['id'],)).fetchall()
+        conn.execute('SELECT * FROM vehicle_routes WHERE run_id = ?', (run['id'],)).fetchall()
+        runs = [r['id'] for r in conn.execute("SELECT id FROM runs WHERE run_date = ? AND status IN ('Заплановано', 'В дорозі')", (day,))]
+        if runs:
+            conn.execute(f"SELECT DISTINCT vehicle_name FROM vehicle_routes WHERE run_id IN ({','.join('?' for _ in runs)})", runs).fetchall()
+        conn.execute("SELECT vr.vehicle_name, SUM(vr.fuel_spent) FROM vehicle_routes vr JOIN runs r ON vr.run_id = r.id "
+                     "WHERE r.run_date BETWEEN ? AND ? AND r.status = 'Завершено' GROUP BY vr.vehicle_name",
+                     (day, (DAY0 + timedelta(days=i % 365 + 7)).isoformat())).fetchall()
+
+
+class Current:
+    """database.py як є."""
+
+    def save(self, run_date, requests, routes):
+        run_id = db.save_planned_run(run_date, requests, routes, 150.0)
+        db.update_run_status(run_id, STATUSES[run_id % 3])
+
+    def read(self, i):
+        day = DAY0 + timedelta(days=i % 365)
+        run = db.get_db_connection().execute('SELECT id FROM runs ORDER BY id DESC LIMIT 1 OFFSET ?', (i % 200,)).fetchone()
+        db.get_run_details(run['id'])
+        # Повз кеш Streamlit: бенчмарк міряє саме запити до SQLite
+        db._busy_vehicle_ids.__wrapped__(None, day)
+        db.get_fuel_report(day, day + timedelta(days=7))
+
+
+def prepare(path, runs, legacy):
+    if legacy:
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        with conn: db.run_migrations(conn)
+        conn.close()
+    else:
+        # Потік-записувач і з'єднання потоків відкриваються ліниво, тож шлях задається до першого звернення
+        db.DB_PATH = path
+        db.init_db()
+    target = Legacy(path) if legacy else Current()
+    for i in range(runs): target.save(*plan(i))
+    if legacy:
+        # Колишня база: журнал відкату та лише первинні ключі
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA journal_mode = DELETE')
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'").fetchall():
+            conn.execute(f'DROP INDEX {name}')
+        conn.commit(); conn.close()
+        target = Legacy(path)
+    return target
+
+
+def stress(target, seconds, readers, writers):
+    stop, lock = threading.Event(), threading.Lock()
+    stats = {'reads': 0, 'writes': 0, 'errors': 0, 'read_latencies': []}
+
+    def reader(seed):
+        i = seed
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                target.read(i)
+            except Exception:
+                # Будь-яка помилка рахується, а не завершує потік мовчки
+                with lock: stats['errors'] += 1
+            else:
+                with lock:
+                    stats['reads'] += 1; stats['read_latencies'].append(time.perf_counter() - started)
+            i += readers
+
+    def writer(seed):
+        i = 10000 + seed
+        while not stop.is_set():
+            try:
+                target.save(*plan(i))
+            except Exception:
+                with lock: stats['errors'] += 1
+            else:
+                with lock: stats['writes'] += 1
+            i += writers
+
+    threads = [threading.Thread(target=reader, args=(k,)) for k in range(readers)] + \
+              [threading.Thread(target=writer, args=(k,)) for k in range(writers)]
+    for thread in threads: thread.start()
+    time.sleep(seconds); stop.set()
+    for thread in threads: thread.join()
+    latencies = sorted(stats.pop('read_latencies')) or [0.0]
+    return {**stats, 'reads_per_second': round(stats['reads'] / seconds, 1),
+            'writes_per_second': round(stats['writes'] / seconds, 1),
+            'read_p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+            'read_p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 2)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--history', type=int, default=2000, help='кількість рейсів у базі перед тестом')
+    args = parser.parse_args()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ('legacy', 'current'):
+            target = prepare(str(Path(tmp) / f"{mode}.db"), args.history, mode == 'legacy')
+            results[mode] = stress(target, args.seconds, args.readers, args.writers)
+    print(json.dumps({'config': vars(args), 'results': results}, indent=2, ensure_ascii=False))
@@ -0,0 +1,55 @@
+"""Бенчмарк тайлового отримання матриці: холодний запуск, повторний план і одна нова точка.
+
+"offline" — та сама матриця від локального рушія `routing.HaversineProvider`,
+відкаліброваного за парами з кешу, з середньою відносною похибкою відстаней.
+
+Запуск: python benchmarks/bench_matrix.py --stops 200 --latency 0.05
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import matrix_engine  # noqa: E402
+import routing  # noqa: E402
+from fake_maps import FakeMapsClient  # noqa: E402
+
+
+def run(stops, latency, workers):
+    client = FakeMapsClient(latency=latency)
+    cache = matrix_engine.MemoryDistanceCache()
+    coords = [client.geocode(f"Точка {i}")[0]['geometry']['location'] for i in range(stops + 1)]
+    coords = [(c['lat'], c['lng']) for c in coords]
+    results = {}
+    for label, points in (('cold', coords), ('replan', coords), ('one_new_stop', coords + [(50.40, 30.60)])):
+        before = dict(client.calls)
+        started = time.perf_counter()
+        distance, _, stats = matrix_engine.fetch_matrices(client, points, cache=cache, max_workers=workers,
+                                                          requests_per_second=100)
+        results[label] = {'seconds': round(time.perf_counter() - started, 3), **stats,
+                          'api_calls': client.calls['distance_matrix'] - before['distance_matrix']}
+
+    samples = [(o, d, dist, dur) for (o, d, _), (dist, dur) in cache.pairs.items()]
+    calibration = routing.calibrate(samples)
+    provider = routing.HaversineProvider(calibration['detour_factor'], calibration['speed_kmh'])
+    started = time.perf_counter()
+    offline, _, _ = provider.matrix(points)
+    off_diagonal = distance > 0
+    results['offline'] = {'seconds': round(time.perf_counter() - started, 4), **calibration,
+                          'mean_relative_error': round(float(np.mean(np.abs(offline[off_diagonal] - distance[off_diagonal])
+                                                                     / distance[off_diagonal])), 4)}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stops', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help='імітована затримка одного запиту, с')
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+    print(json.dumps(run(args.stops, args.latency, args.workers), indent=2, ensure_ascii=False))
@@ -0,0 +1,101 @@
+"""Бенчмарк перезапуску сторінки: скільки коштує одна взаємодія з віджетом при великому списку заявок.
+
+app.py запускається через streamlit.testing (AppTest) у цьому ж процесі на тимчасовій базі
+з автопарком та історією рейсів; у сесію кладеться сховище на `--requests` заявок.
+Вимірюються типові взаємодії (перемикач у бічній панелі, сторінка редактора, дата
+рейсу) — як повний час AppTest.run, так і час скрипта, який показує сам додаток.
+
+"uncached" — запити автопарку та зайнятості щоразу йдуть у SQLite (як до кешування),
+"current" — кешовані в database.py до наступної зміни лічильників data_versions.
+
+Запуск: python benchmarks/bench_rerun.py --requests 2000 --repeat 10
+"""
+import argparse
+import json
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+logging.getLogger('streamlit').setLevel(logging.ERROR)
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import database as db  # noqa: E402
+import request_store  # noqa: E402
+from bench_db_concurrency import plan  # noqa: E402
+
+CACHED_LOOKUPS = ('_saved_vehicles', '_busy_vehicle_ids', '_fleet_occupancy')
+
+
+def seed(vehicles, runs):
+    db.init_db()
+    for v in range(vehicles): db.add_vehicle_to_db(f"Авто {v}", 1000 + 100 * (v % 10), 10.0)
+    for i in range(runs):
+        run_date, requests, routes = plan(i)
+        # Рейси на ту саму дату (кожні 365) отримують інші авто: зайняте авто рейс не збереже
+        routes = [dict(route, vehicle_name=f"Авто {(3 * (i // 365) + k) % vehicles}") for k, route in enumerate(routes)]
+        db.save_planned_run(run_date, requests, routes, 150.0)
+
+
+def request_records(n):
+    return [{'name': f"Клієнт {i}", 'address': f"м. Київ, вул. Тестова, {i}", 'type': 'Доставка',
+             'weight': 50 + i % 200, 'time_from': '09:00', 'time_to': '17:00'} for i in range(n)]
+
+
+def interactions(at):
+    """Назва -> дія над AppTest; кожна дія перед run() змінює один віджет."""
+    toggle = next(t for t in at.sidebar.toggle if t.label == "Діагностика розрахунку")
+    day = at.date_input[0]
+    return {
+        'sidebar_toggle': lambda: toggle.set_value(not toggle.value),
+        'editor_next_page': lambda: at.button(key="requests_next").click(),
+        'editor_prev_page': lambda: at.button(key="requests_prev").click(),
+        'plan_date': lambda: day.set_value(day.value + timedelta(days=1)),
+    }
+
+
+def measure(store, repeat):
+    at = AppTest.from_file(str(ROOT / 'app.py'), default_timeout=60)
+    # Без ключа Google: лише локальні рушії, жодних запитів до API
+    at.secrets['GOOGLE_MAPS_API_KEY'] = ''
+    at.session_state['requests'], at.session_state['requests_version'] = store, 0
+    at.run()
+    results = {}
+    for name in ('sidebar_toggle', 'editor_next_page', 'editor_prev_page', 'plan_date'):
+        wall, script = [], []
+        for _ in range(repeat):
+            interactions(at)[name]()
+            started = time.perf_counter(); at.run(); wall.append((time.perf_counter() - started) * 1000)
+            if at.exception: raise RuntimeError(at.exception[0].message)
+            script.append(at.session_state['last_rerun_ms'])
+        results[name] = {'wall_ms_median': round(statistics.median(wall), 1),
+                         'script_ms_median': round(statistics.median(script), 1),
+                         'script_ms_max': round(max(script), 1)}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000, help='заявок у сесії')
+    parser.add_argument('--vehicles', type=int, default=100, help='авто в автопарку')
+    parser.add_argument('--runs', type=int, default=500, help='рейсів в історії')
+    parser.add_argument('--repeat', type=int, default=10, help='повторів кожної взаємодії')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = str(Path(tmp) / 'rerun.db')
+        seed(args.vehicles, args.runs)
+        store = request_store.from_records(request_records(args.requests))
+        results = {}
+        cached = {name: getattr(db, name) for name in CACHED_LOOKUPS}
+        for name, fn in cached.items(): setattr(db, name, fn.__wrapped__)
+        results['uncached'] = measure(store, args.repeat)
+        for name, fn in cached.items(): setattr(db, name, fn)
+        results['current'] = measure(store, args.repeat)
+    print(json.dumps({'config': vars(args), 'results': results}, indent=2, ensure_ascii=False))
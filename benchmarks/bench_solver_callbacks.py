@@ -0,0 +1,84 @@
+"""Порівняння Python-колбеків та нативних матриць OR-Tools за кількістю ітерацій пошуку.
+
+"До" відтворює колишню реєстрацію лямбд з app.py, "після" — planner.build_routing_model.
+Ітерація — прийняте рішення локального пошуку (Solver.Solutions()); також
+наводяться Branches() та фінальна ціль за однаковий ліміт часу.
+
+Запуск: python benchmarks/bench_solver_callbacks.py --stops 100 --seconds 10
+"""
+import argparse
+import json
+import sys
+from datetime import time as dt_time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from ortools.constraint_solver import pywrapcp  # noqa: E402
+
+import planner  # noqa: E402
+
+
+def synthetic_data(stops, vehicles, seed=7):
+    rng = np.random.default_rng(seed)
+    points = rng.normal(0, 6000, size=(stops + 1, 2))
+    points[0] = 0
+    distance = np.rint(np.hypot(*(points[:, None, :] - points[None, :, :]).transpose(2, 0, 1)) * 1.3).astype(np.int64)
+    duration = distance * 36 // 300  # ~30 км/год
+    start_hours = rng.integers(8, 15, size=stops + 1)
+    locations_df = pd.DataFrame({
+        'name': [f"Точка {i}" for i in range(stops + 1)],
+        'weight': rng.integers(50, 400, size=stops + 1),
+        'time_from': [dt_time(int(h), 0) for h in start_hours],
+        'time_to': [dt_time(int(h) + 3, 0) for h in start_hours]})
+    vehicles_df = pd.DataFrame({'name': [f"Авто {i}" for i in range(vehicles)],
+                                'capacity': [3000] * vehicles, 'fuel_consumption': [11.0] * vehicles})
+    return planner.create_data_model(locations_df, vehicles_df, distance, duration, 600, (dt_time(7, 0), dt_time(20, 0)))
+
+
+def build_legacy_model(data, fixed_costs):
+    """Колишня реєстрація: Python-лямбди з IndexToNode та додаванням service_time на кожній дузі."""
+    dist, dur = data['distance_matrix'].tolist(), data['duration_matrix'].tolist()
+    demands = data['demands'].tolist()
+    manager = pywrapcp.RoutingIndexManager(len(dist), data['num_vehicles'], data['depot'])
+    routing = pywrapcp.RoutingModel(manager)
+    for i, cost in enumerate(fixed_costs): routing.SetFixedCostOfVehicle(cost, i)
+    dist_cb = routing.RegisterTransitCallback(lambda f, t: dist[manager.IndexToNode(f)][manager.IndexToNode(t)])
+    routing.SetArcCostEvaluatorOfAllVehicles(dist_cb)
+    demand_cb = routing.RegisterUnaryTransitCallback(lambda f: abs(demands[manager.IndexToNode(f)]))
+    routing.AddDimensionWithVehicleCapacity(demand_cb, 0, data['vehicle_capacities'], True, 'Capacity')
+    time_cb = routing.RegisterTransitCallback(
+        lambda f, t: int(dur[manager.IndexToNode(f)][manager.IndexToNode(t)] + data['service_time']))
+    routing.AddDimension(time_cb, planner.TIME_SLACK_SECONDS, planner.HORIZON_SECONDS, False, "Time")
+    time_dim = routing.GetDimensionOrDie("Time")
+    for loc_idx, time_win in enumerate(data['time_windows']):
+        if loc_idx != 0: time_dim.CumulVar(manager.NodeToIndex(loc_idx)).SetRange(int(time_win[0]), int(time_win[1]))
+    for i in range(data['num_vehicles']):
+        time_dim.CumulVar(routing.Start(i)).SetRange(int(data['time_windows'][0][0]), int(data['time_windows'][0][1]))
+    return manager, routing, time_dim
+
+
+def measure(builder, data, seconds):
+    fixed_costs = planner.vehicle_fixed_costs(data['vehicle_capacities'], 20, 2.0)
+    manager, routing, _ = builder(data, fixed_costs)
+    solution = routing.SolveWithParameters(planner.default_search_parameters(seconds))
+    solver = routing.solver()
+    return {'iterations': solver.Solutions(), 'branches': solver.Branches(),
+            'objective': solution.ObjectiveValue() if solution else None}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stops', type=int, default=100)
+    parser.add_argument('--vehicles', type=int, default=12)
+    parser.add_argument('--seconds', type=int, default=10)
+    args = parser.parse_args()
+    data = synthetic_data(args.stops, args.vehicles)
+    before = measure(build_legacy_model, data, args.seconds)
+    after = measure(planner.build_routing_model, data, args.seconds)
+    print(json.dumps({'stops': args.stops, 'seconds': args.seconds, 'python_callbacks': before,
+                      'native_matrices': after,
+                      'iterations_ratio': round(after['iterations'] / max(before['iterations'], 1), 2)},
+                     indent=2, ensure_ascii=False))
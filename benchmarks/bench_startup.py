@@ -0,0 +1,69 @@
+"""Бенчмарк запуску: холодний імпорт модулів app.py та робота init_db на кожному перезапуску скрипта.
+
+"legacy" — колишній стан: googlemaps, folium, streamlit_folium, polyline, jobs та
+OR-Tools імпортувалися на рівні модуля, а init_db на кожному перезапуску виконував
+усі CREATE TABLE IF NOT EXISTS і PRAGMA table_info для кожної перевіреної колонки.
+"current" — імпорти лише легких модулів (важкі завантажуються там, де потрібні)
+та init_db, що після першого виклику в процесі нічого не робить.
+
+Холодний імпорт вимірюється в окремому інтерпретаторі для кожного повтору.
+Запуск: python benchmarks/bench_startup.py --repeat 5 --reruns 200
+"""
+import argparse
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+logging.getLogger('streamlit').setLevel(logging.ERROR)
+
+import database as db  # noqa: E402
+
+IMPORTS = {
+    'legacy': ['streamlit', 'pandas', 'numpy', 'googlemaps', 'folium', 'streamlit_folium', 'polyline', 'database',
+               'decomposition', 'jobs', 'matrix_engine', 'planner', 'ortools.constraint_solver.pywrapcp'],
+    'current': ['streamlit', 'pandas', 'numpy', 'database', 'decomposition', 'exports', 'matrix_engine', 'planner',
+                'request_store', 'route_maps', 'routing'],
+}
+
+
+def cold_import_seconds(modules, repeat):
+    code = ('import time; started = time.perf_counter()\n'
+            + ''.join(f"import {module}\n" for module in modules)
+            + 'print(time.perf_counter() - started)')
+    timings = [float(subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True,
+                                    check=True).stdout.strip().splitlines()[-1]) for _ in range(repeat)]
+    return min(timings)
+
+
+def legacy_init_db():
+    """Колишній init_db: уся схема та перевірки колонок на кожному виклику."""
+    db._write(lambda conn: [migration(conn) for migration in db.MIGRATIONS])
+
+
+def per_rerun_seconds(init, reruns):
+    started = time.perf_counter()
+    for _ in range(reruns): init()
+    return (time.perf_counter() - started) / reruns
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5, help='повтори холодного імпорту (береться найкращий)')
+    parser.add_argument('--reruns', type=int, default=200, help='кількість імітованих перезапусків скрипта')
+    args = parser.parse_args()
+    results = {mode: {'cold_import_ms': round(cold_import_seconds(modules, args.repeat) * 1000, 1)}
+               for mode, modules in IMPORTS.items()}
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = str(Path(tmp) / 'startup.db')
+        started = time.perf_counter(); db.init_db()
+        first_init_ms = (time.perf_counter() - started) * 1000
+        results['legacy']['init_db_per_rerun_ms'] = round(per_rerun_seconds(legacy_init_db, args.reruns) * 1000, 3)
+        results['current']['init_db_per_rerun_ms'] = round(per_rerun_seconds(db.init_db, args.reruns) * 1000, 4)
+        results['current']['init_db_first_call_ms'] = round(first_init_ms, 2)
+    print(json.dumps({'config': vars(args), 'results': results}, indent=2, ensure_ascii=False))
@@ -0,0 +1,84 @@
+"""In-process замінник `googlemaps.Client` для бенчмарків і офлайн-перевірок.
+
+Відповіді мають ту саму структуру, що й у Google Maps API, а ліміти
+Distance Matrix (25 точок з боку, 100 елементів на запит) перевіряються так
+само, як на сервері, тож код, що працює з фейком, працює і з реальним API.
+"""
+import hashlib
+import math
+import threading
+
+import polyline
+
+MAX_LOCATIONS_PER_SIDE = 25
+MAX_ELEMENTS_PER_REQUEST = 100
+KYIV_CENTER = (50.4501, 30.5234)
+
+
+class FakeApiError(Exception):
+    """Помилка, аналогічна `googlemaps.exceptions.ApiError`."""
+
+
+def haversine_m(a, b):
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(h))
+
+
+class FakeMapsClient:
+    """Детермінований клієнт: координати з хешу адреси, відстані — гаверсинус з коефіцієнтом об'їзду."""
+
+    def __init__(self, detour_factor=1.3, speed_kmh=30.0, latency=0.0, radius_deg=0.12):
+        self.detour_factor, self.speed_kmh = detour_factor, speed_kmh
+        self.latency, self.radius_deg = latency, radius_deg
+        self.coordinates = {}
+        self.calls = {'geocode': 0, 'distance_matrix': 0, 'directions': 0, 'elements': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name, elements=0):
+        with self._lock:
+            self.calls[name] += 1
+            self.calls['elements'] += elements
+
+    def _sleep(self):
+        if self.latency:
+            import time
+            time.sleep(self.latency)
+
+    def _point(self, location):
+        if isinstance(location, (tuple, list)): return float(location[0]), float(location[1])
+        if location in self.coordinates: return self.coordinates[location]
+        digest = hashlib.sha1(str(location).encode('utf-8')).digest()
+        dx = (int.from_bytes(digest[:4], 'big') / 2 ** 32 - 0.5) * 2 * self.radius_deg
+        dy = (int.from_bytes(digest[4:8], 'big') / 2 ** 32 - 0.5) * 2 * self.radius_deg
+        return KYIV_CENTER[0] + dx, KYIV_CENTER[1] + dy * 1.5
+
+    def _leg(self, a, b):
+        meters = int(haversine_m(a, b) * self.detour_factor)
+        return meters, int(meters / (self.speed_kmh / 3.6))
+
+    def geocode(self, address):
+        self._count('geocode'); self._sleep()
+        lat, lng = self._point(address)
+        return [{'formatted_address': address, 'geometry': {'location': {'lat': lat, 'lng': lng}}}]
+
+    def distance_matrix(self, origins, destinations, mode="driving", departure_time=None, **kwargs):
+        if len(origins) > MAX_LOCATIONS_PER_SIDE or len(destinations) > MAX_LOCATIONS_PER_SIDE \
+                or len(origins) * len(destinations) > MAX_ELEMENTS_PER_REQUEST:
+            raise FakeApiError('MAX_ELEMENTS_EXCEEDED')
+        self._count('distance_matrix', len(origins) * len(destinations)); self._sleep()
+        rows = []
+        for origin in origins:
+            elements = []
+            for destination in destinations:
+                meters, seconds = self._leg(self._point(origin), self._point(destination))
+                element = {'status': 'OK', 'distance': {'value': meters}, 'duration': {'value': seconds}}
+                if departure_time is not None: element['duration_in_traffic'] = {'value': int(seconds * 1.2)}
+                elements.append(element)
+            rows.append({'elements': elements})
+        return {'status': 'OK', 'rows': rows}
+
+    def directions(self, origin, destination, waypoints=None, mode="driving", **kwargs):
+        self._count('directions'); self._sleep()
+        points = [self._point(p) for p in [origin, *(waypoints or []), destination]]
+        return [{'overview_polyline': {'points': polyline.encode(points)}, 'legs': []}]
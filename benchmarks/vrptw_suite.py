@@ -0,0 +1,224 @@
+"""Офлайн-набір бенчмарків VRPTW для всього конвеєра планування.
+
+Синтетичні екземпляри в дусі Solomon: C (кластеризовані точки), R (випадкові)
+та RC (змішані), з доставками й заборами, вузькими або широкими часовими
+вікнами та різним складом автопарку. Кожен екземпляр проходить ті самі етапи,
+що й кнопка "Розрахувати" в app.py, але з `FakeMapsClient` замість Google Maps:
+geocode -> matrix -> data_model -> model_setup -> solve -> extract.
+
+Для кожного етапу записуються час (wall time) та пік пам'яті Python
+(tracemalloc; пам'ять C++ OR-Tools сюди не входить — для неї є `max_rss_mb`
+процесу), для екземпляра — ціль, кількість задіяних авто та пробіг.
+Результат — JSON, який можна порівняти з попереднім прогоном (`--compare`).
+
+Запуск:
+    python benchmarks/vrptw_suite.py --output bench.json
+    python benchmarks/vrptw_suite.py --output new.json --compare bench.json
+"""
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, time as dt_time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import ortools  # noqa: E402
+
+import matrix_engine  # noqa: E402
+import planner  # noqa: E402
+from fake_maps import KYIV_CENTER, FakeMapsClient  # noqa: E402
+
+DEPOT_HOURS = (dt_time(7, 0), dt_time(20, 0))
+SERVICE_TIME_SECONDS = 600
+BASE_VEHICLE_COST, CAPACITY_COST_COEFFICIENT = 20, 2.0
+# Склад автопарку: (вантажопідйомність кг, витрата л/100км) -> кількість
+FLEETS = {
+    'uniform': {(2000, 11.0): 1},
+    'mixed': {(1000, 9.0): 2, (2200, 12.0): 2, (3500, 15.5): 1},
+    'heavy': {(1500, 10.0): 1, (5000, 19.0): 1},
+}
+# Ширина часових вікон, годин: вузькі / широкі
+WINDOWS = {'tight': (1, 2), 'wide': (3, 8)}
+INSTANCES = [
+    {'name': 'C-25-tight-uniform', 'layout': 'C', 'stops': 25, 'windows': 'tight', 'fleet': 'uniform'},
+    {'name': 'R-25-wide-mixed', 'layout': 'R', 'stops': 25, 'windows': 'wide', 'fleet': 'mixed'},
+    {'name': 'RC-50-wide-heavy', 'layout': 'RC', 'stops': 50, 'windows': 'wide', 'fleet': 'heavy'},
+    {'name': 'C-100-wide-mixed', 'layout': 'C', 'stops': 100, 'windows': 'wide', 'fleet': 'mixed'},
+    {'name': 'R-100-tight-mixed', 'layout': 'R', 'stops': 100, 'windows': 'tight', 'fleet': 'mixed'},
+    {'name': 'RC-200-wide-mixed', 'layout': 'RC', 'stops': 200, 'windows': 'wide', 'fleet': 'mixed'},
+]
+PHASES = ['geocode', 'matrix', 'data_model', 'model_setup', 'solve', 'extract']
+# Порогові відхилення для --compare: час етапу та ціль
+TIME_REGRESSION_RATIO, OBJECTIVE_REGRESSION_RATIO = 1.25, 1.02
+
+
+def _stop_points(layout, stops, rng, radius_deg=0.12):
+    """Координати точок навколо депо: C — 5 скупчень, R — рівномірно, RC — половина на половину."""
+    if layout == 'R': return rng.uniform(-radius_deg, radius_deg, size=(stops, 2))
+    if layout == 'RC':
+        half = stops // 2
+        return np.vstack((_stop_points('C', half, rng, radius_deg), _stop_points('R', stops - half, rng, radius_deg)))
+    centers = rng.uniform(-radius_deg * 0.8, radius_deg * 0.8, size=(5, 2))
+    return centers[rng.integers(0, len(centers), size=stops)] + rng.normal(0, radius_deg / 15, size=(stops, 2))
+
+
+def generate_instance(spec, seed=0):
+    """Повертає (requests_df, vehicles_df, coordinates{адреса: (lat, lng)}) для специфікації екземпляра."""
+    rng = np.random.default_rng([seed, spec['stops'], len(spec['name'])])
+    stops = spec['stops']
+    offsets = _stop_points(spec['layout'], stops, rng)
+    addresses = [f"{spec['name']}, точка {i}" for i in range(1, stops + 1)]
+    coordinates = {address: (KYIV_CENTER[0] + dy, KYIV_CENTER[1] + dx * 1.5)
+                   for address, (dx, dy) in zip(addresses, offsets)}
+    coordinates['Депо'] = KYIV_CENTER
+
+    min_width, max_width = WINDOWS[spec['windows']]
+    widths = rng.integers(min_width, max_width + 1, size=stops)
+    starts = np.minimum(rng.integers(DEPOT_HOURS[0].hour + 1, DEPOT_HOURS[1].hour - 1, size=stops),
+                        DEPOT_HOURS[1].hour - widths)
+    requests_df = pd.DataFrame({
+        'id': np.arange(1, stops + 1), 'name': [f"Клієнт {i}" for i in range(1, stops + 1)], 'address': addresses,
+        'type': rng.choice(['Доставка', 'Забір'], size=stops, p=[0.75, 0.25]),
+        'weight': rng.integers(20, 400, size=stops),
+        'time_from': [dt_time(int(h), 0) for h in starts],
+        'time_to': [dt_time(int(h), 0) for h in starts + widths]})
+
+    # Автопарк масштабується під сумарну вагу з запасом, щоб екземпляр мав рішення
+    fleet = FLEETS[spec['fleet']]
+    unit_capacity = sum(capacity * count for (capacity, _), count in fleet.items())
+    copies = max(1, int(np.ceil(requests_df['weight'].sum() * 1.6 / unit_capacity)))
+    vehicles = [{'name': f"Авто {capacity}кг #{i}", 'capacity': capacity, 'fuel_consumption': consumption}
+                for i in range(copies) for (capacity, consumption), count in fleet.items() for _ in range(count)]
+    return requests_df, pd.DataFrame(vehicles), coordinates
+
+
+class PhaseRecorder:
+    """Вимірює етапи: час та пік пам'яті Python кожного блоку `with recorder.phase(name)`."""
+
+    def __init__(self):
+        self.phases = {}
+
+    def phase(self, name):
+        recorder = self
+
+        class _Phase:
+            def __enter__(self):
+                tracemalloc.reset_peak()
+                self.base = tracemalloc.get_traced_memory()[0]
+                self.started = time.perf_counter()
+
+            def __exit__(self, *exc):
+                wall = time.perf_counter() - self.started
+                peak = tracemalloc.get_traced_memory()[1] - self.base
+                recorder.phases[name] = {'wall_seconds': round(wall, 4), 'peak_mb': round(peak / 2 ** 20, 3)}
+
+        return _Phase()
+
+
+def run_instance(spec, time_limit_seconds, seed=0):
+    """Проганяє екземпляр через усі етапи конвеєра та повертає запис результату."""
+    requests_df, vehicles_df, coordinates = generate_instance(spec, seed)
+    client = FakeMapsClient()
+    client.coordinates.update(coordinates)
+    recorder = PhaseRecorder()
+    tracemalloc.start()
+    try:
+        with recorder.phase('geocode'):
+            locations_df = planner.build_locations_df('Депо', DEPOT_HOURS, requests_df)
+            points = [client.geocode(address)[0]['geometry']['location'] for address in locations_df['address']]
+            coords = [(p['lat'], p['lng']) for p in points]
+        with recorder.phase('matrix'):
+            distance, duration, matrix_stats = matrix_engine.fetch_matrices(
+                client, coords, cache=matrix_engine.MemoryDistanceCache(), requests_per_second=0)
+        with recorder.phase('data_model'):
+            data = planner.create_data_model(locations_df, vehicles_df, distance, duration, SERVICE_TIME_SECONDS,
+                                             DEPOT_HOURS)
+            fixed_costs = planner.vehicle_fixed_costs(data['vehicle_capacities'], BASE_VEHICLE_COST,
+                                                      CAPACITY_COST_COEFFICIENT)
+        with recorder.phase('model_setup'):
+            manager, routing, time_dim = planner.build_routing_model(data, fixed_costs)
+            params = planner.default_search_parameters(time_limit_seconds)
+        with recorder.phase('solve'):
+            solution = routing.SolveWithParameters(params)
+        routes_data, total_distance_km = [], None
+        if solution:
+            with recorder.phase('extract'):
+                _, routes_data, total_distance_km = planner.get_solution_routes(data, manager, routing, solution,
+                                                                                time_dim)
+    finally:
+        tracemalloc.stop()
+    return {'instance': spec['name'], **{k: v for k, v in spec.items() if k != 'name'},
+            'vehicles_available': len(vehicles_df), 'solved': bool(solution),
+            'objective': solution.ObjectiveValue() if solution else None,
+            'vehicles_used': len(routes_data),
+            'distance_km': round(total_distance_km, 3) if total_distance_km is not None else None,
+            'solutions': routing.solver().Solutions(), 'matrix_requests': matrix_stats['requests'],
+            'phases': recorder.phases,
+            'total_seconds': round(sum(p['wall_seconds'] for p in recorder.phases.values()), 4)}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'ortools': ortools.__version__,
+            'numpy': np.__version__, 'pandas': pd.__version__, 'platform': platform.platform(),
+            'created_at': datetime.now().isoformat(timespec='seconds')}
+
+
+def compare(current, baseline):
+    """Список регресій відносно попереднього прогону (повільніші етапи та гірша ціль)."""
+    previous = {row['instance']: row for row in baseline['results']}
+    regressions = []
+    for row in current['results']:
+        old = previous.get(row['instance'])
+        if old is None: continue
+        if old['solved'] and not row['solved']:
+            regressions.append({'instance': row['instance'], 'metric': 'solved', 'before': True, 'after': False})
+            continue
+        if row['objective'] is not None and old['objective'] is not None \
+                and row['objective'] > old['objective'] * OBJECTIVE_REGRESSION_RATIO:
+            regressions.append({'instance': row['instance'], 'metric': 'objective',
+                                'before': old['objective'], 'after': row['objective']})
+        for phase, values in row['phases'].items():
+            # Етап solve обмежений лімітом часу, тож його тривалість не порівнюємо
+            before = old['phases'].get(phase, {}).get('wall_seconds')
+            if phase == 'solve' or not before: continue
+            if values['wall_seconds'] > before * TIME_REGRESSION_RATIO and values['wall_seconds'] - before > 0.01:
+                regressions.append({'instance': row['instance'], 'metric': f"{phase}.wall_seconds",
+                                    'before': before, 'after': values['wall_seconds']})
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--instances', nargs='+', help='імена екземплярів (за замовчуванням усі)')
+    parser.add_argument('--seconds', type=int, default=5, help='ліміт часу розв\'язувача на екземпляр')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='файл для JSON-результату (інакше stdout)')
+    parser.add_argument('--compare', help='попередній JSON-результат для пошуку регресій')
+    args = parser.parse_args()
+
+    specs = [spec for spec in INSTANCES if not args.instances or spec['name'] in args.instances]
+    report = {'environment': environment(), 'time_limit_seconds': args.seconds, 'seed': args.seed,
+              'results': [run_instance(spec, args.seconds, args.seed) for spec in specs]}
+    report['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    if args.compare:
+        report['regressions'] = compare(report, json.loads(Path(args.compare).read_text(encoding='utf-8')))
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output: Path(args.output).write_text(output, encoding='utf-8')
+    else: print(output)
+    if report.get('regressions'):
+        print(f"Знайдено регресій: {len(report['regressions'])}", file=sys.stderr)
+        sys.exit(1)
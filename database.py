@@ -1,6 +1,38 @@
+import json
+import queue
 import sqlite3
+import threading
+import numpy as np
 import streamlit as st
-from datetime import datetime, time as dt_time
+from concurrent.futures import Future
+from datetime import datetime, timedelta, time as dt_time
+
+# --- Параметри з'єднань ---
+DB_PATH = 'logistics_data.db'
+BUSY_TIMEOUT_MS = 5000
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',       # читачі не блокуються записом
+    'PRAGMA synchronous = NORMAL',     # у режимі WAL безпечно і значно швидше за FULL
+    f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}',
+    'PRAGMA foreign_keys = ON',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -16000',      # ~16 МБ кешу сторінок на з'єднання
+)
+
+# --- Параметри кешу геокодування ---
+GEOCODE_CACHE_TTL_DAYS = 90
+GEOCODE_CACHE_MAX_ENTRIES = 5000
+DISTANCE_CACHE_TTL_DAYS = 30
+
+# --- Параметри історії рейсів ---
+HISTORY_PAGE_SIZE = 20
+RUN_STATUSES = ('Заплановано', 'В дорозі', 'Завершено')
+COMPLETED_STATUS = 'Завершено'
+# Рейси в цих статусах займають авто на свій день
+ACTIVE_STATUSES = ('Заплановано', 'В дорозі')
+RUN_EXPORT_COLUMNS = ('id', 'run_date', 'status', 'total_distance', 'total_fuel_spent')
+# Ключ періоду для зведень палива: тиждень починається з понеділка
+FUEL_PERIODS = {'day': 'day', 'week': "date(day, '-6 days', 'weekday 1')", 'month': "strftime('%Y-%m-01', day)"}
 
 # --- Утиліта для міграцій ---
 def _add_column_if_not_exists(cursor, table_name, column_name, column_type):
@@ -14,139 +46,589 @@ def _add_column_if_not_exists(cursor, table_name, column_name, column_type):
             if "duplicate column name" not in str(e):
                  st.warning(f"Не вдалося додати колонку {column_name} до {table_name}: {e}")
 
-@st.cache_resource
-def get_db_connection():
-    """Створює та повертає з'єднання з базою даних SQLite."""
-    conn = sqlite3.connect('logistics_data.db', check_same_thread=False)
+def _connect():
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000)
     conn.row_factory = sqlite3.Row
-    # Важливо: Вмикаємо підтримку зовнішніх ключів один раз при створенні з'єднання
-    conn.execute("PRAGMA foreign_keys = ON")
+    for pragma in CONNECTION_PRAGMAS: conn.execute(pragma)
     return conn
 
-def run_migrations(conn):
-    """Перевіряє структуру всіх таблиць і додає відсутні колонки."""
+_thread_local = threading.local()
+
+def get_db_connection():
+    """З'єднання для читання, окреме для кожного потоку (сесії Streamlit та фонові задачі не ділять курсор)."""
+    conn = getattr(_thread_local, 'conn', None)
+    if conn is None: conn = _thread_local.conn = _connect()
+    return conn
+
+class _WriterQueue:
+    """Єдиний записувач: усі зміни виконуються по черзі в окремому потоці з власним з'єднанням.
+
+    Кожна задача `fn(conn)` — одна транзакція: commit після успіху, rollback при винятку,
+    який передається тому, хто чекає на результат.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        conn = _connect()
+        while True:
+            fn, future = self._queue.get()
+            if not future.set_running_or_notify_cancel(): continue
+            try:
+                with conn: result = fn(conn)
+                future.set_result(result)
+            except BaseException as e:
+                future.set_exception(e)
+
+    def submit(self, fn):
+        future = Future()
+        self._queue.put((fn, future))
+        return future
+
+@st.cache_resource
+def get_db_writer():
+    return _WriterQueue()
+
+def _write(fn, wait=True):
+    """Ставить fn(conn) у чергу записувача; при `wait` чекає та повертає результат (або піднімає виняток)."""
+    future = get_db_writer().submit(fn)
+    return future.result() if wait else future
+
+def _migration_base_schema(conn):
+    """Таблиці, колонки та індекси, що з'являлися до версіонування схеми.
+
+    Бази з user_version = 0 можуть бути створені будь-якою попередньою версією застосунку,
+    тому ця міграція ідемпотентна: IF NOT EXISTS і перевірка кожної колонки.
+    """
+    # Створення таблиць з ON DELETE CASCADE (про всяк випадок)
+    conn.execute('CREATE TABLE IF NOT EXISTS locations (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, address TEXT NOT NULL UNIQUE)')
+    conn.execute('CREATE TABLE IF NOT EXISTS vehicles (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE, capacity INTEGER NOT NULL, fuel_consumption REAL NOT NULL DEFAULT 10.0)')
+    conn.execute('CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY AUTOINCREMENT, run_date DATE NOT NULL, status TEXT NOT NULL DEFAULT \'Заплановано\', total_distance REAL, total_fuel_spent REAL)')
+    conn.execute('CREATE TABLE IF NOT EXISTS run_requests (id INTEGER PRIMARY KEY AUTOINCREMENT, run_id INTEGER, name TEXT NOT NULL, address TEXT NOT NULL, weight INTEGER NOT NULL, time_from TEXT NOT NULL, time_to TEXT NOT NULL, request_type TEXT NOT NULL DEFAULT \'Доставка\', FOREIGN KEY (run_id) REFERENCES runs (id) ON DELETE CASCADE)')
+    conn.execute('CREATE TABLE IF NOT EXISTS vehicle_routes (id INTEGER PRIMARY KEY AUTOINCREMENT, run_id INTEGER, vehicle_name TEXT NOT NULL, vehicle_capacity INTEGER NOT NULL, route_text TEXT NOT NULL, distance REAL, load REAL, fuel_spent REAL, route_nodes TEXT, FOREIGN KEY (run_id) REFERENCES runs (id) ON DELETE CASCADE)')
+    conn.execute('CREATE TABLE IF NOT EXISTS route_stops (id INTEGER PRIMARY KEY AUTOINCREMENT, run_id INTEGER NOT NULL, route_id INTEGER NOT NULL, sequence INTEGER NOT NULL, node INTEGER NOT NULL, name TEXT NOT NULL, arrival_seconds INTEGER NOT NULL, departure_seconds INTEGER NOT NULL, load_kg INTEGER NOT NULL, leg_distance_m INTEGER NOT NULL, FOREIGN KEY (run_id) REFERENCES runs (id) ON DELETE CASCADE, FOREIGN KEY (route_id) REFERENCES vehicle_routes (id) ON DELETE CASCADE)')
+    conn.execute('CREATE TABLE IF NOT EXISTS portfolio_results (id INTEGER PRIMARY KEY AUTOINCREMENT, run_id INTEGER, strategy TEXT NOT NULL, first_solution TEXT NOT NULL, metaheuristic TEXT NOT NULL, seed INTEGER NOT NULL DEFAULT 0, objective INTEGER, solutions INTEGER, first_solution_seconds REAL, is_winner INTEGER NOT NULL DEFAULT 0, FOREIGN KEY (run_id) REFERENCES runs (id) ON DELETE CASCADE)')
+    conn.execute('CREATE TABLE IF NOT EXISTS geocode_cache (address_key TEXT PRIMARY KEY, address TEXT NOT NULL, lat REAL NOT NULL, lng REAL NOT NULL, created_at TEXT NOT NULL, last_used_at TEXT NOT NULL, hits INTEGER NOT NULL DEFAULT 0)')
+    conn.execute('CREATE TABLE IF NOT EXISTS distance_cache (origin TEXT NOT NULL, destination TEXT NOT NULL, bucket TEXT NOT NULL, distance INTEGER NOT NULL, duration INTEGER NOT NULL, fetched_at TEXT NOT NULL, PRIMARY KEY (origin, destination, bucket))')
+    conn.execute('CREATE TABLE IF NOT EXISTS cache_stats (cache_name TEXT PRIMARY KEY, hits INTEGER NOT NULL DEFAULT 0, misses INTEGER NOT NULL DEFAULT 0)')
     cursor = conn.cursor()
     _add_column_if_not_exists(cursor, 'vehicles', 'fuel_consumption', 'REAL NOT NULL DEFAULT 10.0')
     _add_column_if_not_exists(cursor, 'runs', 'total_distance', 'REAL')
     _add_column_if_not_exists(cursor, 'runs', 'total_fuel_spent', 'REAL')
     _add_column_if_not_exists(cursor, 'vehicle_routes', 'fuel_spent', 'REAL')
     _add_column_if_not_exists(cursor, 'run_requests', 'request_type', 'TEXT NOT NULL DEFAULT \'Доставка\'')
-    conn.commit()
+    _add_column_if_not_exists(cursor, 'vehicle_routes', 'route_nodes', 'TEXT')
+    # Індекси під get_run_details, get_assigned_vehicles_for_date, get_fuel_report та сторінки історії
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_route_stops_run ON route_stops (run_id, route_id, sequence)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_runs_date_id ON runs (run_date, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_run_requests_run ON run_requests (run_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_vehicle_routes_run ON vehicle_routes (run_id, vehicle_name)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_runs_date_status ON runs (run_date, status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_runs_status_date ON runs (status, run_date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_portfolio_results_run ON portfolio_results (run_id)')
+
+def _migration_fuel_daily(conn):
+    fuel_daily_exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'fuel_daily'").fetchone()
+    conn.execute('CREATE TABLE IF NOT EXISTS fuel_daily (day DATE NOT NULL, vehicle_name TEXT NOT NULL, fuel REAL NOT NULL DEFAULT 0, distance REAL NOT NULL DEFAULT 0, routes INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (day, vehicle_name)) WITHOUT ROWID')
+    # Нова таблиця зведень заповнюється з уже завершених рейсів, далі підтримується інкрементально
+    if not fuel_daily_exists: _apply_fuel_stats(conn, 'r.status = ?', (COMPLETED_STATUS,), 1)
+
+def _migration_route_geometry(conn):
+    conn.execute('CREATE TABLE IF NOT EXISTS route_geometry (route_id INTEGER PRIMARY KEY, run_id INTEGER NOT NULL, path TEXT NOT NULL, stops TEXT NOT NULL, FOREIGN KEY (run_id) REFERENCES runs (id) ON DELETE CASCADE, FOREIGN KEY (route_id) REFERENCES vehicle_routes (id) ON DELETE CASCADE)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_route_geometry_run ON route_geometry (run_id)')
+
+def _migration_run_diagnostics(conn):
+    conn.execute('CREATE TABLE IF NOT EXISTS run_diagnostics (run_id INTEGER PRIMARY KEY, recorded_at TEXT NOT NULL, data TEXT NOT NULL, FOREIGN KEY (run_id) REFERENCES runs (id) ON DELETE CASCADE)')
+
+def _migration_vehicle_availability(conn):
+    conn.execute('CREATE TABLE IF NOT EXISTS vehicle_availability (vehicle_id INTEGER NOT NULL, day DATE NOT NULL, run_id INTEGER NOT NULL, PRIMARY KEY (day, vehicle_id, run_id), FOREIGN KEY (vehicle_id) REFERENCES vehicles (id) ON DELETE CASCADE, FOREIGN KEY (run_id) REFERENCES runs (id) ON DELETE CASCADE) WITHOUT ROWID')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_vehicle_availability_run ON vehicle_availability (run_id)')
+    _index_availability(conn, '1 = 1', ())
+
+def _version_triggers(conn, name, table_events):
+    """Лічильник змін `name` у data_versions, який тригери збільшують на кожну зміну рядка таблиць."""
+    conn.execute('CREATE TABLE IF NOT EXISTS data_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID')
+    conn.execute('INSERT OR IGNORE INTO data_versions (name) VALUES (?)', (name,))
+    for table, events in table_events.items():
+        for event in events:
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{name}_version_{table}_{event.lower()} AFTER {event} ON {table} "
+                         f"BEGIN UPDATE data_versions SET version = version + 1 WHERE name = '{name}'; END")
+
+def _migration_runs_version(conn):
+    # Ключ кешів історії, спільний для всіх процесів (сесії інших серверів, batch_plan.py)
+    _version_triggers(conn, 'runs', {'runs': ('INSERT', 'UPDATE', 'DELETE'), 'run_requests': ('INSERT',),
+                                     'vehicle_routes': ('INSERT', 'DELETE')})
+
+def _migration_fleet_version(conn):
+    # Ключ кешів автопарку та зайнятості разом з лічильником 'runs'
+    _version_triggers(conn, 'fleet', {'vehicles': ('INSERT', 'UPDATE', 'DELETE')})
+
+# Версія схеми бази (PRAGMA user_version) — кількість застосованих міграцій; нові лише дописуються в кінець
+MIGRATIONS = (_migration_base_schema, _migration_fuel_daily, _migration_route_geometry, _migration_run_diagnostics,
+              _migration_vehicle_availability, _migration_runs_version,
+              _migration_fleet_version)
+SCHEMA_VERSION = len(MIGRATIONS)
+_migrated_paths = set()
+_migrated_lock = threading.Lock()
+
+def run_migrations(conn):
+    """Застосовує міграції, новіші за версію бази, і повертає кількість застосованих."""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        migration(conn)
+        conn.execute(f'PRAGMA user_version = {number}')
+    return max(SCHEMA_VERSION - version, 0)
 
 def init_db():
-    """Ініціалізує базу даних, створює всі необхідні таблиці та запускає міграції."""
-    conn = get_db_connection()
-    # Створення таблиць з ON DELETE CASCADE (про всяк випадок)
-    conn.execute('CREATE TABLE IF NOT EXISTS locations (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, address TEXT NOT NULL UNIQUE)')
-    conn.execute('CREATE TABLE IF NOT EXISTS vehicles (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE, capacity INTEGER NOT NULL, fuel_consumption REAL NOT NULL DEFAULT 10.0)')
-    conn.execute('CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY AUTOINCREMENT, run_date DATE NOT NULL, status TEXT NOT NULL DEFAULT \'Заплановано\', total_distance REAL, total_fuel_spent REAL)')
-    conn.execute('CREATE TABLE IF NOT EXISTS run_requests (id INTEGER PRIMARY KEY AUTOINCREMENT, run_id INTEGER, name TEXT NOT NULL, address TEXT NOT NULL, weight INTEGER NOT NULL, time_from TEXT NOT NULL, time_to TEXT NOT NULL, request_type TEXT NOT NULL DEFAULT \'Доставка\', FOREIGN KEY (run_id) REFERENCES runs (id) ON DELETE CASCADE)')
-    conn.execute('CREATE TABLE IF NOT EXISTS vehicle_routes (id INTEGER PRIMARY KEY AUTOINCREMENT, run_id INTEGER, vehicle_name TEXT NOT NULL, vehicle_capacity INTEGER NOT NULL, route_text TEXT NOT NULL, distance REAL, load REAL, fuel_spent REAL, FOREIGN KEY (run_id) REFERENCES runs (id) ON DELETE CASCADE)')
-    conn.commit()
-    run_migrations(conn)
+    """Доводить схему бази до SCHEMA_VERSION — один раз на процес і файл бази, наступні виклики нічого не роблять."""
+    if DB_PATH in _migrated_paths: return
+    with _migrated_lock:
+        if DB_PATH not in _migrated_paths:
+            _write(run_migrations)
+            _migrated_paths.add(DB_PATH)
 
 # --- Функції для локацій ---
 def get_saved_locations(): return get_db_connection().execute('SELECT name, address FROM locations ORDER BY name').fetchall()
 def add_location_to_db(name, address):
-    try: get_db_connection().execute('INSERT INTO locations (name, address) VALUES (?, ?)', (name, address)).connection.commit()
+    try: _write(lambda conn: conn.execute('INSERT INTO locations (name, address) VALUES (?, ?)', (name, address)))
     except sqlite3.IntegrityError: pass
 
+# --- Кеш геокодування ---
+def normalize_address(address):
+    """Нормалізує адресу для ключа кешу: нижній регістр, без ком та зайвих пробілів."""
+    return ' '.join(str(address).lower().replace(',', ' ').split())
+
+def _bump_cache_stats(conn, cache_name, hits, misses):
+    conn.execute('INSERT INTO cache_stats (cache_name, hits, misses) VALUES (?, ?, ?) '
+                 'ON CONFLICT(cache_name) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses',
+                 (cache_name, hits, misses))
+
+def get_cached_geocodes(addresses):
+    """Повертає {нормалізована адреса: (lat, lng)} для актуальних записів кешу та оновлює лічильники."""
+    conn = get_db_connection()
+    keys = list(dict.fromkeys(normalize_address(a) for a in addresses))
+    if not keys: return {}
+    now = datetime.now()
+    cutoff = (now - timedelta(days=GEOCODE_CACHE_TTL_DAYS)).isoformat(timespec='seconds')
+    placeholders = ','.join('?' for _ in keys)
+    rows = conn.execute(f'SELECT address_key, lat, lng FROM geocode_cache WHERE address_key IN ({placeholders}) AND created_at >= ?',
+                        keys + [cutoff]).fetchall()
+    found = {row['address_key']: (row['lat'], row['lng']) for row in rows}
+
+    def touch(conn):
+        conn.executemany('UPDATE geocode_cache SET hits = hits + 1, last_used_at = ? WHERE address_key = ?',
+                         [(now.isoformat(timespec='seconds'), key) for key in found])
+        _bump_cache_stats(conn, 'geocode', len(found), len(keys) - len(found))
+    # Лічильники не потрібні для відповіді, тож не чекаємо на записувача
+    _write(touch, wait=False)
+    return found
+
+def save_geocodes(entries):
+    """Зберігає [(адреса, lat, lng)] у кеш і видаляє прострочені та найдавніше використані записи понад ліміт."""
+    if not entries: return
+    _write(lambda conn: _save_geocodes(conn, entries))
+
+def _save_geocodes(conn, entries):
+    now = datetime.now().isoformat(timespec='seconds')
+    conn.executemany('INSERT INTO geocode_cache (address_key, address, lat, lng, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?) '
+                     'ON CONFLICT(address_key) DO UPDATE SET address = excluded.address, lat = excluded.lat, lng = excluded.lng, '
+                     'created_at = excluded.created_at, last_used_at = excluded.last_used_at',
+                     [(normalize_address(address), address, lat, lng, now, now) for address, lat, lng in entries])
+    cutoff = (datetime.now() - timedelta(days=GEOCODE_CACHE_TTL_DAYS)).isoformat(timespec='seconds')
+    conn.execute('DELETE FROM geocode_cache WHERE created_at < ?', (cutoff,))
+    conn.execute('DELETE FROM geocode_cache WHERE address_key NOT IN (SELECT address_key FROM geocode_cache ORDER BY last_used_at DESC LIMIT ?)',
+                 (GEOCODE_CACHE_MAX_ENTRIES,))
+
+# --- Кеш матриці відстаней ---
+def get_cached_distances(origin_keys, destination_keys, bucket):
+    """Повертає {(origin, destination): (distance, duration)} для актуальних пар кешу."""
+    if not origin_keys or not destination_keys: return {}
+    conn = get_db_connection()
+    cutoff = (datetime.now() - timedelta(days=DISTANCE_CACHE_TTL_DAYS)).isoformat(timespec='seconds')
+    origins_ph = ','.join('?' for _ in origin_keys)
+    destinations_ph = ','.join('?' for _ in destination_keys)
+    rows = conn.execute(f'SELECT origin, destination, distance, duration FROM distance_cache WHERE bucket = ? AND fetched_at >= ? '
+                        f'AND origin IN ({origins_ph}) AND destination IN ({destinations_ph})',
+                        [bucket, cutoff] + list(origin_keys) + list(destination_keys)).fetchall()
+    found = {(row['origin'], row['destination']): (row['distance'], row['duration']) for row in rows}
+    requested = len(set(origin_keys)) * len(set(destination_keys)) - len(set(origin_keys) & set(destination_keys))
+    _write(lambda conn: _bump_cache_stats(conn, 'distance_matrix', len(found), max(requested - len(found), 0)), wait=False)
+    return found
+
+def save_distances(bucket, rows):
+    """Зберігає [(origin, destination, distance, duration)] у кеш матриці та видаляє прострочені пари."""
+    if not rows: return
+    now = datetime.now()
+    values = [(o, d, bucket, int(dist), int(dur), now.isoformat(timespec='seconds')) for o, d, dist, dur in rows]
+    cutoff = (now - timedelta(days=DISTANCE_CACHE_TTL_DAYS)).isoformat(timespec='seconds')
+
+    def save(conn):
+        conn.executemany('INSERT OR REPLACE INTO distance_cache (origin, destination, bucket, distance, duration, fetched_at) VALUES (?, ?, ?, ?, ?, ?)', values)
+        conn.execute('DELETE FROM distance_cache WHERE fetched_at < ?', (cutoff,))
+    _write(save)
+
+def get_cached_distance_samples(limit, bucket='static'):
+    """Останні `limit` пар кешу матриці [(origin, destination, distance, duration)] — для калібрування офлайн-рушія."""
+    rows = get_db_connection().execute('SELECT origin, destination, distance, duration FROM distance_cache WHERE bucket = ? '
+                                       'ORDER BY fetched_at DESC LIMIT ?', (bucket, limit))
+    return [tuple(row) for row in rows]
+
+def get_cache_stats(cache_name):
+    row = get_db_connection().execute('SELECT hits, misses FROM cache_stats WHERE cache_name = ?', (cache_name,)).fetchone()
+    return dict(row) if row else {'hits': 0, 'misses': 0}
+
 # --- Функції для автомобілів ---
 def get_saved_vehicles():
+    """Автопарк за назвою; кешується до зміни автопарку в будь-якому процесі."""
+    return _saved_vehicles(_data_version('fleet'))
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _saved_vehicles(version):
     rows = get_db_connection().execute('SELECT id, name, capacity, fuel_consumption FROM vehicles ORDER BY name').fetchall()
     return [dict(row) for row in rows]
 def add_vehicle_to_db(name, capacity, fuel_consumption):
-    try: get_db_connection().execute('INSERT INTO vehicles (name, capacity, fuel_consumption) VALUES (?, ?, ?)', (name, capacity, fuel_consumption)).connection.commit()
+    def add(conn):
+        conn.execute('INSERT INTO vehicles (name, capacity, fuel_consumption) VALUES (?, ?, ?)', (name, capacity, fuel_consumption))
+        # Авто з назвою, що вже є в активних рейсах, одразу займає їхні дні
+        _index_availability(conn, 'v.name = ?', (name,))
+    try: _write(add)
     except sqlite3.IntegrityError: st.warning(f"Автомобіль '{name}' вже існує.")
-def delete_vehicle_from_db(vehicle_id): get_db_connection().execute('DELETE FROM vehicles WHERE id = ?', (vehicle_id,)).connection.commit()
+def delete_vehicle_from_db(vehicle_id): _write(lambda conn: conn.execute('DELETE FROM vehicles WHERE id = ?', (vehicle_id,)))
 
 # --- Функції для рейсів ---
 def create_run(run_date):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     run_date_str = run_date.isoformat()
-    cursor.execute('INSERT INTO runs (run_date) VALUES (?)', (run_date_str,))
-    conn.commit()
-    return cursor.lastrowid
+    return _write(lambda conn: conn.execute('INSERT INTO runs (run_date) VALUES (?)', (run_date_str,)).lastrowid)
+
+def _time_str(value): return value.strftime('%H:%M') if isinstance(value, dt_time) else str(value)
+
+def _save_requests(conn, run_id, requests):
+    conn.executemany('INSERT INTO run_requests (run_id, name, address, weight, time_from, time_to, request_type) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     [(run_id, req['name'], req['address'], req['weight'], _time_str(req['time_from']), _time_str(req['time_to']), req['type'])
+                      for req in requests])
 
 def save_requests_for_run(run_id, requests):
-    conn = get_db_connection()
-    for req in requests:
-        time_from_str = req['time_from'].strftime('%H:%M') if isinstance(req['time_from'], dt_time) else str(req['time_from'])
-        time_to_str = req['time_to'].strftime('%H:%M') if isinstance(req['time_to'], dt_time) else str(req['time_to'])
-        conn.execute('INSERT INTO run_requests (run_id, name, address, weight, time_from, time_to, request_type) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                     (run_id, req['name'], req['address'], req['weight'], time_from_str, time_to_str, req['type']))
-    conn.commit()
+    _write(lambda conn: _save_requests(conn, run_id, requests))
 
 def save_routes_for_run(run_id, routes_data):
-    conn, total_fuel = get_db_connection(), 0
-    for route in routes_data:
-        fuel_spent = route.get('fuel_spent', 0) or 0
-        conn.execute('INSERT INTO vehicle_routes (run_id, vehicle_name, vehicle_capacity, route_text, distance, load, fuel_spent) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                     (run_id, route['vehicle_name'], route['vehicle_capacity'], route['route_text'], route.get('distance_km', 0), route.get('load', 0), fuel_spent))
-        total_fuel += fuel_spent
-    conn.commit(); return total_fuel
+    def save(conn):
+        _check_vehicles_free(conn, conn.execute('SELECT run_date FROM runs WHERE id = ?', (run_id,)).fetchone()[0],
+                             routes_data, run_id)
+        total_fuel = _save_routes(conn, run_id, routes_data)
+        _index_availability(conn, 'r.id = ?', (run_id,))
+        return total_fuel
+    return _write(save)
+
+class VehicleBusyError(Exception):
+    """Авто рейсу вже зайняте іншим активним рейсом на ту саму дату."""
+
+def _check_vehicles_free(conn, day, routes_data, run_id=None):
+    """Перевіряє зайнятість авто в транзакції запису, а не за кешованим списком вільних авто.
+
+    Інша сесія чи batch_plan.py могли зайняти авто, поки рейс розраховувався.
+    """
+    names = sorted({route['vehicle_name'] for route in routes_data})
+    if not names: return
+    rows = conn.execute(f"""
+        SELECT DISTINCT v.name FROM vehicle_availability a JOIN vehicles v ON v.id = a.vehicle_id
+        WHERE a.day = ? AND a.run_id IS NOT ? AND v.name IN ({','.join('?' for _ in names)})
+        ORDER BY v.name
+    """, (day, run_id, *names)).fetchall()
+    if rows: raise VehicleBusyError(f"Авто вже зайняті іншим рейсом на {day}: {', '.join(row[0] for row in rows)}")
+
+def _save_routes(conn, run_id, routes_data):
+    if not routes_data: return 0
+    # Порядок заявок (номери у списку заявок рейсу, без депо) — для теплового старту при редагуванні
+    conn.executemany('INSERT INTO vehicle_routes (run_id, vehicle_name, vehicle_capacity, route_text, distance, load, fuel_spent, route_nodes) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                     [(run_id, route['vehicle_name'], route['vehicle_capacity'], route['route_text'], route.get('distance_km', 0), route.get('load', 0),
+                       route.get('fuel_spent', 0) or 0, json.dumps(route['nodes'][1:-1]) if route.get('nodes') else None) for route in routes_data])
+    # executemany не повертає id кожного рядка; записувач один, тож останні len(routes_data) маршрутів рейсу — щойно вставлені
+    route_ids = [row[0] for row in conn.execute('SELECT id FROM vehicle_routes WHERE run_id = ? ORDER BY id DESC LIMIT ?',
+                                                (run_id, len(routes_data))).fetchall()][::-1]
+    conn.executemany('INSERT INTO route_stops (run_id, route_id, sequence, node, name, arrival_seconds, departure_seconds, load_kg, leg_distance_m) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     [(run_id, route_id, stop['sequence'], stop['node'], stop['name'], stop['arrival_seconds'], stop['departure_seconds'],
+                       stop['load_kg'], stop['leg_distance_m']) for route_id, route in zip(route_ids, routes_data) for stop in route.get('stops', [])])
+    return sum(route.get('fuel_spent', 0) or 0 for route in routes_data)
+
+def save_planned_run(run_date, requests, routes_data, total_distance, portfolio_members=None):
+    """Зберігає рейс із заявками, маршрутами, зупинками та підсумками однією транзакцією.
+
+    Якщо будь-який крок падає, у базі не лишається рейсу без маршрутів. Повертає id рейсу.
+    """
+    def save(conn):
+        _check_vehicles_free(conn, run_date.isoformat(), routes_data)
+        run_id = conn.execute('INSERT INTO runs (run_date) VALUES (?)', (run_date.isoformat(),)).lastrowid
+        _save_requests(conn, run_id, requests)
+        _save_routes(conn, run_id, routes_data)
+        conn.execute('UPDATE runs SET total_distance = ?, total_fuel_spent = (SELECT COALESCE(SUM(fuel_spent), 0) FROM vehicle_routes WHERE run_id = ?) WHERE id = ?',
+                     (total_distance or 0, run_id, run_id))
+        if portfolio_members: _save_portfolio_results(conn, run_id, portfolio_members)
+        _index_availability(conn, 'r.id = ?', (run_id,))
+        return run_id
+    return _write(save)
 
 def update_run_totals(run_id, total_distance, total_fuel):
     total_distance = total_distance or 0
     total_fuel = total_fuel or 0
-    get_db_connection().execute('UPDATE runs SET total_distance = ?, total_fuel_spent = ? WHERE id = ?',
-                                (total_distance, total_fuel, run_id)).connection.commit()
+    _write(lambda conn: conn.execute('UPDATE runs SET total_distance = ?, total_fuel_spent = ? WHERE id = ?',
+                                     (total_distance, total_fuel, run_id)))
 
 def get_all_runs():
     return get_db_connection().execute('SELECT id, run_date, status, total_distance, total_fuel_spent FROM runs ORDER BY run_date DESC, id DESC').fetchall()
 
+def _runs_filter(start_date, end_date, statuses):
+    where, params = [], []
+    if start_date: where.append('run_date >= ?'); params.append(start_date.isoformat())
+    if end_date: where.append('run_date <= ?'); params.append(end_date.isoformat())
+    if statuses:
+        where.append(f"status IN ({','.join('?' for _ in statuses)})"); params.extend(statuses)
+    return where, params
+
+def get_runs_page(start_date=None, end_date=None, statuses=(), after=None, page_size=HISTORY_PAGE_SIZE):
+    """Сторінка історії (новіші рейси спочатку) з keyset-пагінацією за (run_date, id).
+
+    `after` — курсор (run_date, id) останнього рейсу попередньої сторінки.
+    Повертає (рейси, курсор наступної сторінки або None); кешується до зміни рейсів у будь-якому процесі.
+    """
+    return _runs_page(get_history_version(), start_date, end_date, statuses, after, page_size)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _runs_page(version, start_date, end_date, statuses, after, page_size):
+    where, params = _runs_filter(start_date, end_date, statuses)
+    if after:
+        where.append('(run_date < ? OR (run_date = ? AND id < ?))'); params.extend([after[0], after[0], after[1]])
+    sql = 'SELECT id, run_date, status, total_distance, total_fuel_spent FROM runs'
+    if where: sql += ' WHERE ' + ' AND '.join(where)
+    rows = get_db_connection().execute(sql + ' ORDER BY run_date DESC, id DESC LIMIT ?', params + [page_size + 1]).fetchall()
+    runs = [dict(r) for r in rows[:page_size]]
+    return runs, ((runs[-1]['run_date'], runs[-1]['id']) if len(rows) > page_size else None)
+
+def get_runs_details(run_ids):
+    """Заявки, маршрути та зупинки для сторінки рейсів — по одному запиту на таблицю.
+
+    Повертає {run_id: {'requests': [...], 'routes': [...], 'stops': {route_id: [...]}}}.
+    """
+    return _runs_details(get_history_version(), run_ids)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _runs_details(version, run_ids):
+    details = {run_id: {'requests': [], 'routes': [], 'stops': {}} for run_id in run_ids}
+    if not run_ids: return details
+    conn, placeholders = get_db_connection(), ','.join('?' for _ in run_ids)
+    for row in conn.execute(f'SELECT * FROM run_requests WHERE run_id IN ({placeholders}) ORDER BY id', list(run_ids)):
+        details[row['run_id']]['requests'].append(dict(row))
+    for row in conn.execute(f'SELECT * FROM vehicle_routes WHERE run_id IN ({placeholders}) ORDER BY id', list(run_ids)):
+        details[row['run_id']]['routes'].append(dict(row))
+    for row in conn.execute(f'SELECT * FROM route_stops WHERE run_id IN ({placeholders}) ORDER BY route_id, sequence', list(run_ids)):
+        details[row['run_id']]['stops'].setdefault(row['route_id'], []).append(dict(row))
+    return details
+
+def iter_runs(start_date=None, end_date=None, statuses=(), chunk_size=1000):
+    """Рейси за фільтром частинами по `chunk_size` кортежів у порядку RUN_EXPORT_COLUMNS (для експорту)."""
+    where, params = _runs_filter(start_date, end_date, statuses)
+    sql = f"SELECT {', '.join(RUN_EXPORT_COLUMNS)} FROM runs"
+    if where: sql += ' WHERE ' + ' AND '.join(where)
+    cursor = get_db_connection().execute(sql + ' ORDER BY run_date DESC, id DESC', params)
+    while rows := cursor.fetchmany(chunk_size): yield [tuple(r) for r in rows]
+
+def get_history_version():
+    """Лічильник змін рейсів з бази: ключ для кешів історії (сторінки, експорт), спільний для всіх процесів."""
+    return _data_version('runs')
+
+def _data_version(name):
+    row = get_db_connection().execute('SELECT version FROM data_versions WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else 0
+
 def get_run_details(run_id):
     conn = get_db_connection()
-    requests = conn.execute('SELECT * FROM run_requests WHERE run_id = ?', (run_id,)).fetchall()
+    requests = conn.execute('SELECT * FROM run_requests WHERE run_id = ? ORDER BY id', (run_id,)).fetchall()
     routes = conn.execute('SELECT * FROM vehicle_routes WHERE run_id = ?', (run_id,)).fetchall()
     return [dict(r) for r in requests], [dict(r) for r in routes]
 
+def get_route_stops(run_id):
+    """Зупинки всіх маршрутів рейсу: {id маршруту: [рядки зупинок у порядку об'їзду]}."""
+    stops = {}
+    for row in get_db_connection().execute('SELECT * FROM route_stops WHERE run_id = ? ORDER BY route_id, sequence', (run_id,)):
+        stops.setdefault(row['route_id'], []).append(dict(row))
+    return stops
+
+def save_route_geometries(run_id, geometries):
+    """Зберігає геометрію маршрутів рейсу: {назва авто: (закодована лінія доріг, закодовані координати зупинок)}."""
+    def save(conn):
+        route_ids = {row['vehicle_name']: row['id'] for row in
+                     conn.execute('SELECT id, vehicle_name FROM vehicle_routes WHERE run_id = ?', (run_id,))}
+        conn.executemany('INSERT OR REPLACE INTO route_geometry (route_id, run_id, path, stops) VALUES (?, ?, ?, ?)',
+                         [(route_ids[name], run_id, path, stops) for name, (path, stops) in geometries.items()
+                          if name in route_ids])
+    _write(save)
+
+def get_route_geometries(run_id):
+    """{id маршруту: {'path': ..., 'stops': ...}} для рейсу (порожньо, якщо карта ще не будувалась)."""
+    rows = get_db_connection().execute('SELECT route_id, path, stops FROM route_geometry WHERE run_id = ?', (run_id,))
+    return {row['route_id']: {'path': row['path'], 'stops': row['stops']} for row in rows}
+
+def save_run_diagnostics(run_id, diagnostics):
+    """Зберігає (або оновлює) діагностику розрахунку рейсу: {'spans', 'counters', 'solver'}."""
+    recorded_at = datetime.now().isoformat(timespec='seconds')
+    _write(lambda conn: conn.execute('INSERT OR REPLACE INTO run_diagnostics (run_id, recorded_at, data) VALUES (?, ?, ?)',
+                                     (run_id, recorded_at, json.dumps(diagnostics))))
+
+def get_run_diagnostics(limit=100):
+    """Діагностика останніх `limit` рейсів (новіші спочатку): [{'run_id', 'run_date', 'recorded_at', 'spans', ...}]."""
+    rows = get_db_connection().execute("""
+        SELECT d.run_id, r.run_date, d.recorded_at, d.data
+        FROM run_diagnostics d
+        JOIN runs r ON r.id = d.run_id
+        ORDER BY d.run_id DESC
+        LIMIT ?
+    """, (limit,)).fetchall()
+    return [{'run_id': row['run_id'], 'run_date': row['run_date'], 'recorded_at': row['recorded_at'], **json.loads(row['data'])}
+            for row in rows]
+
+def save_portfolio_results(run_id, members):
+    """Зберігає результати кожної стратегії портфеля для подальшого налаштування типових параметрів."""
+    _write(lambda conn: _save_portfolio_results(conn, run_id, members))
+
+def _save_portfolio_results(conn, run_id, members):
+    rows = [(run_id, m['strategy'], m['first_solution'], m['metaheuristic'], m['seed'], m['objective'],
+             m['solutions'], m['first_solution_seconds'], int(m['is_winner'])) for m in members]
+    conn.executemany('INSERT INTO portfolio_results (run_id, strategy, first_solution, metaheuristic, seed, objective, solutions, first_solution_seconds, is_winner) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+def get_portfolio_win_stats():
+    return get_db_connection().execute("""
+        SELECT first_solution || ' + ' || metaheuristic AS strategy, COUNT(*) AS runs, SUM(is_winner) AS wins,
+               AVG(first_solution_seconds) AS avg_first_solution_seconds
+        FROM portfolio_results
+        GROUP BY first_solution, metaheuristic
+        ORDER BY wins DESC, runs DESC
+    """).fetchall()
+
 def update_run_status(run_id, new_status):
-    get_db_connection().execute('UPDATE runs SET status = ? WHERE id = ?', (new_status, run_id)).connection.commit()
+    def update(conn):
+        row = conn.execute('SELECT status, run_date FROM runs WHERE id = ?', (run_id,)).fetchone()
+        if row is None: return
+        # Поки рейс був неактивним, його авто могли зайняти інші рейси на ту саму дату
+        if row['status'] not in ACTIVE_STATUSES and new_status in ACTIVE_STATUSES:
+            routes = conn.execute('SELECT vehicle_name FROM vehicle_routes WHERE run_id = ?', (run_id,)).fetchall()
+            _check_vehicles_free(conn, row['run_date'], routes, run_id)
+        conn.execute('UPDATE runs SET status = ? WHERE id = ?', (new_status, run_id))
+        # Рейс увійшов до звітних (завершених) або вийшов з них — коригуємо денні зведення
+        if (row['status'] == COMPLETED_STATUS) != (new_status == COMPLETED_STATUS):
+            _apply_fuel_stats(conn, 'r.id = ?', (run_id,), 1 if new_status == COMPLETED_STATUS else -1)
+        # Так само індекс зайнятості: авто звільняється, коли рейс перестає бути активним
+        if (row['status'] in ACTIVE_STATUSES) != (new_status in ACTIVE_STATUSES):
+            if new_status in ACTIVE_STATUSES: _index_availability(conn, 'r.id = ?', (run_id,))
+            else: conn.execute('DELETE FROM vehicle_availability WHERE run_id = ?', (run_id,))
+    _write(update)
+
+def _apply_fuel_stats(conn, where, params, sign):
+    """Додає (sign=1) або віднімає (sign=-1) маршрути рейсів за умовою `where` у денних зведеннях палива."""
+    conn.execute(f"""
+        INSERT INTO fuel_daily (day, vehicle_name, fuel, distance, routes)
+        SELECT r.run_date, vr.vehicle_name, ? * COALESCE(SUM(vr.fuel_spent), 0), ? * COALESCE(SUM(vr.distance), 0), ? * COUNT(*)
+        FROM vehicle_routes vr
+        JOIN runs r ON vr.run_id = r.id
+        WHERE {where}
+        GROUP BY r.run_date, vr.vehicle_name
+        ON CONFLICT(day, vehicle_name) DO UPDATE SET
+            fuel = fuel + excluded.fuel, distance = distance + excluded.distance, routes = routes + excluded.routes
+    """, (sign, sign, sign, *params))
+    if sign < 0: conn.execute('DELETE FROM fuel_daily WHERE routes <= 0')
+
+def _index_availability(conn, where, params):
+    """Додає в індекс зайнятості авто (за id) на дні активних рейсів, що відповідають умові `where`."""
+    conn.execute(f"""
+        INSERT OR IGNORE INTO vehicle_availability (vehicle_id, day, run_id)
+        SELECT DISTINCT v.id, r.run_date, r.id
+        FROM vehicle_routes vr
+        JOIN runs r ON vr.run_id = r.id
+        JOIN vehicles v ON v.name = vr.vehicle_name
+        WHERE r.status IN ({','.join('?' for _ in ACTIVE_STATUSES)}) AND {where}
+    """, (*ACTIVE_STATUSES, *params))
 
 # ==== ФІНАЛЬНА ВЕРСІЯ ФУНКЦІЇ ВИДАЛЕННЯ ====
 def delete_run(run_id):
     """Повністю видаляє рейс, явно видаляючи пов'язані записи."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        # Починаємо транзакцію
-        cursor.execute('BEGIN TRANSACTION')
-        # 1. Видаляємо пов'язані маршрути
-        cursor.execute('DELETE FROM vehicle_routes WHERE run_id = ?', (run_id,))
+    def delete(conn):
+        # 0. Завершений рейс прибираємо зі зведень палива, поки його маршрути ще є
+        _apply_fuel_stats(conn, 'r.id = ? AND r.status = ?', (run_id, COMPLETED_STATUS), -1)
+        # 1. Видаляємо пов'язані зупинки, геометрію, маршрути та статистику портфеля
+        conn.execute('DELETE FROM route_stops WHERE run_id = ?', (run_id,))
+        conn.execute('DELETE FROM route_geometry WHERE run_id = ?', (run_id,))
+        conn.execute('DELETE FROM run_diagnostics WHERE run_id = ?', (run_id,))
+        conn.execute('DELETE FROM vehicle_availability WHERE run_id = ?', (run_id,))
+        conn.execute('DELETE FROM vehicle_routes WHERE run_id = ?', (run_id,))
+        conn.execute('DELETE FROM portfolio_results WHERE run_id = ?', (run_id,))
         # 2. Видаляємо пов'язані заявки
-        cursor.execute('DELETE FROM run_requests WHERE run_id = ?', (run_id,))
+        conn.execute('DELETE FROM run_requests WHERE run_id = ?', (run_id,))
         # 3. Видаляємо сам рейс
-        cursor.execute('DELETE FROM runs WHERE id = ?', (run_id,))
-        # Завершуємо транзакцію
-        conn.commit()
+        conn.execute('DELETE FROM runs WHERE id = ?', (run_id,))
+    try:
+        # Усе виконується однією транзакцією записувача: при помилці зміни відкочуються
+        _write(delete)
     except Exception as e:
-        conn.rollback() # Відкочуємо зміни у разі помилки
         st.error(f"Помилка при видаленні рейсу №{run_id}: {e}")
         # Додатково логуємо помилку для Streamlit Cloud
         print(f"Error deleting run {run_id}: {e}") # Log to console/Streamlit logs
 
-def get_assigned_vehicles_for_date(run_date):
-    run_date_str = run_date.isoformat()
-    runs_on_date = get_db_connection().execute("SELECT id FROM runs WHERE run_date = ? AND status IN ('Заплановано', 'В дорозі')", (run_date_str,)).fetchall()
-    if not runs_on_date: return []
-    run_ids = [r['id'] for r in runs_on_date]
-    placeholders = ','.join('?' for _ in run_ids)
-    assigned_vehicles = get_db_connection().execute(f'SELECT DISTINCT vehicle_name FROM vehicle_routes WHERE run_id IN ({placeholders})', run_ids).fetchall()
-    return [v['vehicle_name'] for v in assigned_vehicles]
+def _fleet_versions():
+    return _data_version('runs'), _data_version('fleet')
+
+def get_busy_vehicle_ids(run_date):
+    """Id авто, зайнятих активними рейсами на дату (з індексу зайнятості); кешується до зміни рейсів чи автопарку."""
+    return _busy_vehicle_ids(_fleet_versions(), run_date)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _busy_vehicle_ids(versions, run_date):
+    rows = get_db_connection().execute('SELECT DISTINCT vehicle_id FROM vehicle_availability WHERE day = ?',
+                                       (run_date.isoformat(),))
+    return {row[0] for row in rows}
+
+def get_fleet_occupancy(start_date, end_date):
+    """Матриця зайнятості автопарку за період одним запитом.
+
+    Повертає (авто як у get_saved_vehicles, дні [date], масив int16 авто×день з кількістю
+    активних рейсів авто на день; 0 — авто вільне).
+    """
+    return _fleet_occupancy(_fleet_versions(), start_date, end_date)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _fleet_occupancy(versions, start_date, end_date):
+    vehicles = get_saved_vehicles()
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    occupancy = np.zeros((len(vehicles), len(days)), dtype=np.int16)
+    row_of = {v['id']: i for i, v in enumerate(vehicles)}
+    col_of = {day.isoformat(): j for j, day in enumerate(days)}
+    rows = get_db_connection().execute("""
+        SELECT vehicle_id, day, COUNT(*) AS runs
+        FROM vehicle_availability
+        WHERE day BETWEEN ? AND ?
+        GROUP BY day, vehicle_id
+    """, (start_date.isoformat(), end_date.isoformat()))
+    for vehicle_id, day, runs in rows:
+        if vehicle_id in row_of and day in col_of: occupancy[row_of[vehicle_id], col_of[day]] = runs
+    return vehicles, days, occupancy
 
 def get_fuel_report(start_date, end_date):
-    start_date_str = start_date.isoformat()
-    end_date_str = end_date.isoformat()
+    """Паливо та відстань завершених рейсів по авто за період (з денних зведень, а не з маршрутів)."""
     return get_db_connection().execute("""
-        SELECT
-            vr.vehicle_name,
-            SUM(CASE WHEN vr.fuel_spent IS NOT NULL THEN vr.fuel_spent ELSE 0 END) as total_fuel,
-            SUM(CASE WHEN vr.distance IS NOT NULL THEN vr.distance ELSE 0 END) as total_distance
-        FROM vehicle_routes vr
-        JOIN runs r ON vr.run_id = r.id
-        WHERE r.run_date BETWEEN ? AND ? AND r.status = 'Завершено'
-        GROUP BY vr.vehicle_name
+        SELECT vehicle_name, SUM(fuel) AS total_fuel, SUM(distance) AS total_distance
+        FROM fuel_daily
+        WHERE day BETWEEN ? AND ?
+        GROUP BY vehicle_name
         ORDER BY total_fuel DESC
-    """, (start_date_str, end_date_str)).fetchall()
+    """, (start_date.isoformat(), end_date.isoformat())).fetchall()
+
+def get_fuel_trend(start_date, end_date, period='day', vehicle_names=()):
+    """Паливо, відстань і кількість маршрутів по авто за днями, тижнями ('week') або місяцями ('month').
+
+    Період позначається першим днем (для тижня — понеділком). `vehicle_names` обмежує вибірку авто.
+    """
+    period_key = FUEL_PERIODS[period]
+    sql, params = f'SELECT {period_key} AS period, vehicle_name, SUM(fuel) AS fuel, SUM(distance) AS distance, SUM(routes) AS routes FROM fuel_daily WHERE day BETWEEN ? AND ?', [start_date.isoformat(), end_date.isoformat()]
+    if vehicle_names:
+        sql += f" AND vehicle_name IN ({','.join('?' for _ in vehicle_names)})"; params.extend(vehicle_names)
+    return [dict(r) for r in get_db_connection().execute(sql + ' GROUP BY period, vehicle_name ORDER BY period, vehicle_name', params)]
@@ -0,0 +1,185 @@
+"""Режим декомпозиції для дуже великих днів (сотні й тисячі заявок).
+
+Заявки розбиваються на кластери за розташуванням відносно депо та часовими
+вікнами: початкові центри дає розгортка (sweep) за полярним кутом навколо депо,
+далі кілька ітерацій k-means з обмеженням розміру та сумарної ваги кластера.
+Автомобілі розподіляються між кластерами пропорційно до ваги вантажу,
+кожен кластер розв'язується окремою моделлю у своєму процесі пулу, а результати
+зводяться в ту саму структуру `routes_data`, що й у `planner.get_solution_routes`
+(з глобальними номерами вузлів та авто). Матриці відстаней запитуються й
+тримаються в пам'яті лише для точок усередині кластера (разом з депо).
+"""
+import math
+import time
+
+import numpy as np
+
+import planner
+
+DECOMPOSITION_MIN_STOPS = 300
+MAX_CLUSTER_STOPS = 150
+KMEANS_ITERATIONS = 10
+# Скільки кілометрів "коштує" година різниці між серединами часових вікон
+TIME_WINDOW_WEIGHT_KM_PER_HOUR = 5.0
+DEMAND_SLACK = 0.15
+POLL_INTERVAL_SECONDS = 0.25
+
+
+def should_decompose(num_stops, min_stops=DECOMPOSITION_MIN_STOPS):
+    return num_stops >= min_stops
+
+
+def _features(lat, lon, time_windows):
+    """Ознаки точок: (x, y) у км відносно депо (рядок 0) та зважена середина часового вікна."""
+    lat0, lon0 = lat[0], lon[0]
+    x = (lon - lon0) * 111.32 * math.cos(math.radians(lat0))
+    y = (lat - lat0) * 110.57
+    t = time_windows.mean(axis=1) / 3600.0 * TIME_WINDOW_WEIGHT_KM_PER_HOUR
+    return np.column_stack((x, y, t))[1:]
+
+
+def _sweep_centroids(features, num_clusters):
+    """Початкові центри: точки, відсортовані за кутом навколо депо, ріжуться на рівні сектори."""
+    order = np.argsort(np.arctan2(features[:, 1], features[:, 0]))
+    return np.array([features[part].mean(axis=0) for part in np.array_split(order, num_clusters)])
+
+
+def _capped_assign(features, centroids, demands, max_stops, max_demand):
+    """Призначає кожну точку найближчому центру, у якого ще є місце за кількістю точок та вагою."""
+    distances = np.linalg.norm(features[:, None, :] - centroids[None, :, :], axis=2)
+    preferences = np.argsort(distances, axis=1)
+    counts, loads = np.zeros(len(centroids), dtype=np.int64), np.zeros(len(centroids), dtype=np.int64)
+    labels = np.empty(len(features), dtype=np.int64)
+    # Спершу розміщуємо точки, що найближчі до свого центру: їм найменше "болить" переміщення
+    for point in np.argsort(distances.min(axis=1)):
+        fits = [c for c in preferences[point] if counts[c] < max_stops and loads[c] + demands[point] <= max_demand]
+        cluster = fits[0] if fits else min(preferences[point], key=lambda c: counts[c])
+        labels[point] = cluster
+        counts[cluster] += 1; loads[cluster] += demands[point]
+    return labels
+
+
+def cluster_stops(lat, lon, time_windows, demands, num_vehicles, max_cluster_stops=MAX_CLUSTER_STOPS):
+    """Розбиває заявки (вузли 1..N-1, вузол 0 — депо) на кластери; повертає список масивів номерів вузлів."""
+    num_stops = len(lat) - 1
+    num_clusters = max(1, min(num_vehicles, math.ceil(num_stops / max_cluster_stops)))
+    if num_clusters == 1: return [np.arange(1, num_stops + 1)]
+    features = _features(np.asarray(lat, dtype=float), np.asarray(lon, dtype=float), np.asarray(time_windows))
+    stop_demands = np.asarray(demands)[1:]
+    max_demand = stop_demands.sum() / num_clusters * (1 + DEMAND_SLACK)
+    centroids = _sweep_centroids(features, num_clusters)
+    labels = None
+    for _ in range(KMEANS_ITERATIONS):
+        new_labels = _capped_assign(features, centroids, stop_demands, max_cluster_stops, max_demand)
+        if labels is not None and np.array_equal(labels, new_labels): break
+        labels = new_labels
+        centroids = np.array([features[labels == c].mean(axis=0) if (labels == c).any() else centroids[c]
+                              for c in range(num_clusters)])
+    return [np.flatnonzero(labels == c) + 1 for c in range(num_clusters) if (labels == c).any()]
+
+
+def assign_vehicles(cluster_demands, vehicle_capacities):
+    """Розподіляє авто між кластерами: кожному хоча б одне, решта — туди, де найбільший дефіцит місткості."""
+    order = sorted(range(len(vehicle_capacities)), key=lambda v: -vehicle_capacities[v])
+    assigned = [[] for _ in cluster_demands]
+    capacity = [0] * len(cluster_demands)
+    for rank, vehicle in enumerate(order):
+        if rank < len(cluster_demands):
+            cluster = sorted(range(len(cluster_demands)), key=lambda c: -cluster_demands[c])[rank]
+        else:
+            cluster = max(range(len(cluster_demands)),
+                          key=lambda c: cluster_demands[c] * (1 + DEMAND_SLACK) / max(capacity[c], 1))
+        assigned[cluster].append(vehicle)
+        capacity[cluster] += vehicle_capacities[vehicle]
+    return [sorted(vehicles) for vehicles in assigned]
+
+
+def plan_clusters(locations_df, vehicles_df, depot_working_hours, max_cluster_stops=MAX_CLUSTER_STOPS):
+    """Кластери рейсу: список словників {'nodes': [вузли без депо], 'vehicles': [позиції авто у vehicles_df]}.
+
+    `locations_df` має містити координати `lat`/`lon` (депо в рядку 0).
+    """
+    time_windows = np.column_stack((planner.time_column_to_seconds(locations_df['time_from']),
+                                    planner.time_column_to_seconds(locations_df['time_to'])))
+    time_windows[0] = [t.hour * 3600 + t.minute * 60 for t in depot_working_hours]
+    demands = np.abs(locations_df['weight'].to_numpy(dtype=np.int64))
+    capacities = vehicles_df['capacity'].astype(int).tolist()
+    groups = cluster_stops(locations_df['lat'].to_numpy(), locations_df['lon'].to_numpy(), time_windows, demands,
+                           len(capacities), max_cluster_stops)
+    vehicles = assign_vehicles([int(demands[nodes].sum()) for nodes in groups], capacities)
+    return [{'nodes': nodes.tolist(), 'vehicles': cluster_vehicles}
+            for nodes, cluster_vehicles in zip(groups, vehicles)]
+
+
+def build_cluster_models(locations_df, vehicles_df, clusters, fetch_matrix, service_time_seconds,
+                         depot_working_hours, base_vehicle_cost, capacity_cost_coefficient):
+    """Моделі кластерів; `fetch_matrix(coords)` повертає (distance, duration) лише для точок кластера з депо.
+
+    Помилки отримання матриці `fetch_matrix` піднімає сам, тож часткового набору моделей не буває.
+    """
+    models = []
+    for cluster in clusters:
+        nodes = [0] + cluster['nodes']
+        cluster_locations = locations_df.iloc[nodes].reset_index(drop=True)
+        distance, duration = fetch_matrix(list(zip(cluster_locations['lat'], cluster_locations['lon'])))
+        data = planner.create_data_model(cluster_locations, vehicles_df.iloc[cluster['vehicles']], distance, duration,
+                                         service_time_seconds, depot_working_hours)
+        models.append({'data': data, 'nodes': nodes, 'vehicles': cluster['vehicles'],
+                       'fixed_costs': planner.vehicle_fixed_costs(data['vehicle_capacities'], base_vehicle_cost,
+                                                                  capacity_cost_coefficient)})
+    return models
+
+
+def merge_results(models, results):
+    """Зводить результати кластерів у результат `planner.solve` з глобальними вузлами та авто.
+
+    None, якщо хоча б один кластер не має рішення: частковий план не зберігаємо.
+    """
+    if any(result is None for result in results): return None
+    routes_data = []
+    for model, result in zip(models, results):
+        for route in result['routes_data']:
+            routes_data.append({**route, 'vehicle_index': model['vehicles'][route['vehicle_index']],
+                                'nodes': [model['nodes'][node] for node in route['nodes']],
+                                'stops': [{**stop, 'node': model['nodes'][stop['node']]} for stop in route['stops']]})
+    routes_data.sort(key=lambda route: route['vehicle_index'])
+    total_distance_km = sum(result['total_distance_km'] for result in results)
+    # Кластери розв'язуються паралельно: час — за найповільнішим, кількість рішень — сумарна
+    stats = [result.get('solver_stats') or {} for result in results]
+    first_solution = [s['first_solution_seconds'] for s in stats if s.get('first_solution_seconds') is not None]
+    solver_stats = {'solutions': sum(s.get('solutions', 0) for s in stats),
+                    'solve_seconds': max((s.get('solve_seconds', 0.0) for s in stats), default=0.0),
+                    'extract_seconds': sum(s.get('extract_seconds', 0.0) for s in stats),
+                    'first_solution_seconds': max(first_solution) if first_solution else None,
+                    'objective_progress': []}
+    return {'solution_text': planner.render_solution_report(routes_data, total_distance_km),
+            'routes_data': routes_data, 'total_distance_km': total_distance_km,
+            'objective': sum(result['objective'] for result in results), 'warm_start': False,
+            'solver_stats': solver_stats,
+            'decomposition': {'clusters': [{'stops': len(model['nodes']) - 1, 'vehicles': len(model['vehicles']),
+                                            'objective': result['objective']}
+                                           for model, result in zip(models, results)]}}
+
+
+def solve_clusters(models, time_limit_seconds, submit, mp_manager, stop_event=None, on_progress=None):
+    """Розв'язує кластери паралельно в пулі процесів і повертає {'result', 'cancelled'} як `solve_with_progress`.
+
+    `submit(fn, *args)` ставить задачу в пул, `mp_manager` — `multiprocessing.Manager`.
+    """
+    stop = stop_event if stop_event is not None else mp_manager.Event()
+    progresses = [mp_manager.dict() for _ in models]
+    futures = [submit(planner.solve_with_progress, model['data'], model['fixed_costs'], time_limit_seconds,
+                      progress, stop)
+               for model, progress in zip(models, progresses)]
+    while not all(future.done() for future in futures):
+        if on_progress is not None:
+            snapshots = [dict(progress) for progress in progresses]
+            found = [s['best_objective'] for s in snapshots if s.get('best_objective') is not None]
+            on_progress({'best_objective': sum(found) if len(found) == len(models) else None,
+                         'solutions': sum(s.get('solutions', 0) for s in snapshots),
+                         'first_solution_seconds': max((s['first_solution_seconds'] for s in snapshots
+                                                        if 'first_solution_seconds' in s), default=None)})
+        time.sleep(POLL_INTERVAL_SECONDS)
+    outcomes = [future.result() for future in futures]
+    return {'result': merge_results(models, [outcome['result'] for outcome in outcomes]),
+            'cancelled': any(outcome['cancelled'] for outcome in outcomes)}
@@ -0,0 +1,145 @@
+"""Безголовий рушій планування рейсу: від заявок і авто до моделі, рішення та запису в базу.
+
+Модуль не залежить від інтерфейсу: app.py лише збирає параметри з віджетів і
+показує прогрес фонових задач, а batch_plan.py планує багато днів і депо з
+файлів. Типовий шлях:
+
+    settings = engine.plan_settings(use_traffic=False)
+    plan = engine.prepare_plan(provider, depot_address, requests, vehicles, settings)
+    result = engine.solve_plan(plan, settings['time_limit_seconds'])
+    run_id = engine.save_plan(run_date, requests, result)
+
+або `submit_plan` для розв'язування у `jobs.JobManager`. Помилки підготовки
+(геокодування, матриця, порожній рейс) піднімаються як `PlanningError`.
+"""
+from datetime import time as dt_time
+
+import pandas as pd
+
+import database as db
+import decomposition
+import instrumentation
+import planner
+import request_store
+
+PLAN_DEFAULTS = {
+    'service_time_minutes': 20,
+    'working_hours': (dt_time(8, 0), dt_time(18, 0)),
+    'use_traffic': False,
+    # Фіксована вартість авто: база + коефіцієнт за кожну тонну вантажопідйомності (у км)
+    'base_vehicle_cost': 20,
+    'capacity_cost_coefficient': 2.0,
+    'time_limit_seconds': 20,
+    'decompose': True,
+}
+
+
+class PlanningError(Exception):
+    """Рейс неможливо підготувати до розв'язування; текст придатний для показу користувачу."""
+
+
+def plan_settings(**overrides):
+    """PLAN_DEFAULTS з перевизначеннями; невідомий параметр — TypeError."""
+    unknown = set(overrides) - set(PLAN_DEFAULTS)
+    if unknown: raise TypeError(f"Невідомі параметри планування: {', '.join(sorted(unknown))}")
+    return {**PLAN_DEFAULTS, **overrides}
+
+
+def _records(requests):
+    return request_store.to_records(requests) if isinstance(requests, pd.DataFrame) else list(requests)
+
+
+def prepare_plan(provider, depot_address, requests, vehicles, settings, trace=instrumentation.NULL_TRACE):
+    """Геокодує точки, отримує матриці та будує модель (або моделі кластерів) рейсу.
+
+    `requests` — сховище заявок (`request_store`) або список словників, `vehicles` — словники
+    з name, capacity, fuel_consumption. Повертає план: {'locations_df', 'vehicles_df', 'matrix_stats'}
+    разом з 'data' і 'fixed_costs' для одного розв'язку або 'clusters' і 'models' для декомпозиції.
+    """
+    if not len(requests): raise PlanningError("Додайте хоча б одну заявку.")
+    if not len(vehicles): raise PlanningError("Виберіть хоча б один автомобіль.")
+    locations_df = planner.build_locations_df(depot_address, settings['working_hours'], requests)
+    vehicles_df = pd.DataFrame(list(vehicles))
+
+    with trace.span('geocode'):
+        try:
+            coords, geocode_stats = provider.geocode(locations_df['address'].tolist())
+        except LookupError as e:
+            raise PlanningError(str(e)) from e
+        except Exception as e:
+            raise PlanningError(f"Помилка геокодування: {e}") from e
+    trace.count('geocode_cache_hits', geocode_stats['cache_hits'])
+    trace.count('geocode_api_calls', geocode_stats['api_calls'])
+    locations_df['lat'], locations_df['lon'] = [c[0] for c in coords], [c[1] for c in coords]
+
+    matrix_stats = {'cached_elements': 0, 'fetched_elements': 0, 'requests': 0}
+
+    def fetch_matrix(points):
+        with trace.span('distance_matrix'):
+            try:
+                distance, duration, stats = provider.matrix(points, settings['use_traffic'])
+            except Exception as e:
+                raise PlanningError(f"Помилка отримання матриці: {e}") from e
+        for key in matrix_stats: matrix_stats[key] += stats[key]
+        trace.count('distance_matrix_api_calls', stats['requests'])
+        trace.count('distance_matrix_cached_elements', stats['cached_elements'])
+        trace.count('distance_matrix_fetched_elements', stats['fetched_elements'])
+        return distance, duration
+
+    plan = {'locations_df': locations_df, 'vehicles_df': vehicles_df, 'matrix_stats': matrix_stats}
+    service_time_seconds = settings['service_time_minutes'] * 60
+    if settings['decompose'] and decomposition.should_decompose(len(locations_df) - 1):
+        with trace.span('clustering'):
+            plan['clusters'] = decomposition.plan_clusters(locations_df, vehicles_df, settings['working_hours'])
+        plan['models'] = decomposition.build_cluster_models(
+            locations_df, vehicles_df, plan['clusters'], fetch_matrix, service_time_seconds,
+            settings['working_hours'], settings['base_vehicle_cost'], settings['capacity_cost_coefficient'])
+    else:
+        distance, duration = fetch_matrix(list(zip(locations_df['lat'], locations_df['lon'])))
+        with trace.span('create_data_model'):
+            plan['data'] = planner.create_data_model(locations_df, vehicles_df, distance, duration,
+                                                     service_time_seconds, settings['working_hours'])
+        plan['fixed_costs'] = planner.vehicle_fixed_costs(plan['data']['vehicle_capacities'],
+                                                          settings['base_vehicle_cost'],
+                                                          settings['capacity_cost_coefficient'])
+    return plan
+
+
+def solve_plan(plan, time_limit_seconds, initial_routes=None):
+    """Розв'язує план у поточному процесі; результат як у `planner.solve` або None, якщо рішення немає.
+
+    Кластери розв'язуються по черзі: паралелізм пакетного планування — між планами.
+    """
+    if 'models' in plan:
+        results = []
+        for model in plan['models']:
+            results.append(planner.solve(model['data'], model['fixed_costs'], time_limit_seconds))
+            if results[-1] is None: return None
+        return decomposition.merge_results(plan['models'], results)
+    return planner.solve(plan['data'], plan['fixed_costs'], time_limit_seconds, initial_routes=initial_routes)
+
+
+def submit_plan(manager, plan, run_date, requests, settings, context=None, portfolio_size=1, initial_routes=None):
+    """Ставить розв'язування плану в чергу `jobs.JobManager` і повертає id задачі."""
+    if 'models' in plan:
+        return manager.submit_decomposed(plan['models'], settings['time_limit_seconds'], run_date, _records(requests),
+                                         context=context)
+    return manager.submit(plan['data'], plan['fixed_costs'], settings['time_limit_seconds'], run_date,
+                          _records(requests), context=context, portfolio_size=portfolio_size,
+                          initial_routes=initial_routes)
+
+
+def save_plan(run_date, requests, result, trace=instrumentation.NULL_TRACE):
+    """Зберігає розв'язаний рейс (та його діагностику, якщо вона збирається); повертає id рейсу."""
+    stats = result.get('solver_stats') or result
+    trace.add_time('solve', stats.get('solve_seconds', 0.0))
+    trace.add_time('extract_routes', stats.get('extract_seconds', 0.0))
+    trace.set_solver({key: stats[key] for key in ('solutions', 'first_solution_seconds', 'objective_progress')
+                      if key in stats})
+    portfolio = result.get('portfolio')
+    with trace.span('db_write'):
+        run_id = db.save_planned_run(run_date, _records(requests), result['routes_data'], result['total_distance_km'],
+                                     portfolio['members'] if portfolio else None)
+    diagnostics = trace.to_dict()
+    if diagnostics is not None: db.save_run_diagnostics(run_id, diagnostics)
+    return run_id
@@ -0,0 +1,76 @@
+"""Потоковий експорт таблиць у XLSX, CSV або Parquet.
+
+Рядки надходять частинами (наприклад, з `db.iter_runs`) і одразу пишуться у
+тимчасовий файл на диску: XLSX — через write-only книгу openpyxl, CSV — модулем csv,
+Parquet — по одній групі рядків pyarrow на частину. У пам'яті одночасно
+тримається лише одна частина та готовий файл для завантаження; кешування
+результатів за версією даних лишається за викликом (`st.cache_data` у app.py).
+"""
+import csv
+import importlib.util
+import tempfile
+from pathlib import Path
+
+EXPORT_CHUNK_ROWS = 5000
+EXPORT_FORMATS = {
+    'xlsx': ('Excel', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('CSV', 'text/csv'),
+    'parquet': ('Parquet', 'application/vnd.apache.parquet'),
+}
+
+
+def available_formats():
+    """Формати, для яких встановлено бібліотеки (Parquet потребує pyarrow).
+
+    Наявність pyarrow перевіряється без імпорту: сам pyarrow завантажується лише у `_write_parquet`.
+    """
+    if importlib.util.find_spec('pyarrow') is None:
+        return [fmt for fmt in EXPORT_FORMATS if fmt != 'parquet']
+    return list(EXPORT_FORMATS)
+
+
+def _write_xlsx(path, columns, chunks, sheet_name):
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    sheet.append(list(columns))
+    for chunk in chunks:
+        for row in chunk: sheet.append(list(row))
+    workbook.save(path)
+
+
+def _write_csv(path, columns, chunks, sheet_name):
+    # utf-8-sig, щоб Excel коректно відкривав кирилицю
+    with open(path, 'w', encoding='utf-8-sig', newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        for chunk in chunks: writer.writerows(chunk)
+
+
+def _write_parquet(path, columns, chunks, sheet_name):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    writer = None
+    for chunk in chunks:
+        if not chunk: continue
+        table = pa.Table.from_pylist([dict(zip(columns, row)) for row in chunk])
+        if writer is None:
+            # Колонка, порожня в першій частині, не має типу — пишемо її рядками
+            schema = pa.schema([f.with_type(pa.string()) if pa.types.is_null(f.type) else f for f in table.schema])
+            writer = pq.ParquetWriter(path, schema)
+        writer.write_table(table.cast(writer.schema))
+    if writer is None:
+        pq.write_table(pa.table({column: pa.array([], pa.string()) for column in columns}), path)
+    else:
+        writer.close()
+
+
+_WRITERS = {'xlsx': _write_xlsx, 'csv': _write_csv, 'parquet': _write_parquet}
+
+
+def write_export(fmt, columns, chunks, sheet_name='Report'):
+    """Записує частини рядків (ітератор списків кортежів) у файл формату `fmt` і повертає його байти."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / f"export.{fmt}"
+        _WRITERS[fmt](path, columns, chunks, sheet_name)
+        return path.read_bytes()
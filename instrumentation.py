@@ -0,0 +1,77 @@
+"""Інструментація конвеєра планування рейсу.
+
+`Trace` одного розрахунку збирає тривалість фаз (геокодування, матриця,
+модель, розв'язування, витяг маршрутів, запис у базу, карта), лічильники
+зовнішніх викликів і звернень до кешу та статистику розв'язувача. Trace
+передається явно: з потоку Streamlit у задачу пулу і назад, а наприкінці
+зберігається в базі разом з рейсом. Коли інструментацію вимкнено,
+використовується `NULL_TRACE`: його span і count нічого не роблять і не
+звертаються до годинника.
+"""
+import contextlib
+import threading
+import time
+
+# Скільки точок прогресу цілі розв'язувача зберігати на рейс
+MAX_OBJECTIVE_POINTS = 200
+PHASES = ('geocode', 'clustering', 'distance_matrix', 'create_data_model', 'solve', 'extract_routes', 'db_write',
+          'route_map')
+
+
+class Trace:
+    def __init__(self):
+        self.spans, self.counters, self.solver = {}, {}, {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name, seconds):
+        with self._lock: self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        with self._lock: self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_solver(self, stats):
+        with self._lock: self.solver.update(stats)
+
+    def to_dict(self):
+        with self._lock:
+            return {'spans': dict(self.spans), 'counters': dict(self.counters), 'solver': dict(self.solver)}
+
+
+class _NullTrace:
+    _context = contextlib.nullcontext()
+
+    def span(self, name): return self._context
+    def add_time(self, name, seconds): pass
+    def count(self, name, n=1): pass
+    def set_solver(self, stats): pass
+    def to_dict(self): return None
+
+
+NULL_TRACE = _NullTrace()
+
+
+def new_trace(enabled=True):
+    return Trace() if enabled else NULL_TRACE
+
+
+def thin(points, limit=MAX_OBJECTIVE_POINTS):
+    """Рівномірно проріджує ряд точок до `limit`, зберігаючи першу та останню."""
+    if len(points) <= limit: return list(points)
+    step = (len(points) - 1) / (limit - 1)
+    return [points[round(i * step)] for i in range(limit)]
+
+
+def flatten(diagnostics):
+    """Один рядок таблиці з діагностики рейсу: фази в мс, лічильники та підсумки розв'язувача."""
+    row = {f"{phase}_ms": round(diagnostics['spans'].get(phase, 0.0) * 1000, 1) for phase in PHASES}
+    row.update(diagnostics['counters'])
+    row.update({f"solver_{key}": value for key, value in diagnostics['solver'].items() if key != 'objective_progress'})
+    return row
@@ -0,0 +1,153 @@
+"""Фонові розрахунки рейсів у пулі процесів.
+
+Розв'язувач запускається в окремому процесі, тож сесія Streamlit не блокується,
+а кілька диспетчерів можуть планувати одночасно на різних ядрах. Процес-
+працівник публікує прогрес (найкраща знайдена ціль, кількість рішень) через
+спільний словник і перевіряє прапорець скасування. Готовий результат
+зберігається в базу однією транзакцією через `engine.save_plan`.
+"""
+import contextlib
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import decomposition
+import engine
+import instrumentation
+import planner
+import portfolio
+
+FINISHED_STATES = ('done', 'no_solution', 'cancelled', 'failed')
+_main_module_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def plain_main_module():
+    """Тимчасово ховає скрипт Streamlit з `sys.modules['__main__']`.
+
+    Streamlit виконує app.py як модуль `__main__`, а spawn-процеси імпортують
+    головний модуль батька — без підміни кожен працівник заново запускав би додаток.
+    """
+    with _main_module_lock:
+        main_module = sys.modules.get('__main__')
+        sys.modules['__main__'] = types.ModuleType('__main__')
+        try:
+            yield
+        finally:
+            sys.modules['__main__'] = main_module
+
+
+class JobManager:
+    """Черга розрахунків, спільна для всіх сесій процесу Streamlit."""
+
+    def __init__(self, max_workers=None):
+        context = multiprocessing.get_context('spawn')
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+        with plain_main_module(): self._manager = context.Manager()
+        self._coordinators = ThreadPoolExecutor(thread_name_prefix='portfolio')
+        self._jobs, self._lock, self._ids = {}, threading.Lock(), itertools.count(1)
+
+    def _submit_to_pool(self, fn, *args):
+        # Нові процеси пулу запускаються синхронно всередині submit
+        with plain_main_module(): return self._executor.submit(fn, *args)
+
+    def _run_portfolio(self, job, data, fixed_costs, time_limit_seconds, portfolio_size):
+        job['progress']['started_at'] = time.time()
+        result = portfolio.solve_portfolio(data, fixed_costs, time_limit_seconds, self._submit_to_pool, self._manager,
+                                           portfolio.portfolio_members(portfolio_size),
+                                           stop_event=job['cancel_event'], on_progress=job['progress'].update)
+        return {'result': result, 'cancelled': job['cancel_event'].is_set()}
+
+    def submit(self, data, fixed_costs, time_limit_seconds, run_date, requests, context=None, portfolio_size=1,
+               initial_routes=None):
+        """Ставить розрахунок у чергу та повертає id задачі.
+
+        При `portfolio_size > 1` модель розв'язується портфелем стратегій у кількох процесах пулу.
+        `initial_routes` вмикає тепловий старт від попереднього плану (портфель тоді не використовується).
+        """
+        expected_seconds = planner.WARM_START_TIME_LIMIT_SECONDS if initial_routes is not None else time_limit_seconds
+        job = self._new_job(expected_seconds, run_date, requests, context)
+        with self._lock:
+            self._jobs[job['id']] = job
+            if portfolio_size > 1 and initial_routes is None:
+                job['future'] = self._coordinators.submit(self._run_portfolio, job, data, fixed_costs,
+                                                          time_limit_seconds, portfolio_size)
+            else:
+                job['future'] = self._submit_to_pool(planner.solve_with_progress, data, fixed_costs,
+                                                     time_limit_seconds, job['progress'], job['cancel_event'], None,
+                                                     initial_routes)
+        job['future'].add_done_callback(lambda future: self._finish(job, future))
+        return job['id']
+
+    def submit_decomposed(self, models, time_limit_seconds, run_date, requests, context=None):
+        """Ставить у чергу розрахунок, розбитий на кластери (`decomposition.build_cluster_models`)."""
+        # Кластерів може бути більше, ніж процесів пулу: тоді вони розв'язуються хвилями
+        waves = -(-len(models) // self.max_workers)
+        job = self._new_job(time_limit_seconds * waves, run_date, requests, context)
+        with self._lock:
+            self._jobs[job['id']] = job
+            job['future'] = self._coordinators.submit(self._run_decomposed, job, models, time_limit_seconds)
+        job['future'].add_done_callback(lambda future: self._finish(job, future))
+        return job['id']
+
+    def _new_job(self, expected_seconds, run_date, requests, context):
+        return {'id': next(self._ids), 'state': 'queued', 'submitted_at': time.time(), 'time_limit': expected_seconds,
+                'run_date': run_date, 'requests': list(requests), 'context': context or {},
+                'progress': self._manager.dict(), 'cancel_event': self._manager.Event(),
+                'result': None, 'run_id': None, 'error': None}
+
+    def _run_decomposed(self, job, models, time_limit_seconds):
+        job['progress']['started_at'] = time.time()
+        return decomposition.solve_clusters(models, time_limit_seconds, self._submit_to_pool, self._manager,
+                                            stop_event=job['cancel_event'], on_progress=job['progress'].update)
+
+    def _finish(self, job, future):
+        job['last_progress'], job['finished_at'] = dict(job['progress']), time.time()
+        if future.cancelled():
+            job['state'] = 'cancelled'; return
+        try:
+            outcome = future.result()
+            if outcome['cancelled'] or job['cancel_event'].is_set():
+                job['state'] = 'cancelled'
+            elif outcome['result'] is None:
+                job['state'] = 'no_solution'
+            else:
+                job['result'] = outcome['result']
+                job['run_id'] = self._persist(job, outcome['result'])
+                job['state'] = 'done'
+        except Exception as e:
+            job['error'], job['state'] = str(e), 'failed'
+            print(f"Plan job {job['id']} failed: {e}")
+
+    @staticmethod
+    def _persist(job, result):
+        return engine.save_plan(job['run_date'], job['requests'], result,
+                                job['context'].get('trace', instrumentation.NULL_TRACE))
+
+    def snapshot(self, job_id):
+        """Поточний стан задачі для відображення в інтерфейсі (або None, якщо задачі немає)."""
+        with self._lock: job = self._jobs.get(job_id)
+        if job is None: return None
+        state = job['state']
+        progress = job.get('last_progress', {}) if state in FINISHED_STATES else dict(job['progress'])
+        if state == 'queued' and 'started_at' in progress: state = 'running'
+        elapsed = job.get('finished_at', time.time()) - progress['started_at'] if 'started_at' in progress else 0.0
+        return {'id': job['id'], 'state': state, 'elapsed': elapsed, 'time_limit': job['time_limit'],
+                'best_objective': progress.get('best_objective'), 'solutions': progress.get('solutions', 0),
+                'first_solution_seconds': progress.get('first_solution_seconds'),
+                'result': job['result'], 'run_id': job['run_id'], 'error': job['error'], 'context': job['context']}
+
+    def cancel(self, job_id):
+        with self._lock: job = self._jobs.get(job_id)
+        if job is None: return
+        job['cancel_event'].set()
+        job['future'].cancel()
+
+    def forget(self, job_id):
+        with self._lock: self._jobs.pop(job_id, None)
@@ -0,0 +1,160 @@
+"""Попередньо розрахована матриця відстаней і часу для постійних адрес (таблиця `locations`) та депо.
+
+Матриці зберігаються у .npy-файлах, що відкриваються як memory-mapped масиви, з
+ємністю із запасом: нова адреса дописує лише свій рядок і стовпець, а коли ємність
+вичерпано, файли перебудовуються з подвоєною ємністю. Поруч лежить index.json —
+нормалізована адреса -> індекс та координати. Під час планування підматриця точок
+плану копіюється з файлів за індексами без жодного запиту до API; через API
+дозапитуються лише пари з адресами, яких у матриці ще немає.
+
+Матриця рахується без урахування трафіку (кошик 'static'). Оновлення вручну або
+нічною задачею: python location_matrix.py --depot "м. Київ, ..." (ключ у GOOGLE_MAPS_API_KEY).
+"""
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+
+import database as db
+import matrix_engine
+from planner import MATRIX_DTYPE
+
+STORE_DIR_NAME = 'location_matrix'
+INITIAL_CAPACITY = 64
+# Пару ще не розраховано (на відміну від UNREACHABLE — API не знайшов маршруту)
+PENDING = -1
+
+
+class LocationMatrix:
+    """Матриці постійних адрес у файлах `directory` (за замовчуванням поруч із базою)."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(os.path.dirname(os.path.abspath(db.DB_PATH)), STORE_DIR_NAME)
+        self._lock = threading.Lock()
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        try:
+            with open(self._path('index.json'), encoding='utf-8') as f: index = json.load(f)
+        except FileNotFoundError:
+            index = {'addresses': [], 'coords': []}
+        self.addresses, self.coords = index['addresses'], [tuple(c) for c in index['coords']]
+        self._by_address = {address: i for i, address in enumerate(self.addresses)}
+        self._by_coord = {matrix_engine.coord_key(c): i for i, c in enumerate(self.coords)}
+        self.distance = self.duration = None
+        if self.addresses:
+            self.distance = np.load(self._path('distance.npy'), mmap_mode='r+')
+            self.duration = np.load(self._path('duration.npy'), mmap_mode='r+')
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def lookup(self, coords):
+        """Індекси точок у матриці за координатами (-1 для точок, яких у ній немає)."""
+        return np.array([self._by_coord.get(matrix_engine.coord_key(c), -1) for c in coords], dtype=np.int64)
+
+    def _grow(self, size):
+        capacity = self.distance.shape[0] if self.distance is not None else 0
+        if size <= capacity: return
+        new_capacity = max(INITIAL_CAPACITY, capacity * 2)
+        while new_capacity < size: new_capacity *= 2
+        os.makedirs(self.directory, exist_ok=True)
+        for name in ('distance', 'duration'):
+            tmp = self._path(f"{name}.tmp.npy")
+            grown = np.lib.format.open_memmap(tmp, mode='w+', dtype=MATRIX_DTYPE, shape=(new_capacity, new_capacity))
+            grown[:] = PENDING
+            if capacity: grown[:capacity, :capacity] = getattr(self, name)
+            grown.flush(); del grown
+            os.replace(tmp, self._path(f"{name}.npy"))
+        self.distance = np.load(self._path('distance.npy'), mmap_mode='r+')
+        self.duration = np.load(self._path('duration.npy'), mmap_mode='r+')
+
+    def _save_index(self):
+        tmp = self._path('index.tmp.json')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'addresses': self.addresses, 'coords': self.coords}, f, ensure_ascii=False)
+        os.replace(tmp, self._path('index.json'))
+
+    def refresh(self, provider, addresses):
+        """Додає нові адреси та дозаповнює нерозраховані пари; `provider` — `routing.GoogleProvider`.
+
+        Для однієї нової адреси запитуються лише її рядок і стовпець. Повертає статистику оновлення.
+        """
+        with self._lock:
+            new = list(dict.fromkeys(a for a in addresses if db.normalize_address(a) not in self._by_address))
+            if new:
+                coords, _ = provider.geocode(new)
+                start = len(self)
+                self._grow(start + len(new))
+                for offset, (address, coord) in enumerate(zip(new, coords)):
+                    self.addresses.append(db.normalize_address(address)); self.coords.append(tuple(coord))
+                    self._by_address[self.addresses[-1]] = start + offset
+                    self._by_coord[matrix_engine.coord_key(coord)] = start + offset
+                    self.distance[start + offset, start + offset] = self.duration[start + offset, start + offset] = 0
+                self._save_index()
+            n = len(self)
+            if not n: return {'locations': 0, 'added': 0, 'cached_elements': 0, 'fetched_elements': 0, 'requests': 0}
+            pending = [tuple(pair) for pair in np.argwhere(self.distance[:n, :n] == PENDING).tolist()]
+            values, stats = matrix_engine.fetch_pairs(provider.client, self.coords, pending, cache=provider.cache)
+            self._store(pending, values, self.coords, self.distance, self.duration)
+            self.distance.flush(); self.duration.flush()
+        return {'locations': n, 'added': len(new), **stats}
+
+    @staticmethod
+    def _store(pairs, values, coords, distance, duration):
+        """Записує отримані пари; пари без значення — 0 для однакових координат, інакше UNREACHABLE."""
+        for i, j in pairs:
+            value = values.get((i, j))
+            if value is None:
+                same = matrix_engine.coord_key(coords[i]) == matrix_engine.coord_key(coords[j])
+                value = (0, 0) if same else (matrix_engine.UNREACHABLE, matrix_engine.UNREACHABLE)
+            distance[i, j], duration[i, j] = value
+
+    def matrix(self, client, coords, cache=None):
+        """(distance, duration, stats) для точок плану: відомі пари — з файлів, решта — через API.
+
+        Підматриця k×k точок плану копіюється з відображених файлів одним індексуванням (`np.ix_`
+        завжди копіює, але лише блок плану, а не всю матрицю) у масиви `MATRIX_DTYPE`, тож
+        `planner.create_data_model` приймає їх без перетворення типу. Копія потрібна й тому, що
+        пари з новими адресами дописуються в неї, а не у файли.
+        """
+        indices = self.lookup(coords)
+        # Файли могли перебудуватися паралельним оновленням: беремо масиви один раз, після індексів
+        stored_distance, stored_duration = self.distance, self.duration
+        known = np.flatnonzero(indices >= 0)
+        block = np.ix_(indices[known], indices[known])
+        if len(known) == len(coords):
+            distance, duration = np.asarray(stored_distance[block]), np.asarray(stored_duration[block])
+        else:
+            distance = np.full((len(coords), len(coords)), PENDING, dtype=MATRIX_DTYPE)
+            duration = distance.copy()
+            np.fill_diagonal(distance, 0); np.fill_diagonal(duration, 0)
+            distance[np.ix_(known, known)], duration[np.ix_(known, known)] = stored_distance[block], stored_duration[block]
+        pending = [tuple(pair) for pair in np.argwhere(distance == PENDING).tolist()]
+        values, stats = matrix_engine.fetch_pairs(client, coords, pending, cache=cache) if pending else ({}, None)
+        self._store(pending, values, coords, distance, duration)
+        in_matrix = indices >= 0
+        precomputed = len(known) * (len(known) - 1) - sum(1 for i, j in pending if in_matrix[i] and in_matrix[j])
+        stats = stats or {'cached_elements': 0, 'fetched_elements': 0, 'requests': 0}
+        return distance, duration, {**stats, 'cached_elements': stats['cached_elements'] + precomputed,
+                                    'precomputed_elements': precomputed}
+
+
+if __name__ == '__main__':
+    import googlemaps
+    import routing
+
+    parser = argparse.ArgumentParser(description="Оновлює матрицю відстаней для постійних адрес та депо.")
+    parser.add_argument('--depot', action='append', default=[], help="адреса депо (можна кілька разів)")
+    parser.add_argument('--db', default=db.DB_PATH, help="файл бази даних")
+    args = parser.parse_args()
+    db.DB_PATH = args.db
+    db.init_db()
+    provider = routing.GoogleProvider(googlemaps.Client(key=os.environ['GOOGLE_MAPS_API_KEY']))
+    addresses = args.depot + [row['address'] for row in db.get_saved_locations()]
+    print(json.dumps(LocationMatrix().refresh(provider, addresses), ensure_ascii=False))
@@ -0,0 +1,199 @@
+"""Тайлове, паралельне та кешоване отримання матриць відстаней і часу.
+
+Матриця N×N розбивається на тайли, що вкладаються в ліміти Distance Matrix API
+(не більше 25 точок з кожного боку та 100 елементів на запит). Тайли
+запитуються паралельно через обмежувач частоти, а кожна пара
+"звідки → куди" зберігається в кеші з ключем за координатами та часовим
+кошиком трафіку, тож повторне планування запитує лише відсутні пари.
+
+Клієнт передається ззовні: підійде `googlemaps.Client` або будь-який об'єкт
+з тим самим методом `distance_matrix` (наприклад, `benchmarks/fake_maps.py`).
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+import database as db
+
+MAX_LOCATIONS_PER_SIDE = 25
+MAX_ELEMENTS_PER_REQUEST = 100
+UNREACHABLE = 9999999
+TRAFFIC_BUCKET_MINUTES = 15
+
+
+class RateLimiter:
+    """Потокобезпечний обмежувач: не більше `requests_per_second` запитів за секунду."""
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now: time.sleep(slot - now)
+
+
+class SQLiteDistanceCache:
+    """Кеш пар у таблиці `distance_cache` бази даних додатку."""
+
+    def get_many(self, origin_keys, destination_keys, bucket):
+        return db.get_cached_distances(origin_keys, destination_keys, bucket)
+
+    def put_many(self, bucket, rows):
+        db.save_distances(bucket, rows)
+
+
+class MemoryDistanceCache:
+    """Кеш пар у пам'яті процесу (для бенчмарків та офлайн-запусків)."""
+
+    def __init__(self):
+        self.pairs = {}
+
+    def get_many(self, origin_keys, destination_keys, bucket):
+        origins, destinations = set(origin_keys), set(destination_keys)
+        return {(o, d): value for (o, d, b), value in self.pairs.items()
+                if b == bucket and o in origins and d in destinations}
+
+    def put_many(self, bucket, rows):
+        for origin, destination, distance, duration in rows:
+            self.pairs[(origin, destination, bucket)] = (distance, duration)
+
+
+def coord_key(coord):
+    """Ключ кешу для точки: координати з точністю ~1 м."""
+    return f"{coord[0]:.5f},{coord[1]:.5f}"
+
+
+def traffic_bucket(use_traffic, when=None):
+    """Часовий кошик трафіку: 'static' без трафіку, інакше день тижня та 15-хвилинний інтервал."""
+    if not use_traffic: return 'static'
+    when = when or datetime.now()
+    minute = when.minute // TRAFFIC_BUCKET_MINUTES * TRAFFIC_BUCKET_MINUTES
+    return f"{when.weekday()}-{when.hour:02d}:{minute:02d}"
+
+
+def _tile_shape(num_origins, num_destinations):
+    """Підбирає розмір тайла (рядки, стовпці) з мінімальною кількістю запитів."""
+    best = None
+    for rows in range(1, MAX_LOCATIONS_PER_SIDE + 1):
+        cols = min(MAX_LOCATIONS_PER_SIDE, MAX_ELEMENTS_PER_REQUEST // rows)
+        count = -(-num_origins // rows) * -(-num_destinations // cols)
+        if best is None or count < best[0]: best = (count, rows, cols)
+    return best[1], best[2]
+
+
+def _split(origins, destinations, missing=None):
+    rows, cols = _tile_shape(len(origins), len(destinations))
+    tiles = []
+    for r in range(0, len(origins), rows):
+        for c in range(0, len(destinations), cols):
+            tile = (origins[r:r + rows], destinations[c:c + cols])
+            if missing is None or any((i, j) in missing for i in tile[0] for j in tile[1]): tiles.append(tile)
+    return tiles
+
+
+def plan_tiles(missing_pairs, dense_ratio=0.5):
+    """Розбиває множину відсутніх пар (i, j) на тайли (origins, destinations) у межах лімітів API.
+
+    Якщо відсутні пари щільно заповнюють свій прямокутник (холодний старт),
+    він ріжеться на блоки. Інакше пари групуються за однаковим набором
+    відсутніх призначень, тому додавання однієї нової точки дає лише її рядок
+    і стовпець, а не повні блоки матриці.
+    """
+    missing = set(missing_pairs)
+    if not missing: return []
+    origins = sorted({i for i, _ in missing})
+    destinations = sorted({j for _, j in missing})
+    if len(missing) >= dense_ratio * len(origins) * len(destinations):
+        return _split(origins, destinations, missing)
+
+    by_origin = {}
+    for i, j in missing: by_origin.setdefault(i, set()).add(j)
+    groups = {}
+    for i, group_destinations in by_origin.items(): groups.setdefault(frozenset(group_destinations), []).append(i)
+    tiles = []
+    for group_destinations, group_origins in groups.items():
+        tiles.extend(_split(sorted(group_origins), sorted(group_destinations)))
+    return tiles
+
+
+def _fetch_tile(client, limiter, coords, tile, departure_time):
+    origins, destinations = tile
+    limiter.wait()
+    result = client.distance_matrix(origins=[coords[i] for i in origins],
+                                    destinations=[coords[j] for j in destinations],
+                                    mode="driving", departure_time=departure_time)
+    values = []
+    for i, row in zip(origins, result['rows']):
+        for j, element in zip(destinations, row['elements']):
+            if element['status'] != 'OK':
+                values.append((i, j, None, None)); continue
+            duration_key = 'duration_in_traffic' if 'duration_in_traffic' in element else 'duration'
+            values.append((i, j, element['distance']['value'], element[duration_key]['value']))
+    return values
+
+
+def fetch_pairs(client, coords, pairs, use_traffic=False, cache=None, max_workers=4, requests_per_second=10):
+    """Відстані та час для пар індексів (i, j) точок `coords`: ({(i, j): (distance, duration)}, stats).
+
+    Пари беруться з кешу, відсутні запитуються тайлами (`plan_tiles`), тож рядок і стовпець однієї
+    нової точки коштують лише їхніх елементів. Пари однієї й тієї самої точки та пари, для яких
+    API не знайшов маршруту, у результат не потрапляють.
+    """
+    cache = cache if cache is not None else SQLiteDistanceCache()
+    keys = [coord_key(c) for c in coords]
+    bucket = traffic_bucket(use_traffic)
+    pairs = [(i, j) for i, j in pairs if keys[i] != keys[j]]
+    if not pairs: return {}, {'cached_elements': 0, 'fetched_elements': 0, 'requests': 0}
+
+    cached = cache.get_many(list(dict.fromkeys(keys[i] for i, _ in pairs)),
+                            list(dict.fromkeys(keys[j] for _, j in pairs)), bucket)
+    values, missing = {}, []
+    for i, j in pairs:
+        value = cached.get((keys[i], keys[j]))
+        if value is None: missing.append((i, j))
+        else: values[(i, j)] = value
+    hits = len(values)
+
+    tiles = plan_tiles(missing)
+    if tiles:
+        limiter = RateLimiter(requests_per_second)
+        departure_time = 'now' if use_traffic else None
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(lambda tile: _fetch_tile(client, limiter, coords, tile, departure_time), tiles))
+        fresh = {}
+        for tile_values in results:
+            for i, j, dist, dur in tile_values:
+                if dist is None or keys[i] == keys[j]: continue
+                values[(i, j)] = (dist, dur)
+                fresh[(keys[i], keys[j])] = (dist, dur)
+        cache.put_many(bucket, [(o, d, dist, dur) for (o, d), (dist, dur) in fresh.items()])
+
+    return values, {'cached_elements': hits, 'fetched_elements': len(missing), 'requests': len(tiles)}
+
+
+def fetch_matrices(client, coords, use_traffic=False, cache=None, max_workers=4, requests_per_second=10):
+    """Повертає (distance_matrix, duration_matrix, stats) як масиви int32 розміру N×N.
+
+    `cache` — об'єкт з методами `get_many`/`put_many` (за замовчуванням SQLite-кеш);
+    `stats` містить кількість елементів з кешу, отриманих з API та кількість запитів.
+    """
+    n = len(coords)
+    keys = [coord_key(c) for c in coords]
+    distance = np.full((n, n), UNREACHABLE, dtype=np.int32)
+    duration = np.full((n, n), UNREACHABLE, dtype=np.int32)
+    # Діагональ і пари точок з однаковими координатами — нульові
+    same = np.equal.outer(np.array(keys, dtype=object), np.array(keys, dtype=object)).astype(bool)
+    distance[same] = duration[same] = 0
+    rows, cols = np.nonzero(~same)
+    values, stats = fetch_pairs(client, coords, zip(rows.tolist(), cols.tolist()), use_traffic, cache, max_workers,
+                                requests_per_second)
+    for (i, j), (dist, dur) in values.items(): distance[i, j], duration[i, j] = dist, dur
+    return distance, duration, stats
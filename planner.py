@@ -0,0 +1,281 @@
+"""Модель даних та налаштування розв'язувача OR-Tools для задачі VRPTW.
+
+Матриці відстаней, часу та вектор попиту зберігаються як цілочисельні масиви
+NumPy і реєструються в OR-Tools через `RegisterTransitMatrix` /
+`RegisterUnaryTransitVector`, тож під час пошуку оцінка дуг виконується
+в C++ без викликів Python. OR-Tools імпортується лише функціями, що будують
+модель, тож допоміжні функції модуля доступні без завантаження розв'язувача.
+"""
+import random
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+
+MATRIX_DTYPE = np.int32
+LOCATION_COLUMNS = ['id', 'name', 'address', 'type', 'weight', 'time_from', 'time_to']
+TIME_SLACK_SECONDS = 3600
+HORIZON_SECONDS = 24 * 3600
+PROGRESS_INTERVAL_SECONDS = 0.5
+STOP_POLL_INTERVAL_SECONDS = 0.2
+WARM_START_TIME_LIMIT_SECONDS = 1
+DROP_PENALTY = 10 ** 9
+ROUTE_STOP_FIELDS = ('sequence', 'node', 'name', 'arrival_seconds', 'departure_seconds', 'load_kg',
+                     'leg_distance_m')
+
+
+def time_column_to_seconds(column):
+    """Переводить колонку часу (datetime.time або рядки 'H:MM'/'HH.MM'/'HH:MM[:SS]') у секунди від початку доби."""
+    parts = column.astype(str).str.strip().str.split(r'[:.]', n=2, expand=True, regex=True)
+    return parts[0].astype(np.int64).to_numpy() * 3600 + parts[1].astype(np.int64).to_numpy() * 60
+
+
+def build_locations_df(depot_address, depot_working_hours, requests):
+    """Повертає таблицю точок рейсу: депо в рядку 0, далі заявки (список словників або DataFrame)."""
+    requests_df = requests if isinstance(requests, pd.DataFrame) else pd.DataFrame(requests, columns=LOCATION_COLUMNS)
+    depot_df = pd.DataFrame({"id": [0], "name": ["Депо"], "address": [depot_address], "type": ["Депо"], "weight": [0],
+                             "time_from": [depot_working_hours[0]], "time_to": [depot_working_hours[1]]})
+    return pd.concat([depot_df, requests_df[LOCATION_COLUMNS]], ignore_index=True)
+
+
+def create_data_model(locations_df, vehicles_df, distance_matrix, duration_matrix, service_time_seconds,
+                      depot_working_hours):
+    """Створює словник з даними для розв'язувача OR-Tools.
+
+    Усі значення обчислюються по колонках: вікна часу — масив (N, 2),
+    попит та матриці — компактні цілочисельні масиви.
+    """
+    distance = np.asarray(distance_matrix, dtype=MATRIX_DTYPE)
+    duration = np.asarray(duration_matrix, dtype=MATRIX_DTYPE)
+    # Час обслуговування вже враховано в матриці часу: дуга i -> j = їзда + обслуговування
+    time_matrix = duration + MATRIX_DTYPE(service_time_seconds)
+
+    demands = np.abs(locations_df['weight'].to_numpy(dtype=MATRIX_DTYPE))
+    demands[0] = 0
+
+    time_windows = np.column_stack((time_column_to_seconds(locations_df['time_from']),
+                                    time_column_to_seconds(locations_df['time_to'])))
+    time_windows[0] = [t.hour * 3600 + t.minute * 60 for t in depot_working_hours]
+
+    return {
+        'distance_matrix': distance, 'duration_matrix': duration, 'time_matrix': time_matrix,
+        'demands': demands, 'time_windows': time_windows,
+        'vehicle_capacities': vehicles_df['capacity'].astype(int).tolist(),
+        'num_vehicles': len(vehicles_df), 'depot': 0,
+        'location_names': locations_df['name'].tolist(),
+        'vehicle_names': vehicles_df['name'].tolist(),
+        'vehicle_fuel_consumptions': vehicles_df['fuel_consumption'].tolist(),
+        'service_time': service_time_seconds
+    }
+
+
+def vehicle_fixed_costs(vehicle_capacities, base_vehicle_cost, capacity_cost_coefficient):
+    """Фіксована вартість залучення кожного авто (в метрах, як і вартість дуг)."""
+    return [int((base_vehicle_cost + (capacity / 1000.0) * capacity_cost_coefficient) * 1000)
+            for capacity in vehicle_capacities]
+
+
+def build_routing_model(data, fixed_costs):
+    """Створює (manager, routing, time_dimension) з нативно зареєстрованими матрицями."""
+    from ortools.constraint_solver import pywrapcp
+    manager = pywrapcp.RoutingIndexManager(len(data['distance_matrix']), data['num_vehicles'], data['depot'])
+    routing = pywrapcp.RoutingModel(manager)
+
+    for i, cost in enumerate(fixed_costs): routing.SetFixedCostOfVehicle(cost, i)
+
+    dist_cb = routing.RegisterTransitMatrix(data['distance_matrix'].tolist())
+    routing.SetArcCostEvaluatorOfAllVehicles(dist_cb)
+
+    demand_cb = routing.RegisterUnaryTransitVector(data['demands'].tolist())
+    routing.AddDimensionWithVehicleCapacity(demand_cb, 0, data['vehicle_capacities'], True, 'Capacity')
+
+    time_cb = routing.RegisterTransitMatrix(data['time_matrix'].tolist())
+    routing.AddDimension(time_cb, TIME_SLACK_SECONDS, HORIZON_SECONDS, False, "Time")
+    time_dim = routing.GetDimensionOrDie("Time")
+    for loc_idx, time_win in enumerate(data['time_windows']):
+        if loc_idx != 0: time_dim.CumulVar(manager.NodeToIndex(loc_idx)).SetRange(int(time_win[0]), int(time_win[1]))
+    for i in range(data['num_vehicles']):
+        time_dim.CumulVar(routing.Start(i)).SetRange(int(data['time_windows'][0][0]), int(data['time_windows'][0][1]))
+    return manager, routing, time_dim
+
+
+def default_search_parameters(time_limit_seconds=20, first_solution='PATH_CHEAPEST_ARC',
+                              metaheuristic='GUIDED_LOCAL_SEARCH', seed=0):
+    """Параметри пошуку; стратегії задаються іменами з enum-ів OR-Tools.
+
+    Routing-пошук OR-Tools не має власного seed, тому ненульовий `seed`
+    детерміновано змінює коефіцієнт штрафів GLS, щоб паралельні запуски
+    однієї стратегії йшли різними траєкторіями.
+    """
+    from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+    params = pywrapcp.DefaultRoutingSearchParameters()
+    params.first_solution_strategy = getattr(routing_enums_pb2.FirstSolutionStrategy, first_solution)
+    params.local_search_metaheuristic = getattr(routing_enums_pb2.LocalSearchMetaheuristic, metaheuristic)
+    if seed: params.guided_local_search_lambda_coefficient = random.Random(seed).uniform(0.05, 0.3)
+    params.time_limit.FromSeconds(time_limit_seconds)
+    return params
+
+
+def _solve_warm(data, fixed_costs, initial_routes, time_limit_seconds, on_solution, should_stop, strategy):
+    """Короткий пошук від попередніх маршрутів; None, якщо їх не вдалося прочитати або вставити всі точки."""
+    manager, routing, time_dim = build_routing_model(data, fixed_costs)
+    # Штраф за пропуск дозволяє прочитати часткові маршрути: нові точки спочатку не обслуговуються,
+    # а оператори вставки локального пошуку додають їх у найдешевші позиції
+    nodes = range(1, len(data['distance_matrix']))
+    for node in nodes: routing.AddDisjunction([manager.NodeToIndex(node)], DROP_PENALTY)
+    if on_solution is not None:
+        routing.AddAtSolutionCallback(lambda: on_solution(routing.CostVar().Value()))
+    if should_stop is not None:
+        routing.AddSearchMonitor(routing.solver().CustomLimit(should_stop))
+    assignment = routing.ReadAssignmentFromRoutes(initial_routes, True)
+    if assignment is None: return None
+    solution = routing.SolveFromAssignmentWithParameters(
+        assignment, default_search_parameters(time_limit_seconds, **(strategy or {})))
+    if not solution: return None
+    if any(solution.Value(routing.NextVar(manager.NodeToIndex(node))) == manager.NodeToIndex(node) for node in nodes):
+        return None
+    return manager, routing, time_dim, solution
+
+
+def solve(data, fixed_costs, time_limit_seconds=20, on_solution=None, should_stop=None, strategy=None,
+          initial_routes=None, warm_time_limit_seconds=WARM_START_TIME_LIMIT_SECONDS):
+    """Будує модель і розв'язує її; повертає словник з маршрутами або None, якщо рішення немає.
+
+    `on_solution(objective)` викликається на кожне знайдене рішення,
+    `should_stop()` періодично опитується пошуком і може достроково його зупинити,
+    `strategy` — словник з ключами `first_solution`, `metaheuristic`, `seed`.
+    `initial_routes` — список вузлів для кожного авто з попереднього плану: тоді
+    виконується лише вставка нових точок і короткий пошук (`warm_time_limit_seconds`),
+    а якщо це не вдалося — звичайний розрахунок з нуля.
+    """
+    warm, started = None, time.perf_counter()
+    if initial_routes is not None:
+        warm = _solve_warm(data, fixed_costs, initial_routes, warm_time_limit_seconds, on_solution, should_stop,
+                           strategy)
+    if warm is not None:
+        manager, routing, time_dim, solution = warm
+    else:
+        manager, routing, time_dim = build_routing_model(data, fixed_costs)
+        if on_solution is not None:
+            routing.AddAtSolutionCallback(lambda: on_solution(routing.CostVar().Value()))
+        if should_stop is not None:
+            routing.AddSearchMonitor(routing.solver().CustomLimit(should_stop))
+        solution = routing.SolveWithParameters(default_search_parameters(time_limit_seconds, **(strategy or {})))
+        if not solution: return None
+    solved = time.perf_counter()
+    solution_text, routes_data, total_dist = get_solution_routes(data, manager, routing, solution, time_dim)
+    return {'solution_text': solution_text, 'routes_data': routes_data, 'total_distance_km': total_dist,
+            'objective': solution.ObjectiveValue(), 'warm_start': warm is not None,
+            'solve_seconds': solved - started, 'extract_seconds': time.perf_counter() - solved}
+
+
+def solve_with_progress(data, fixed_costs, time_limit_seconds, progress, stop_event, strategy=None,
+                        initial_routes=None):
+    """Точка входу для процесів пулу: розв'язує модель та публікує прогрес у спільний словник.
+
+    `progress` — проксі `multiprocessing.Manager().dict()`, `stop_event` — спільний Event,
+    встановлення якого достроково завершує пошук.
+    """
+    started = time.monotonic()
+    progress['started_at'] = time.time()
+    state = {'best': None, 'solutions': 0, 'pushed_at': 0.0, 'checked_at': 0.0, 'stopped': False, 'improvements': []}
+
+    def on_solution(objective):
+        state['solutions'] += 1
+        improved = state['best'] is None or objective < state['best']
+        now = time.monotonic()
+        if improved:
+            state['best'] = objective
+            state['improvements'].append((round(now - started, 3), objective))
+        if state['solutions'] == 1: progress['first_solution_seconds'] = now - started
+        # Звертання до спільного словника — це IPC, тому оновлюємо його не частіше за інтервал
+        if improved or now - state['pushed_at'] >= PROGRESS_INTERVAL_SECONDS:
+            progress.update({'best_objective': state['best'], 'solutions': state['solutions']})
+            if improved: progress['improved_at'] = time.time()
+            state['pushed_at'] = now
+
+    def should_stop():
+        now = time.monotonic()
+        if now - state['checked_at'] >= STOP_POLL_INTERVAL_SECONDS:
+            state['checked_at'] = now
+            state['stopped'] = stop_event.is_set()
+        return state['stopped']
+
+    result = solve(data, fixed_costs, time_limit_seconds, on_solution=on_solution, should_stop=should_stop,
+                   strategy=strategy, initial_routes=initial_routes)
+    progress.update({'best_objective': state['best'], 'solutions': state['solutions']})
+    if result is not None:
+        improvements = state['improvements']
+        result['solver_stats'] = {'solutions': state['solutions'], 'solve_seconds': result['solve_seconds'],
+                                  'extract_seconds': result['extract_seconds'],
+                                  'first_solution_seconds': improvements[0][0] if improvements else None,
+                                  'objective_progress': instrumentation.thin(improvements)}
+    return {'result': result, 'cancelled': state['stopped']}
+
+
+# ==== ОНОВЛЕНА ФУНКЦІЯ ДЛЯ ПРАВИЛЬНОГО ПІДРАХУНКУ ВІДСТАНІ ====
+def get_solution_routes(data, manager, routing, solution, time_dimension):
+    """Один прохід по кожному маршруту; повертає (текстовий звіт, routes_data, загальний пробіг у км).
+
+    Кожен маршрут у routes_data містить `stops` — записи зупинок з полями ROUTE_STOP_FIELDS
+    (перший і останній запис — депо); текст маршруту будується з них.
+    """
+    routes_data = []
+    total_dist_actual = 0
+    distance_matrix, demands, service_time = data['distance_matrix'], data['demands'], data['service_time']
+
+    for vehicle_id in range(data['num_vehicles']):
+        index = routing.Start(vehicle_id)
+        if routing.IsEnd(solution.Value(routing.NextVar(index))): continue
+
+        stops, route_load, prev_node = [], 0, None
+        while True:
+            node_idx, is_end = manager.IndexToNode(index), routing.IsEnd(index)
+            route_load += int(demands[node_idx])
+            arrival_seconds = int(solution.Min(time_dimension.CumulVar(index)))
+            # Підсумовуємо реальну відстань з матриці, а не "вартість" з оптимізатора
+            leg_distance = int(distance_matrix[prev_node][node_idx]) if prev_node is not None else 0
+            stops.append({'sequence': len(stops), 'node': node_idx, 'name': data['location_names'][node_idx],
+                          'arrival_seconds': arrival_seconds,
+                          'departure_seconds': arrival_seconds + (service_time if node_idx != data['depot'] else 0),
+                          'load_kg': route_load, 'leg_distance_m': leg_distance})
+            if is_end: break
+            prev_node, index = node_idx, solution.Value(routing.NextVar(index))
+
+        route_distance = sum(stop['leg_distance_m'] for stop in stops)
+        total_dist_actual += route_distance
+        distance_km = route_distance / 1000.0
+        fuel_spent = (distance_km / 100.0) * data['vehicle_fuel_consumptions'][vehicle_id]
+
+        routes_data.append({'vehicle_name': data['vehicle_names'][vehicle_id],
+                            'vehicle_capacity': data['vehicle_capacities'][vehicle_id],
+                            'route_text': render_route_text(stops),
+                            'distance_km': distance_km, 'load': route_load, 'fuel_spent': fuel_spent,
+                            'vehicle_index': vehicle_id, 'nodes': [stop['node'] for stop in stops], 'stops': stops})
+
+    return render_solution_report(routes_data, total_dist_actual / 1000), routes_data, total_dist_actual / 1000
+
+
+def render_route_text(stops):
+    """Рядок маршруту "Точка (приб. о ...) -> ... -> Депо (пов. о ...)" із записів зупинок (словники або рядки БД)."""
+    labels = [f"{stop['name']} (приб. о {timedelta(seconds=int(stop['arrival_seconds']))})" for stop in stops[:-1]]
+    labels.append(f"{stops[-1]['name']} (пов. о {timedelta(seconds=int(stops[-1]['arrival_seconds']))})")
+    return ' -> '.join(labels)
+
+
+def render_solution_report(routes_data, total_distance_km):
+    """Текстовий звіт рейсу (markdown) за списком маршрутів."""
+    routes_output = ""
+    for route in routes_data:
+        routes_output += f"🚐 **{route['vehicle_name']}** ({route['vehicle_capacity']}кг):\n"
+        routes_output += f"   - Маршрут: **{route['route_text']}**\n"
+        routes_output += f"   - Відстань: **{route['distance_km']:.2f} км**\n"
+        routes_output += f"   - Завантаження: **{route['load']} кг**\n"
+        routes_output += f"   - Паливо: **{route['fuel_spent']:.2f} л**\n\n"
+
+    final_report = f"🎯 **Задіяно автомобілів: {len(routes_data)}**\n"
+    final_report += f"🛣️ **Загальний пробіг: {total_distance_km:.2f} км**\n\n" + routes_output
+    return final_report
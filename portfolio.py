@@ -0,0 +1,112 @@
+"""Портфель стратегій: паралельний розв'язок однієї моделі кількома налаштуваннями пошуку.
+
+Кожен учасник портфеля — пара (стратегія першого рішення, метаевристика) зі
+своїм seed — працює в окремому процесі пулу. Координатор опитує їхній прогрес
+і зупиняє всіх одночасно, щойно учасники зійшлися до однієї цілі або найкраще
+рішення портфеля перестало покращуватися. Повертається найкращий результат
+разом зі звітом, яка стратегія перемогла.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import planner
+
+DEFAULT_MEMBERS = [
+    ('PATH_CHEAPEST_ARC', 'GUIDED_LOCAL_SEARCH'),
+    ('PARALLEL_CHEAPEST_INSERTION', 'GUIDED_LOCAL_SEARCH'),
+    ('SAVINGS', 'GUIDED_LOCAL_SEARCH'),
+    ('PATH_CHEAPEST_ARC', 'SIMULATED_ANNEALING'),
+    ('LOCAL_CHEAPEST_INSERTION', 'TABU_SEARCH'),
+    ('CHRISTOFIDES', 'GUIDED_LOCAL_SEARCH'),
+    ('PATH_MOST_CONSTRAINED_ARC', 'GUIDED_LOCAL_SEARCH'),
+    ('PARALLEL_CHEAPEST_INSERTION', 'SIMULATED_ANNEALING'),
+]
+PLATEAU_SECONDS = 5
+AGREEMENT_TOLERANCE = 0.0
+POLL_INTERVAL_SECONDS = 0.25
+
+
+def portfolio_members(count=None):
+    """Перші `count` учасників (за замовчуванням — за кількістю ядер).
+
+    Понад DEFAULT_MEMBERS повторюються лише учасники з GLS: seed змінює тільки коефіцієнт
+    штрафів GLS (`planner.default_search_parameters`), тож повтор іншої метаевристики
+    пройшов би той самий пошук. Кожен повтор отримує наступний seed (1, 2, ...).
+    """
+    count = count or os.cpu_count() or 1
+    members = [{'first_solution': first_solution, 'metaheuristic': metaheuristic, 'seed': 0}
+               for first_solution, metaheuristic in DEFAULT_MEMBERS[:count]]
+    repeatable = [member for member in DEFAULT_MEMBERS if member[1] == 'GUIDED_LOCAL_SEARCH']
+    for i in range(count - len(members)):
+        first_solution, metaheuristic = repeatable[i % len(repeatable)]
+        members.append({'first_solution': first_solution, 'metaheuristic': metaheuristic,
+                        'seed': 1 + i // len(repeatable)})
+    return members
+
+
+def member_label(member):
+    label = f"{member['first_solution']} + {member['metaheuristic']}"
+    return f"{label} (seed {member['seed']})" if member.get('seed') else label
+
+
+def solve_portfolio(data, fixed_costs, time_limit_seconds, submit, mp_manager, members=None,
+                    plateau_seconds=PLATEAU_SECONDS, agreement_tolerance=AGREEMENT_TOLERANCE,
+                    stop_event=None, on_progress=None):
+    """Розв'язує модель портфелем стратегій і повертає результат `planner.solve` зі звітом `portfolio`.
+
+    `submit(fn, *args)` ставить задачу в пул процесів і повертає Future,
+    `mp_manager` — `multiprocessing.Manager` для спільних словників та Event.
+    Зовнішній `stop_event` дозволяє скасувати весь портфель.
+    """
+    members = members or portfolio_members()
+    stop = mp_manager.Event()
+    progresses = [mp_manager.dict() for _ in members]
+    futures = [submit(planner.solve_with_progress, data, fixed_costs, time_limit_seconds, progress, stop, member)
+               for member, progress in zip(members, progresses)]
+
+    started, best, improved_at, stop_reason = time.monotonic(), None, time.monotonic(), 'time_limit'
+    while not all(future.done() for future in futures):
+        snapshots = [dict(progress) for progress in progresses]
+        found = [s['best_objective'] for s in snapshots if s.get('best_objective') is not None]
+        if found and (best is None or min(found) < best):
+            best, improved_at = min(found), time.monotonic()
+        if on_progress is not None:
+            on_progress({'best_objective': best, 'solutions': sum(s.get('solutions', 0) for s in snapshots),
+                         'first_solution_seconds': min((s['first_solution_seconds'] for s in snapshots
+                                                        if 'first_solution_seconds' in s), default=None)})
+        if not stop.is_set() and stop_event is not None and stop_event.is_set():
+            stop_reason = 'cancelled'; stop.set()
+        if not stop.is_set() and best is not None:
+            if len(members) > 1 and len(found) == len(members) and max(found) <= best * (1 + agreement_tolerance):
+                stop_reason = 'agreement'; stop.set()
+            elif time.monotonic() - improved_at >= plateau_seconds:
+                stop_reason = 'plateau'; stop.set()
+        time.sleep(POLL_INTERVAL_SECONDS)
+
+    outcomes = [future.result() for future in futures]
+    report = []
+    for member, progress, outcome in zip(members, progresses, outcomes):
+        result = outcome['result']
+        report.append({'strategy': member_label(member), **member,
+                       'objective': result['objective'] if result else None,
+                       'solutions': progress.get('solutions', 0),
+                       'first_solution_seconds': progress.get('first_solution_seconds')})
+    solved = [i for i, outcome in enumerate(outcomes) if outcome['result'] is not None]
+    if not solved: return None
+    winner = min(solved, key=lambda i: outcomes[i]['result']['objective'])
+    for i, row in enumerate(report): row['is_winner'] = i == winner
+    result = dict(outcomes[winner]['result'])
+    result['portfolio'] = {'winner': report[winner]['strategy'], 'stop_reason': stop_reason,
+                           'elapsed_seconds': time.monotonic() - started, 'members': report}
+    return result
+
+
+def run_portfolio(data, fixed_costs, time_limit_seconds=20, members=None, **kwargs):
+    """Самостійний запуск портфеля з власним пулом (для скриптів та бенчмарків поза Streamlit)."""
+    members = members or portfolio_members()
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as mp_manager, \
+            ProcessPoolExecutor(max_workers=len(members), mp_context=context) as executor:
+        return solve_portfolio(data, fixed_costs, time_limit_seconds, executor.submit, mp_manager, members, **kwargs)
@@ -0,0 +1,209 @@
+"""Заявки сесії в колонковій формі та масовий імпорт із CSV/XLSX.
+
+Заявки тримаються в `st.session_state` як один DataFrame з компактними
+типами колонок (int32 для id та ваги, категорія для типу, час як рядок
+'HH:MM'), а не список словників. Файли замовлень читаються частинами
+(`IMPORT_CHUNK_ROWS` рядків), кожна частина валідується й нормалізується
+векторно; редактор показує лише одну сторінку заявок.
+"""
+import csv
+import io
+import re
+
+import numpy as np
+import pandas as pd
+
+import planner
+
+REQUEST_COLUMNS = planner.LOCATION_COLUMNS
+REQUEST_TYPES = ('Доставка', 'Забір')
+IMPORT_CHUNK_ROWS = 2000
+EDITOR_PAGE_SIZE = 50
+MAX_REPORTED_ERRORS = 50
+DEFAULT_TIME_WINDOW = ('09:00', '17:00')
+
+# Назви колонок у вивантаженнях системи замовлень -> колонки заявки
+COLUMN_ALIASES = {
+    'name': 'name', 'назва': 'name', 'клієнт': 'name', 'назва клієнта': 'name', 'client': 'name',
+    'address': 'address', 'адреса': 'address',
+    'type': 'type', 'тип': 'type', 'тип заявки': 'type',
+    'weight': 'weight', 'вага': 'weight', 'вага (кг)': 'weight', 'вага, кг': 'weight',
+    'time_from': 'time_from', 'від': 'time_from', 'час від': 'time_from', 'з': 'time_from',
+    'time_to': 'time_to', 'до': 'time_to', 'час до': 'time_to', 'по': 'time_to',
+}
+TYPE_ALIASES = {'доставка': 'Доставка', 'delivery': 'Доставка', 'd': 'Доставка',
+                'забір': 'Забір', 'pickup': 'Забір', 'p': 'Забір'}
+_TIME_RE = re.compile(r'^\s*(\d{1,2})[:.](\d{2})(?::\d{2})?\s*$')
+
+
+def empty():
+    return _typed(pd.DataFrame({column: [] for column in REQUEST_COLUMNS}))
+
+
+def _typed(df):
+    """Приводить колонки до компактних типів сховища."""
+    return df.astype({'id': np.int32, 'name': object, 'address': object, 'weight': np.int32,
+                      'time_from': object, 'time_to': object}).assign(
+        type=pd.Categorical(df['type'], categories=REQUEST_TYPES))[REQUEST_COLUMNS]
+
+
+def normalize_time(value):
+    """'9:00', '09.00', '9:00:00', datetime.time -> '09:00'; None, якщо час не розпізнано."""
+    if hasattr(value, 'strftime'): return value.strftime('%H:%M')
+    match = _TIME_RE.match(str(value)) if value is not None else None
+    if not match: return None
+    hours, minutes = int(match.group(1)), int(match.group(2))
+    return f"{hours:02d}:{minutes:02d}" if hours < 24 and minutes < 60 else None
+
+
+def clean_text(value):
+    """Прибирає зайві пробіли та коми по краях; порожні клітинки дають ''."""
+    return ' '.join(str(value).split()).strip(' ,') if value is not None and not pd.isna(value) else ''
+
+
+def normalize(raw, first_id=1, first_row=1):
+    """Валідує та нормалізує частину заявок.
+
+    Повертає (DataFrame сховища з id від `first_id`, [(номер рядка, помилка)]);
+    `first_row` — номер першого рядка частини у файлі для повідомлень.
+    """
+    raw = raw.reindex(columns=REQUEST_COLUMNS[1:])
+    address = raw['address'].map(clean_text)
+    name = raw['name'].map(clean_text)
+    name = name.where(name != '', address)
+    request_type = raw['type'].fillna('Доставка').astype(str).str.strip().str.lower().map(TYPE_ALIASES)
+    weight = pd.to_numeric(raw['weight'], errors='coerce').astype('float64')
+    time_from = raw['time_from'].fillna(DEFAULT_TIME_WINDOW[0]).map(normalize_time)
+    time_to = raw['time_to'].fillna(DEFAULT_TIME_WINDOW[1]).map(normalize_time)
+    # 'HH:MM' порівнюються як рядки; нерозпізнаний час ('') відсіює попередня перевірка
+    window_from, window_to = time_from.fillna(''), time_to.fillna('')
+
+    checks = [(address == '', "порожня адреса"),
+              (request_type.isna(), f"тип заявки має бути одним із: {', '.join(REQUEST_TYPES)}"),
+              (weight.isna() | (weight <= 0), "вага має бути додатним числом"),
+              (time_from.isna() | time_to.isna(), "час має бути у форматі ГГ:ХХ"),
+              (window_from >= window_to, "початок вікна не раніше за кінець")]
+    invalid = np.zeros(len(raw), dtype=bool)
+    errors = []
+    for mask, message in checks:
+        mask = mask.to_numpy() & ~invalid
+        errors.extend((first_row + int(i), message) for i in np.flatnonzero(mask))
+        invalid |= mask
+    valid = ~invalid
+    df = pd.DataFrame({'id': np.arange(first_id, first_id + valid.sum()), 'name': name[valid].to_numpy(),
+                       'address': address[valid].to_numpy(), 'type': request_type[valid].to_numpy(),
+                       'weight': np.ceil(weight[valid].to_numpy()), 'time_from': time_from[valid].to_numpy(),
+                       'time_to': time_to[valid].to_numpy()})
+    return _typed(df), sorted(errors)
+
+
+def _rename(columns):
+    return {column: COLUMN_ALIASES.get(str(column).strip().lower(), column) for column in columns}
+
+
+def _csv_chunks(data, chunk_rows):
+    text = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', newline='')
+    try:
+        dialect = csv.Sniffer().sniff(text.read(4096), delimiters=',;\t')
+        delimiter = dialect.delimiter
+    except csv.Error:
+        delimiter = ','
+    text.seek(0)
+    for chunk in pd.read_csv(text, sep=delimiter, dtype=str, chunksize=chunk_rows, skipinitialspace=True):
+        yield chunk.rename(columns=_rename(chunk.columns))
+
+
+def _xlsx_chunks(data, chunk_rows):
+    from openpyxl import load_workbook
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = list(_rename(next(rows, ())).values())
+        batch = []
+        for row in rows:
+            if not any(cell is not None for cell in row): continue
+            batch.append(row)
+            if len(batch) == chunk_rows:
+                yield pd.DataFrame(batch, columns=header); batch = []
+        if batch: yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+
+def import_file(data, filename, first_id=1, chunk_rows=IMPORT_CHUNK_ROWS, on_chunk=None):
+    """Читає CSV/XLSX (байти файлу) частинами та повертає (DataFrame сховища, [(рядок, помилка)]).
+
+    Номери рядків у помилках відповідають рядкам файлу (заголовок — рядок 1).
+    `on_chunk(оброблено рядків)` викликається після кожної частини.
+    """
+    reader = _xlsx_chunks if filename.lower().endswith(('.xlsx', '.xlsm')) else _csv_chunks
+    parts, errors, chunk_id, next_row = [], [], first_id, 2
+    for chunk in reader(data, chunk_rows):
+        part, chunk_errors = normalize(chunk, chunk_id, next_row)
+        parts.append(part); errors.extend(chunk_errors)
+        chunk_id += len(part); next_row += len(chunk)
+        if on_chunk: on_chunk(next_row - 2)
+    return (pd.concat(parts, ignore_index=True) if parts else empty()), errors
+
+
+def from_records(records, first_id=1):
+    """Сховище зі списку словників (форма, тестові дані, заявки збереженого рейсу)."""
+    raw = pd.DataFrame(list(records), columns=REQUEST_COLUMNS[1:])
+    return normalize(raw, first_id)[0]
+
+
+def append(store, part):
+    """Додає заявки в кінець сховища, перенумеровуючи їх після останнього id."""
+    part = part.assign(id=np.arange(next_id(store), next_id(store) + len(part), dtype=np.int32))
+    return _typed(pd.concat([store, part], ignore_index=True)) if len(store) else part
+
+
+def next_id(store):
+    return int(store['id'].max()) + 1 if len(store) else 1
+
+
+def page_count(store, page_size=EDITOR_PAGE_SIZE):
+    return max(-(-len(store) // page_size), 1)
+
+
+def get_page(store, page, page_size=EDITOR_PAGE_SIZE):
+    return store.iloc[page * page_size:(page + 1) * page_size]
+
+
+def replace_page(store, page, edited, page_size=EDITOR_PAGE_SIZE):
+    """Повертає сховище, де сторінку `page` замінено відредагованими рядками.
+
+    Рядки, додані в редакторі, отримують нові id; нормалізація та сама, що й при імпорті.
+    Некоректний новий рядок відкидається, а некоректна правка наявної заявки — ні: заявка
+    лишається такою, як була до правки. Повертає (сховище, [(рядок сторінки, помилка)]).
+    """
+    start = page * page_size
+    edited = edited.reset_index(drop=True)
+    part, errors = normalize(edited, first_row=1)
+    ids = pd.to_numeric(edited.reindex(columns=['id'])['id'], errors='coerce').astype('float64').to_numpy(copy=True)
+    valid = np.ones(len(edited), dtype=bool)
+    valid[[row - 1 for row, _ in errors]] = False
+    # Наявні заявки зберігають свої id, нові (id порожній) отримують наступні за сховищем
+    fresh = np.isnan(ids) & valid
+    ids[fresh] = next_id(store) + np.arange(fresh.sum())
+    part = part.assign(id=ids[valid].astype(np.int32), _row=np.flatnonzero(valid))
+    # Заявка зникає зі сховища лише після видалення рядка, а не через невдалу правку
+    original = store.iloc[start:start + page_size]
+    kept = ~valid & np.isin(ids, original['id'].to_numpy())
+    kept_rows = original.set_index('id').loc[ids[kept].astype(np.int32)].reset_index()
+    edited_page = pd.concat([part, kept_rows.assign(_row=np.flatnonzero(kept))], ignore_index=True)
+    edited_page = edited_page.sort_values('_row', kind='stable').drop(columns='_row')
+    merged = pd.concat([store.iloc[:start], edited_page, store.iloc[start + page_size:]], ignore_index=True)
+    return _typed(merged), errors
+
+
+def new_row_errors(edited):
+    """Помилки рядків, доданих у редакторі (id порожній): [(рядок сторінки, помилка)]."""
+    edited = edited.reset_index(drop=True)
+    fresh = pd.to_numeric(edited.reindex(columns=['id'])['id'], errors='coerce').isna().to_numpy()
+    return [(row, message) for row, message in normalize(edited, first_row=1)[1] if fresh[row - 1]]
+
+
+def to_records(store):
+    """Список словників для збереження рейсу в базу (один раз на розрахунок)."""
+    return store.to_dict('records')
@@ -0,0 +1,151 @@
+"""Карти маршрутів рейсу: геометрія доріг, спрощення ліній та рендер у HTML.
+
+Геометрія маршруту отримується через Directions API паралельно для всіх авто;
+довгі маршрути діляться на відрізки в межах ліміту точок одного запиту.
+Розкодована лінія та координати зупинок зберігаються в базі (закодованими
+polyline-рядками), тож карту завершеного рейсу можна побудувати знову без
+жодного запиту до API. Лінії спрощуються алгоритмом Дугласа — Пекера з
+допуском, що відповідає масштабу карти, а маркери великих рейсів групуються
+в кластери.
+"""
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from matrix_engine import RateLimiter
+
+# Directions API: до 25 точок в одному запиті разом з початком і кінцем
+MAX_POINTS_PER_REQUEST = 25
+DIRECTIONS_WORKERS = 8
+MARKER_CLUSTER_MIN_STOPS = 50
+# Допуск спрощення в пікселях при масштабі на SIMPLIFY_ZOOM_MARGIN рівнів ближче за початковий
+SIMPLIFY_TOLERANCE_PX = 1.0
+SIMPLIFY_ZOOM_MARGIN = 2
+MAP_SIZE_PX = (1000, 500)
+ROUTE_COLORS = ['blue', 'purple', 'darkred', 'cadetblue', 'darkgreen', 'pink']
+
+
+def simplify(points, tolerance):
+    """Спрощує лінію [(lat, lon), ...] (Дуглас — Пекер) з допуском у градусах широти."""
+    pts = np.asarray(points, dtype=float)
+    if len(pts) < 3 or tolerance <= 0: return pts
+    # Довгота стискається до масштабу широти, щоб допуск був однаковим в обох напрямках
+    xy = pts * np.array([1.0, math.cos(math.radians(pts[:, 0].mean()))])
+    keep = np.zeros(len(pts), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(pts) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2: continue
+        segment, rel = xy[end] - xy[start], xy[start + 1:end] - xy[start]
+        length = math.hypot(*segment)
+        dist = (np.abs(segment[0] * rel[:, 1] - segment[1] * rel[:, 0]) / length if length
+                else np.hypot(rel[:, 0], rel[:, 1]))
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            mid = start + 1 + i
+            keep[mid] = True
+            stack.extend(((start, mid), (mid, end)))
+    return pts[keep]
+
+
+def fit_zoom(lats, lons, size_px=MAP_SIZE_PX):
+    """Рівень масштабу веб-карти, за якого всі точки вміщуються у вікно `size_px`."""
+    lat_span = max(float(np.ptp(lats)), 1e-6)
+    lon_span = max(float(np.ptp(lons)), 1e-6)
+    zoom = min(math.log2(size_px[0] * 360 / (256 * lon_span)), math.log2(size_px[1] * 180 / (256 * lat_span)))
+    return int(min(max(zoom, 3), 18))
+
+
+def tolerance_for_zoom(zoom):
+    """Допуск спрощення (у градусах) для рівня масштабу з урахуванням SIMPLIFY_ZOOM_MARGIN."""
+    return SIMPLIFY_TOLERANCE_PX * 360 / (256 * 2 ** (zoom + SIMPLIFY_ZOOM_MARGIN))
+
+
+def _segments(coords):
+    """Ділить маршрут на відрізки по MAX_POINTS_PER_REQUEST точок зі спільними кінцями."""
+    step = MAX_POINTS_PER_REQUEST - 1
+    return [coords[i:i + MAX_POINTS_PER_REQUEST] for i in range(0, max(len(coords) - 1, 1), step)]
+
+
+def count_requests(routes_coords):
+    """Кількість запитів до Directions API, яку зробить fetch_paths для цих маршрутів."""
+    return sum(len(_segments(coords)) for coords in routes_coords if len(coords) > 1)
+
+
+def _fetch_segment(client, limiter, segment):
+    import polyline
+    limiter.wait()
+    result = client.directions(origin=segment[0], destination=segment[-1], waypoints=segment[1:-1] or None,
+                               mode="driving")
+    return polyline.decode(result[0]['overview_polyline']['points'])
+
+
+def fetch_paths(client, routes_coords, max_workers=DIRECTIONS_WORKERS, requests_per_second=10):
+    """Дорожня геометрія для кожного маршруту (список координат зупинок) паралельними запитами.
+
+    Повертає (шляхи, помилки): шлях — список (lat, lon) або None, якщо запит не вдався;
+    помилки — {номер маршруту: текст}.
+    """
+    limiter = RateLimiter(requests_per_second)
+    jobs = [(r, segment) for r, coords in enumerate(routes_coords) if len(coords) > 1 for segment in _segments(coords)]
+    paths, errors = [[] if len(coords) > 1 else None for coords in routes_coords], {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [(r, pool.submit(_fetch_segment, client, limiter, segment)) for r, segment in jobs]
+        for r, future in futures:
+            try:
+                points = future.result()
+            except Exception as e:
+                errors[r] = str(e); continue
+            if r not in errors: paths[r].extend(points[1:] if paths[r] else points)
+    for r in errors: paths[r] = None
+    return paths, errors
+
+
+def encode(points):
+    import polyline
+    return polyline.encode([tuple(p) for p in points], 5)
+
+
+def decode(encoded):
+    import polyline
+    return polyline.decode(encoded) if encoded else []
+
+
+def render_map_html(routes, markers):
+    """HTML карти рейсу.
+
+    `routes` — [{'vehicle_name', 'color_index', 'path': [(lat, lon), ...]}];
+    `markers` — [{'lat', 'lon', 'name', 'popup', 'kind'}], kind: 'depot', 'Доставка' або 'Забір'.
+    """
+    import folium
+    from folium.plugins import MarkerCluster
+
+    lats = [m['lat'] for m in markers] + [p[0] for r in routes for p in r['path']]
+    lons = [m['lon'] for m in markers] + [p[1] for r in routes for p in r['path']]
+    zoom = fit_zoom(lats, lons)
+    route_map = folium.Map(location=(float(np.mean(lats)), float(np.mean(lons))), zoom_start=zoom,
+                           tiles="cartodbpositron", prefer_canvas=True)
+
+    stops = [m for m in markers if m['kind'] != 'depot']
+    marker_group = (MarkerCluster(name="Всі точки") if len(stops) >= MARKER_CLUSTER_MIN_STOPS
+                    else folium.FeatureGroup(name="Всі точки")).add_to(route_map)
+    for marker in markers:
+        color, icon = {'depot': ('red', 'home'), 'Доставка': ('green', 'arrow-down')}.get(marker['kind'],
+                                                                                           ('orange', 'arrow-up'))
+        # Депо не кластеризується, щоб завжди було видно
+        folium.Marker(location=(marker['lat'], marker['lon']), popup=marker['popup'], tooltip=marker['name'],
+                      icon=folium.Icon(color=color, icon=icon, prefix='fa')).add_to(
+            route_map if marker['kind'] == 'depot' else marker_group)
+
+    tolerance = tolerance_for_zoom(zoom)
+    for route in routes:
+        layer = folium.FeatureGroup(name=f"Маршрут: {route['vehicle_name']}", show=True).add_to(route_map)
+        path = simplify(route['path'], tolerance)
+        if len(path) > 1:
+            folium.PolyLine(locations=path.tolist(), color=ROUTE_COLORS[route['color_index'] % len(ROUTE_COLORS)],
+                            weight=5, opacity=0.8, popup=f"Маршрут {route['vehicle_name']}").add_to(layer)
+
+    folium.LayerControl().add_to(route_map)
+    return route_map.get_root().render()
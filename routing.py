@@ -0,0 +1,347 @@
+"""Постачальники маршрутизації: геокодування, матриці відстаней і часу та геометрія маршрутів.
+
+Кожен постачальник має три операції з однаковими сигнатурами:
+
+- `geocode(addresses)` -> ([(lat, lng)], stats), LookupError для адреси, яку не вдалося знайти;
+- `matrix(coords, use_traffic)` -> (distance, duration, stats), масиви int32 N×N (метри, секунди);
+- `directions(routes_coords)` -> (шляхи, помилки, stats), як у `route_maps.fetch_paths`.
+
+`GoogleProvider` працює через Google Maps API з кешами в базі. `HaversineProvider`
+рахує матриці локально й векторно (гаверсинус з коефіцієнтом об'їзду та середньою
+швидкістю), `RoadGraphProvider` — найшвидшими шляхами на локальному дорожньому
+графі з OSM (Дейкстра з `scipy.sparse.csgraph`). Локальні постачальники не геокодують
+самі: адреси беруться з кешу геокодування, а нові — через `geocoder` (зазвичай Google),
+якщо його передано. Коефіцієнти локального рушія калібруються за вже отриманими
+від Google парами (`calibrate`), тож чорнові розрахунки йдуть офлайн за мілісекунди,
+а Google потрібен лише для остаточного підтвердження плану.
+"""
+import heapq
+import math
+import time
+
+import numpy as np
+
+import database as db
+import matrix_engine
+import route_maps
+
+EARTH_RADIUS_M = 6371000
+DEFAULT_DETOUR_FACTOR = 1.3
+DEFAULT_SPEED_KMH = 35.0
+# Пари, ближчі за цю відстань, не беруться до калібрування: там домінують розвороти та під'їзди
+CALIBRATION_MIN_DISTANCE_M = 500
+CALIBRATION_SAMPLE_LIMIT = 20000
+# Швидкості за типом дороги OSM (highway=*), км/год
+OSM_SPEEDS_KMH = {'motorway': 90, 'trunk': 70, 'primary': 50, 'secondary': 45, 'tertiary': 40,
+                  'unclassified': 30, 'residential': 25, 'living_street': 10, 'service': 15}
+NEAREST_NODE_CHUNK = 256
+# Скільки елементів (джерел × вузлів графа) рахує один виклик csgraph.dijkstra: межа пам'яті на частину
+DIJKSTRA_CHUNK_ELEMENTS = 2 ** 22
+# csgraph не розрізняє ребро з нульовою вагою та відсутнє ребро
+MIN_EDGE_SECONDS = 1e-3
+
+
+def haversine_matrix(coords):
+    """Відстані по великому колу (метри) між усіма парами точок [(lat, lng)], N×N float64."""
+    points = np.radians(np.asarray(coords, dtype=float).reshape(-1, 2))
+    lat, lng = points[:, 0:1], points[:, 1:2]
+    h = np.sin((lat.T - lat) / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin((lng.T - lng) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+
+def _no_requests():
+    return {'cached_elements': 0, 'fetched_elements': 0, 'requests': 0}
+
+
+def _geocode_cached(addresses, geocoder):
+    """Координати з кешу геокодування; відсутні адреси геокодує `geocoder` (або LookupError без нього)."""
+    known = db.get_cached_geocodes(addresses)
+    hits = len(known)
+    missing = [a for a in dict.fromkeys(addresses) if db.normalize_address(a) not in known]
+    stats = {'cache_hits': hits, 'api_calls': 0}
+    if missing:
+        if geocoder is None:
+            raise LookupError(f"Адреси немає в кеші геокодування, а офлайн-рушій не геокодує нові: {missing[0]}")
+        coords, fetched_stats = geocoder.geocode(missing)
+        stats['api_calls'] = fetched_stats['api_calls']
+        known.update({db.normalize_address(a): c for a, c in zip(missing, coords)})
+    return [known[db.normalize_address(a)] for a in addresses], stats
+
+
+class GoogleProvider:
+    """Google Maps API: геокодування та матриці з кешем у базі, геометрія через Directions API.
+
+    З `location_matrix` (`location_matrix.LocationMatrix`) матриця без трафіку береться з
+    попередньо розрахованих файлів, а до API йдуть лише пари з новими адресами.
+    """
+    name = 'google'
+
+    def __init__(self, client, cache=None, location_matrix=None):
+        self.client, self.cache, self.location_matrix = client, cache, location_matrix
+
+    def geocode(self, addresses):
+        known = db.get_cached_geocodes(addresses)
+        stats = {'cache_hits': len(known), 'api_calls': 0}
+        fetched = []
+        for address in addresses:
+            key = db.normalize_address(address)
+            if key in known: continue
+            result = self.client.geocode(address)
+            stats['api_calls'] += 1
+            if not result: raise LookupError(f"Не вдалося знайти координати: {address}")
+            location = result[0]['geometry']['location']
+            known[key] = (location['lat'], location['lng'])
+            fetched.append((address, location['lat'], location['lng']))
+            time.sleep(0.05)
+        db.save_geocodes(fetched)
+        return [known[db.normalize_address(address)] for address in addresses], stats
+
+    def matrix(self, coords, use_traffic=False):
+        if self.location_matrix is not None and len(self.location_matrix) and not use_traffic:
+            return self.location_matrix.matrix(self.client, coords, cache=self.cache)
+        return matrix_engine.fetch_matrices(self.client, coords, use_traffic, cache=self.cache)
+
+    def directions(self, routes_coords):
+        paths, errors = route_maps.fetch_paths(self.client, routes_coords)
+        return paths, errors, {'requests': route_maps.count_requests(routes_coords)}
+
+
+class HaversineProvider:
+    """Локальний рушій: відстань = гаверсинус × коефіцієнт об'їзду, час = відстань / середня швидкість.
+
+    Трафік не враховується; шлях маршруту — відрізки між зупинками.
+    """
+    name = 'haversine'
+
+    def __init__(self, detour_factor=DEFAULT_DETOUR_FACTOR, speed_kmh=DEFAULT_SPEED_KMH, geocoder=None):
+        self.detour_factor, self.speed_kmh, self.geocoder = detour_factor, speed_kmh, geocoder
+
+    def geocode(self, addresses):
+        return _geocode_cached(addresses, self.geocoder)
+
+    def matrix(self, coords, use_traffic=False):
+        distance = haversine_matrix(coords) * self.detour_factor
+        duration = distance / (self.speed_kmh / 3.6)
+        return np.rint(distance).astype(np.int32), np.rint(duration).astype(np.int32), _no_requests()
+
+    def directions(self, routes_coords):
+        return [list(coords) if len(coords) > 1 else None for coords in routes_coords], {}, {'requests': 0}
+
+
+def calibrate(samples, min_distance_m=CALIBRATION_MIN_DISTANCE_M):
+    """Коефіцієнт об'їзду та середня швидкість за парами, отриманими від Google.
+
+    `samples` — [(origin_key, destination_key, distance_m, duration_s)] з ключами `matrix_engine.coord_key`
+    (як у `db.get_cached_distance_samples`). Повертає {'detour_factor', 'speed_kmh', 'pairs'} (медіани) або
+    None, якщо придатних пар немає.
+    """
+    rows = [(*map(float, o.split(',')), *map(float, d.split(',')), dist, dur) for o, d, dist, dur in samples]
+    if not rows: return None
+    values = np.asarray(rows, dtype=float)
+    lat1, lng1, lat2, lng2 = np.radians(values[:, :4]).T
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    straight = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+    road, seconds = values[:, 4], values[:, 5]
+    usable = (straight >= min_distance_m) & (road >= straight) & (seconds > 0)
+    if not usable.any(): return None
+    return {'detour_factor': round(float(np.median(road[usable] / straight[usable])), 3),
+            'speed_kmh': round(float(np.median(road[usable] / seconds[usable])) * 3.6, 1),
+            'pairs': int(usable.sum())}
+
+
+class RoadGraph:
+    """Орієнтований дорожній граф у формі CSR: вузли (lat, lng) та ребра з довжиною й часом проїзду."""
+
+    def __init__(self, lat, lng, indptr, indices, length_m, duration_s):
+        self.lat, self.lng = np.asarray(lat, dtype=float), np.asarray(lng, dtype=float)
+        self.indptr, self.indices = np.asarray(indptr, dtype=np.int64), np.asarray(indices, dtype=np.int64)
+        self.length_m, self.duration_s = np.asarray(length_m, dtype=float), np.asarray(duration_s, dtype=float)
+        self._csgraph = None
+
+    @classmethod
+    def load(cls, path):
+        """Граф, збережений `save` (.npz)."""
+        with np.load(path) as data:
+            return cls(*(data[key] for key in ('lat', 'lng', 'indptr', 'indices', 'length_m', 'duration_s')))
+
+    def save(self, path):
+        np.savez_compressed(path, lat=self.lat, lng=self.lng, indptr=self.indptr, indices=self.indices,
+                            length_m=self.length_m, duration_s=self.duration_s)
+
+    @classmethod
+    def from_osm(cls, path, speeds_kmh=OSM_SPEEDS_KMH):
+        """Будує граф з витягу OSM (.osm.pbf/.osm) для типів доріг зі `speeds_kmh`; потребує пакет osmium."""
+        try:
+            import osmium
+        except ImportError as e:
+            raise ImportError("Для читання витягів OSM потрібен пакет osmium (pip install osmium)") from e
+        nodes, edges = {}, []
+        for obj in osmium.FileProcessor(path, osmium.osm.NODE | osmium.osm.WAY):
+            if obj.is_node():
+                if obj.location.valid(): nodes[obj.id] = (obj.location.lat, obj.location.lon)
+                continue
+            speed = speeds_kmh.get(obj.tags.get('highway'))
+            if speed is None: continue
+            oneway = obj.tags.get('oneway') in ('yes', '1', 'true') or obj.tags.get('highway') == 'motorway'
+            refs = [n.ref for n in obj.nodes]
+            for a, b in zip(refs, refs[1:]):
+                edges.append((a, b, speed))
+                if not oneway: edges.append((b, a, speed))
+        edges = [e for e in edges if e[0] in nodes and e[1] in nodes]
+        ids = sorted({n for a, b, _ in edges for n in (a, b)})
+        index = {node_id: i for i, node_id in enumerate(ids)}
+        coords = np.array([nodes[node_id] for node_id in ids], dtype=float).reshape(-1, 2)
+        src = np.array([index[a] for a, _, _ in edges], dtype=np.int64)
+        dst = np.array([index[b] for _, b, _ in edges], dtype=np.int64)
+        speed = np.array([s for _, _, s in edges], dtype=float)
+        a, b = np.radians(coords[src]), np.radians(coords[dst])
+        h = np.sin((b[:, 0] - a[:, 0]) / 2) ** 2 + np.cos(a[:, 0]) * np.cos(b[:, 0]) * np.sin((b[:, 1] - a[:, 1]) / 2) ** 2
+        length = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+        order = np.argsort(src, kind='stable')
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(src, minlength=len(ids)))))
+        return cls(coords[:, 0], coords[:, 1], indptr, dst[order], length[order], (length / (speed / 3.6))[order])
+
+    def nearest(self, coords):
+        """Найближчий вузол графа до кожної точки (порівняння частинами, щоб не будувати N×V в пам'яті)."""
+        points = np.radians(np.asarray(coords, dtype=float).reshape(-1, 2))
+        node_lat, node_lng = np.radians(self.lat), np.radians(self.lng)
+        result = np.empty(len(points), dtype=np.int64)
+        for start in range(0, len(points), NEAREST_NODE_CHUNK):
+            chunk = points[start:start + NEAREST_NODE_CHUNK]
+            h = (np.sin((node_lat - chunk[:, 0:1]) / 2) ** 2
+                 + np.cos(chunk[:, 0:1]) * np.cos(node_lat) * np.sin((node_lng - chunk[:, 1:2]) / 2) ** 2)
+            result[start:start + len(chunk)] = np.argmin(h, axis=1)
+        return result
+
+    def csgraph(self):
+        """Розріджена матриця часу проїзду для `scipy.sparse.csgraph` і довжини її ребер (будується один раз).
+
+        Повертає (матриця V×V, ключі ребер `src * V + dst` за зростанням, довжини ребер у метрах).
+        """
+        if self._csgraph is None:
+            from scipy.sparse import csr_matrix
+            n = len(self.lat)
+            src = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.indptr))
+            # З паралельних ребер лишається найшвидше — саме його обере Дейкстра
+            order = np.lexsort((self.duration_s, self.indices, src))
+            keys = src[order] * n + self.indices[order]
+            first = np.concatenate(([True], keys[1:] != keys[:-1]))
+            keys, edges = keys[first], order[first]
+            weights = np.maximum(self.duration_s[edges], MIN_EDGE_SECONDS)
+            matrix = csr_matrix((weights, (src[edges], self.indices[edges])), shape=(n, n))
+            self._csgraph = (matrix, keys, self.length_m[edges])
+        return self._csgraph
+
+    def travel_matrix(self, sources, targets):
+        """Час і довжина найшвидших шляхів з кожного вузла `sources` до кожного з `targets`.
+
+        Дейкстра йде в C (`scipy.sparse.csgraph.dijkstra`) частинами джерел; довжину шляху
+        збирає векторний прохід від цілей до джерела за попередниками. Повертає масиви
+        (секунди, метри) S×T, inf — ціль недосяжна.
+        """
+        from scipy.sparse.csgraph import dijkstra
+        matrix, keys, lengths = self.csgraph()
+        n = matrix.shape[0]
+        sources, targets = np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64)
+        seconds = np.empty((len(sources), len(targets)))
+        meters = np.empty_like(seconds)
+        step = max(DIJKSTRA_CHUNK_ELEMENTS // max(n, 1), 1)
+        for start in range(0, len(sources), step):
+            chunk = sources[start:start + step]
+            dist, previous = dijkstra(matrix, indices=chunk, return_predecessors=True)
+            seconds[start:start + len(chunk)] = dist[:, targets]
+            rows = np.arange(len(chunk))[:, None]
+            node = np.broadcast_to(targets, (len(chunk), len(targets))).copy()
+            total = np.zeros(node.shape)
+            while True:
+                # Попередник джерела та недосяжних вузлів від'ємний (-9999)
+                parent = previous[rows, node]
+                active = parent >= 0
+                if not active.any(): break
+                total[active] += lengths[np.searchsorted(keys, parent[active] * n + node[active])]
+                node[active] = parent[active]
+            meters[start:start + len(chunk)] = np.where(np.isfinite(seconds[start:start + len(chunk)]), total, np.inf)
+        return seconds, meters
+
+    def shortest(self, source, targets):
+        """Дейкстра за часом проїзду від `source` до множини `targets` із зупинкою, щойно всі досягнуто.
+
+        Чистий Python — для окремих відрізків геометрії маршруту; матрицю рахує `travel_matrix`.
+        Повертає ({вузол: (секунди, метри)}, {вузол: попередній вузол}).
+        """
+        best, settled, previous = {source: (0.0, 0.0)}, {}, {}
+        remaining, heap = set(targets) - {source}, [(0.0, 0.0, source)]
+        settled_targets = {source: (0.0, 0.0)} if source in targets else {}
+        while heap and remaining:
+            seconds, meters, node = heapq.heappop(heap)
+            if node in settled: continue
+            settled[node] = True
+            if node in remaining:
+                remaining.discard(node); settled_targets[node] = (seconds, meters)
+            for edge in range(self.indptr[node], self.indptr[node + 1]):
+                nxt = int(self.indices[edge])
+                candidate = seconds + self.duration_s[edge]
+                if nxt not in settled and candidate < best.get(nxt, (math.inf,))[0]:
+                    best[nxt] = (candidate, meters + self.length_m[edge]); previous[nxt] = node
+                    heapq.heappush(heap, (candidate, meters + self.length_m[edge], nxt))
+        return settled_targets, previous
+
+
+class RoadGraphProvider:
+    """Локальний рушій на дорожньому графі: матриця — Дейкстра scipy з кожного вузла зупинок до решти."""
+    name = 'road_graph'
+
+    def __init__(self, graph, geocoder=None):
+        self.graph, self.geocoder = graph, geocoder
+
+    def geocode(self, addresses):
+        return _geocode_cached(addresses, self.geocoder)
+
+    def matrix(self, coords, use_traffic=False):
+        # Точки, що прив'язались до одного вузла, мають однакові рядки — шукаємо з кожного вузла один раз
+        nodes, inverse = np.unique(self.graph.nearest(coords), return_inverse=True)
+        seconds, meters = self.graph.travel_matrix(nodes, nodes)
+        seconds, meters = seconds[inverse][:, inverse], meters[inverse][:, inverse]
+        unreachable = ~np.isfinite(seconds)
+        seconds[unreachable] = meters[unreachable] = matrix_engine.UNREACHABLE
+        distance, duration = np.rint(meters).astype(np.int32), np.rint(seconds).astype(np.int32)
+        np.fill_diagonal(distance, 0); np.fill_diagonal(duration, 0)
+        return distance, duration, _no_requests()
+
+    def directions(self, routes_coords):
+        paths, errors = [], {}
+        for r, coords in enumerate(routes_coords):
+            if len(coords) < 2:
+                paths.append(None); continue
+            nodes = self.graph.nearest(coords).tolist()
+            path = [tuple(coords[0])]
+            for a, b in zip(nodes, nodes[1:]):
+                _, previous = self.graph.shortest(a, {b})
+                if a != b and b not in previous:
+                    errors[r] = "Зупинки не з'єднані дорожнім графом"; break
+                leg, node = [], b
+                while node != a:
+                    leg.append((float(self.graph.lat[node]), float(self.graph.lng[node]))); node = previous[node]
+                path.extend(reversed(leg))
+            paths.append(None if r in errors else path)
+        return paths, errors, {'requests': 0}
+
+
+def make_provider(engine, api_key=None, detour_factor=DEFAULT_DETOUR_FACTOR, speed_kmh=DEFAULT_SPEED_KMH,
+                  road_graph=None, location_matrix=None):
+    """Постачальник за назвою рушія ('google', 'haversine', 'road_graph').
+
+    З `api_key` локальні рушії геокодують нові адреси через Google; ValueError, якщо для рушія
+    бракує ключа чи графа.
+    """
+    google = None
+    if api_key:
+        import googlemaps
+        google = GoogleProvider(googlemaps.Client(key=api_key), location_matrix=location_matrix)
+    if engine == 'google':
+        if google is None: raise ValueError("Для рушія Google Maps потрібен API ключ")
+        return google
+    if engine == 'road_graph':
+        if road_graph is None: raise ValueError("Дорожній граф не завантажено")
+        return RoadGraphProvider(road_graph, geocoder=google)
+    return HaversineProvider(detour_factor, speed_kmh, geocoder=google)